@@ -0,0 +1,200 @@
+"""
+求解接口的准入控制与背压。
+
+突发流量下每个请求都启动自己的 CBC 子进程，本机 CPU 被超额占用，所有请求一起变慢。准入控制按接口限制同时求解的请求数：
+- 名额：ADMISSION_DIR 下每个接口 slots 个锁文件，持有其中一个文件的排他锁（flock）即占用一个求解名额，
+  本机所有 worker（包括各分片）共用；进程退出时锁自动释放，不会残留占用；
+- 等待队列：名额占满时请求需先占用一个排队名额（同样为锁文件），再轮询求解名额，最多等待 ADMISSION_WAIT_SECONDS
+  （带截止时间的请求不超过剩余时间）；排队名额也占满或等待超时时立即返回 429 与 Retry-After；
+- 规模预估：求解前按 订单 × 兼容月台 估计月台分配模型的 0-1 变量数，并统计涉及月台的忙碌窗口数，
+  超过阈值的请求按 ADMISSION_OVERSIZE 拒绝（413）或降级为不调用求解器的启发式；降级的请求不占用求解名额，
+  改为占用两个接口共用的 heuristic 名额池（同样有名额数与等待队列），大请求突发时启发式也不会无限并发。
+
+当前求解数与排队数由各 worker 在占用、释放名额时写入自己的指标文件（METRICS_DIR），汇总时只计入存活的进程，
+不试探锁文件。Retry-After 按本进程最近的求解耗时与本机排队人数估计。非 POSIX 平台退化为进程内的名额限制。
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from common import convert_str_to_timestamp, pd
+from metrics import aggregate_occupancy
+from problem_table import ProblemTable
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台只能限制进程内并发
+    fcntl = None
+
+ADMISSION_ENDPOINTS = ('external', 'externalStream', 'heuristic')  # heuristic 为降级请求的名额池
+
+
+class AdmissionRejected(Exception):
+    """排队名额已满（queue_full）或等待超时（wait_timeout）"""
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(reason)
+
+
+class SlotPool:
+    """跨进程的计数信号量：count 个锁文件，持有任一文件的排他锁即占用一个名额"""
+
+    def __init__(self, directory, name, count):
+        self.paths = [os.path.join(directory, f"{name}.{i}.lock") for i in range(count)]
+        self._local = threading.BoundedSemaphore(count) if fcntl is None else None
+        os.makedirs(directory, exist_ok=True)
+
+    def try_acquire(self):
+        """占用一个名额，返回释放函数；没有空闲名额时返回 None"""
+        if fcntl is None:
+            return self._local.release if self._local.acquire(blocking=False) else None
+        for path in self.paths:
+            f = open(path, 'a')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            return f.close  # 关闭文件即释放锁
+        return None
+
+
+class AdmissionController:
+    def __init__(self, directory, slots, queues, wait_seconds, metrics=None):
+        """
+        :param slots: {接口名: 同时求解数}
+        :param queues: {接口名: 等待队列长度}
+        :param metrics: WorkerMetrics，记录准入结果与等待时间
+        """
+        self.wait_seconds = wait_seconds
+        self.metrics = metrics
+        self.pools = {endpoint: (SlotPool(directory, endpoint, count),
+                                 SlotPool(directory, f"{endpoint}.queue", queues[endpoint]))
+                      for endpoint, count in slots.items()}
+        self._hold_seconds = {}  # 各接口求解名额的平均占用时长（指数滑动平均）
+        self._occupancy = {endpoint: {"running": 0, "queued": 0} for endpoint in self.pools}  # 本进程的占用数
+        self._lock = threading.Lock()
+
+    def _count(self, endpoint, key, delta):
+        """
+        更新本进程的求解数/排队数并写入 worker 指标文件。
+
+        占用情况不通过试探锁文件获得：试探会与其他请求的 try_acquire 争用同一把锁，使其误判名额已满。
+        """
+        with self._lock:
+            self._occupancy[endpoint][key] += delta
+            if self.metrics is not None:
+                self.metrics.set_occupancy({pool: dict(counts) for pool, counts in self._occupancy.items()})
+
+    def occupancy(self):
+        """各接口当前的求解数与排队数：有 metrics 时为本机所有存活 worker 之和，否则为本进程"""
+        if self.metrics is not None:
+            totals = aggregate_occupancy(self.metrics.directory)
+        else:
+            with self._lock:
+                totals = {pool: dict(counts) for pool, counts in self._occupancy.items()}
+        return {endpoint: totals.get(endpoint, {"running": 0, "queued": 0}) for endpoint in self.pools}
+
+    def retry_after(self, endpoint):
+        """建议的重试间隔（秒）：排队人数 + 1 个请求按平均占用时长分摊到全部名额"""
+        slots, _ = self.pools[endpoint]
+        hold = self._hold_seconds.get(endpoint, 1.0)
+        queued = self.occupancy()[endpoint]["queued"]
+        return max(1, min(60, math.ceil(hold * (queued + 1) / len(slots.paths))))
+
+    def _record(self, endpoint, outcome, waited=0.0):
+        if self.metrics is not None:
+            self.metrics.record_admission(endpoint, outcome, waited)
+
+    def acquire(self, endpoint, timeout=None):
+        """
+        占用一个求解名额，返回释放函数；排队名额已满或等待超时时抛出 AdmissionRejected。
+
+        :param timeout: 最长等待秒数，默认 wait_seconds，取两者中较小者
+        """
+        slots, queue = self.pools[endpoint]
+        wait_seconds = self.wait_seconds if timeout is None else max(0.0, min(timeout, self.wait_seconds))
+        started_at = time.perf_counter()
+        release = slots.try_acquire()
+        if release is None:
+            release_queue = queue.try_acquire()
+            if release_queue is None:
+                self._record(endpoint, "queue_full")
+                raise AdmissionRejected("queue_full", self.retry_after(endpoint))
+            self._count(endpoint, "queued", 1)
+            try:
+                delay = 0.005
+                while release is None:
+                    remaining = wait_seconds - (time.perf_counter() - started_at)
+                    if remaining <= 0:
+                        self._record(endpoint, "wait_timeout", time.perf_counter() - started_at)
+                        raise AdmissionRejected("wait_timeout", self.retry_after(endpoint))
+                    time.sleep(min(delay, remaining))
+                    delay = min(delay * 2, 0.1)
+                    release = slots.try_acquire()
+            finally:
+                release_queue()
+                self._count(endpoint, "queued", -1)
+        acquired_at = time.perf_counter()
+        self._count(endpoint, "running", 1)
+        self._record(endpoint, "admitted", acquired_at - started_at)
+
+        def release_slot():
+            release()
+            self._count(endpoint, "running", -1)
+            hold = time.perf_counter() - acquired_at
+            with self._lock:
+                previous = self._hold_seconds.get(endpoint)
+                self._hold_seconds[endpoint] = hold if previous is None else 0.8 * previous + 0.2 * hold
+
+        return release_slot
+
+    @contextmanager
+    def slot(self, endpoint, timeout=None):
+        release = self.acquire(endpoint, timeout)
+        try:
+            yield
+        finally:
+            release()
+
+    def state(self):
+        """各接口的名额数、当前求解数与排队数"""
+        occupancy = self.occupancy()
+        return {endpoint: {"slots": len(slots.paths), "running": occupancy[endpoint]["running"],
+                           "queue_limit": len(queue.paths), "queued": occupancy[endpoint]["queued"]}
+                for endpoint, (slots, queue) in self.pools.items()}
+
+
+def count_busy_windows(filename, dock_keys):
+    """调度文件中涉及月台（{(仓库ID, 月台ID)}，字符串）尚未结束的时段数"""
+    try:
+        schedule = pd.read_csv(filename, encoding='utf-8', usecols=["Warehouse ID", "Dock ID", "End Time"],
+                               dtype={'Warehouse ID': str, 'Dock ID': str})
+    except FileNotFoundError:
+        return 0
+    if schedule.empty:
+        return 0
+    now = datetime.now().timestamp()
+    ends = schedule['End Time'].apply(convert_str_to_timestamp)
+    keys = pd.Series(list(zip(schedule['Warehouse ID'], schedule['Dock ID'])), index=schedule.index)
+    return int(((ends > now) & keys.isin(dock_keys)).sum())
+
+
+def model_size(phases, busy_windows):
+    """
+    求解前的规模预估。
+
+    :param phases: [(阶段名, 订单列表, 仓库列表), ...]
+    :return: {"binaries": 各阶段 订单 × 兼容月台 之和（月台分配模型的 0-1 变量数）, "busy_windows": ...}
+    """
+    binaries = 0
+    for _, phase_orders, phase_warehouses in phases:
+        if not phase_orders:
+            continue
+        binaries += ProblemTable(phase_orders, phase_warehouses).assignment_binaries()
+    return {"binaries": binaries, "busy_windows": busy_windows}
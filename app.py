@@ -1,11 +1,31 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from lp import *
 from utils import *
-from pulp import PULP_CBC_CMD, LpStatus
 from internal_utils import *
+from fleet_pool import FleetPool
+from response_cache import create_response_cache, involved_dock_keys, problem_signature
+import config
+from warmup import start_warm_up, mark_ready, is_ready, warm_up_state
+from metrics import WorkerMetrics, aggregate_metrics
+from profiling import profiled
+from solve_recorder import solve_model
+from precedence import iter_queue_schedule, schedule_makespan
+from common import ScheduleConflictError, ScheduleUnitOfWork
+from sites import InvalidSiteError, parse_mapping, request_site_id, site_schedule_file
+from presolve import InfeasibleOrdersError, SolveFailedError, check_presolve, missing_assignments, order_error, \
+    screen_orders
+from solve_budget import SolveBudget, SolveTimeModel, phase_features
+from heuristics import greedy_queue_schedule, heuristic_dock_assignment
+from portfolio import lp_heuristic
+from gantt import FORMATS, SCHEDULE_FILES, create_gantt_cache, parse_gantt_params
+from feedback import apply_feedback
+from admission import ADMISSION_ENDPOINTS, AdmissionController, AdmissionRejected, count_busy_windows, model_size
+from topology import InvalidTopologyError, TopologyNotFoundError, TopologyRegistry, external_phase_warehouses
+import time
+from decoding import PayloadValidationError, parse_payload, dumps, decode_external_request, \
+    decode_drop_pull_request, decode_external_stream, decode_topology_upload, decode_feedback_request, build_vehicle
 import logging
 from logging.handlers import RotatingFileHandler
-import json
 import sys
 
 sys.setrecursionlimit(sys.getrecursionlimit() * 5)
@@ -24,167 +44,455 @@ logger.setLevel(logging.INFO)
 
 app = Flask(__name__)
 version_info = '【version: v2.7】'
+response_cache = create_response_cache(config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL)
+worker_metrics = WorkerMetrics(config.METRICS_DIR, config.METRICS_FLUSH_SECONDS)
+gantt_cache = create_gantt_cache(config.GANTT_CACHE_SIZE)
+solve_time_model = SolveTimeModel(config.SOLVE_HISTORY_FILE, config.SOLVE_HISTORY_MIN_SAMPLES,
+                                  config.SOLVE_HISTORY_WINDOW)
+topology_registry = TopologyRegistry(config.TOPOLOGY_DIR, config.TOPOLOGY_CACHE_SIZE)
+admission = AdmissionController(
+    config.ADMISSION_DIR,
+    {endpoint: parse_mapping(config.ADMISSION_SLOTS).get(endpoint, config.ADMISSION_DEFAULT_SLOTS)
+     for endpoint in ADMISSION_ENDPOINTS},
+    {endpoint: parse_mapping(config.ADMISSION_QUEUE).get(endpoint, config.ADMISSION_DEFAULT_QUEUE)
+     for endpoint in ADMISSION_ENDPOINTS},
+    config.ADMISSION_WAIT_SECONDS, worker_metrics) if config.ADMISSION else None
+
+if config.WARMUP:
+    start_warm_up()
+else:
+    mark_ready()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start_time = g.get('request_start_time')
+    if start_time is not None and request.endpoint not in (None, 'metrics', 'ready'):
+        worker_metrics.record(request.endpoint, response.status_code, time.perf_counter() - start_time)
+    return response
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """就绪检查：启动预热完成后返回 200，否则返回 503"""
+    if is_ready():
+        return jsonify({"ready": True, "warm_up": warm_up_state})
+    return jsonify({"ready": False, "warm_up": warm_up_state}), 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """汇总所有 worker 进程的请求指标，admission_state 为本机各求解接口当前的求解数与排队数"""
+    worker_metrics.flush()  # 本进程尚未写入的指标先写入，其他 worker 的指标最多滞后 METRICS_FLUSH_SECONDS 秒
+    body = aggregate_metrics(config.METRICS_DIR)
+    if admission is not None:
+        body["admission_state"] = admission.state()
+    return jsonify(body)
+
+
+def request_site():
+    """
+    当前请求所属站点（请求头 X-Site-ID 或查询参数 site_id），未指定时为 None，使用默认调度文件。
+    """
+    try:
+        return request_site_id(request.headers, request.args)
+    except InvalidSiteError as e:
+        raise PayloadValidationError([{"path": "site_id", "message": str(e)}])
+
+
+def read_payload(request_type, site_id=None):
+    """
+    解析请求体并记录入参日志。
+
+    :param request_type: 日志中的请求类型（external/internal/dropPull/topology/feedback）
+    :param site_id: 请求所属站点，指定时记录在日志中，便于按站点回放
+    :return: 解析后的请求数据
+    """
+    raw = request.get_data(cache=False)
+    site = f"site: {site_id} " if site_id is not None else ""
+    try:
+        data = parse_payload(raw)
+    except PayloadValidationError:
+        logger.info(f"version: {version_info} {site}Received [{request_type}] request with data: "
+                    f"{raw.decode('utf-8', errors='replace')}")
+        raise
+    logger.info(f"version: {version_info} {site}Received [{request_type}] request with data: {dumps(data)}")  # 记录入参
+    return data
+
+
+def validation_error_response(e):
+    """请求校验失败时的结构化错误响应"""
+    logger.error(f"请求参数校验失败: {e}")
+    error_response = jsonify({"code": 1, "message": "请求参数校验失败。", "errors": e.errors}), 400
+    logger.info(f"错误响应: {error_response[0].get_data(as_text=True)}, 状态码: {error_response[1]}")
+    return error_response
+
+
+def split_external_phases(warehouses, orders):
+    """
+    划分装卸车任务类型：装车订单使用类型 2、3 的月台（效率取出库效率），卸车订单使用类型 1、3 的月台（效率取入库效率）。
+    引用已登记布局的请求直接使用编译好的各阶段仓库列表。
+
+    :return: [(阶段名, 订单列表, 仓库列表), ...]，装车阶段在前
+    """
+    # 根据订单类型分别创建装车和卸车订单的列表
+    loading_orders = [order for order in orders if order.order_type == 1]
+    unloading_orders = [order for order in orders if order.order_type == 2]
+    phase_warehouses = getattr(warehouses, 'phases', None) or external_phase_warehouses(warehouses)
+    return [("loading", loading_orders, phase_warehouses["loading"]),
+            ("unloading", unloading_orders, phase_warehouses["unloading"])]
+
+
+def admit_external_request(endpoint, warehouses, orders, filename):
+    """
+    求解前的规模预估：超过阈值时按 ADMISSION_OVERSIZE 降级为启发式或拒绝。
+
+    :return: (固定的求解方式, 拒绝时的错误响应)，未超限时均为 None，降级时求解方式为 heuristic
+    """
+    if admission is None:
+        return None, None
+    size = model_size(split_external_phases(warehouses, orders),
+                      count_busy_windows(filename, involved_dock_keys(warehouses)))
+    if size["binaries"] <= config.ADMISSION_MAX_BINARIES and size["busy_windows"] <= config.ADMISSION_MAX_BUSY_WINDOWS:
+        return None, None
+    if config.ADMISSION_OVERSIZE == 'reject':
+        worker_metrics.record_admission(endpoint, "oversize_rejected")
+        logger.warning(f"请求规模超过上限，拒绝: {size}")
+        return None, (jsonify({"code": 1, "message": "请求规模超过上限。", "errors": [dict(
+            size, code="model_too_large", message=f"0-1 变量数上限 {config.ADMISSION_MAX_BINARIES}，"
+                                                 f"忙碌窗口数上限 {config.ADMISSION_MAX_BUSY_WINDOWS}")]}), 413)
+    worker_metrics.record_admission(endpoint, "oversize_downgraded")
+    logger.warning(f"请求规模超过上限，改用启发式: {size}")
+    return 'heuristic', None
+
+
+def admission_pool(endpoint, mode):
+    """请求占用的名额池：降级为启发式的请求不调用求解器，占用两个接口共用的 heuristic 名额，不与求解请求争抢"""
+    return 'heuristic' if mode == 'heuristic' else endpoint
+
+
+def admission_rejected_body(e):
+    return {"code": 1, "message": "求解繁忙，请稍后重试。", "reason": e.reason, "retry_after": e.retry_after}
+
+
+def screen_external_phases(warehouses, orders):
+    """
+    划分装卸车阶段并做求解前的可行性筛查，不可行的订单不参与规划（PRESOLVE_MODE=reject 时抛出 InfeasibleOrdersError）。
+
+    :return: (阶段列表, 被剔除订单的错误列表)
+    """
+    warehouse_ids = {warehouse.id for warehouse in warehouses}
+    phases, excluded = [], []
+    for phase, phase_orders, phase_warehouses in split_external_phases(warehouses, orders):
+        feasible_orders, errors = screen_orders(phase_orders, phase_warehouses, warehouse_ids, phase)
+        phases.append((phase, feasible_orders, phase_warehouses))
+        excluded.extend(errors)
+    if excluded:
+        logger.warning(f"可行性筛查未通过的订单: {dumps(excluded)}")
+    check_presolve(excluded)
+    return phases, excluded
+
+
+def plan_external_phase(phase, phase_orders, phase_warehouses, uow, budget):
+    """
+    单一阶段（装车或卸车）的两阶段规划：先月台分配，再排队时间规划。
+
+    排队规划按分量逐块求解，每块结果加入 uow 后产出，后续阶段通过 uow 读取时可看到前面阶段尚未提交的占用。
+    求解方式（精确、限时、启发式）由 budget 按预测耗时与剩余时间决定，限时求解未得到可行解的部分改用启发式。
+    :param uow: 本次请求的 ScheduleUnitOfWork
+    :param budget: 本次请求的 SolveBudget
+    :return: 生成器，每项为一块结果的时间表 DataFrame
+    """
+    # 生成按序路径
+    order_routes = generate_specific_order_route(phase_orders)
+
+    # 读取已有时间表，查找每个月台已占用的忙碌时间窗口
+    loaded_schedule = uow.load(phase_orders, "queue")
+    existing_busy_time, busy_slots = calculate_busy_times_and_windows(loaded_schedule, phase_warehouses)
+
+    # 先按实例特征选定求解方式，启发式不构建月台分配模型
+    table = ProblemTable(phase_orders, phase_warehouses)
+    features = phase_features(table, busy_slots)
+    plan = budget.plan(phase, features)
+    started_at, paused = time.perf_counter(), 0.0
+    lp_status = pulp.LpStatusNotSolved
+    if plan.mode != 'heuristic':
+        # 一阶段线性规划：月台分配（构建耗时计入本阶段时限，时限用完时不再求解）
+        model = create_lp_model(phase_orders, phase_warehouses, existing_busy_time, table)
+        if not plan.exhausted():
+            lp_status = solve_model(model, f"{phase}_lp", busy_time=existing_busy_time, solver=plan.solver(),
+                                    heuristic=lp_heuristic(phase_orders, phase_warehouses, existing_busy_time))
+            print("-" * 8, f"{phase}_model", "-" * 8)
+            print("Status:", pulp.LpStatus[model.status])
+            print("Objective =", pulp.value(model.objective))
+            print("=" * 10)
+    if plan.mode == 'heuristic' or (plan.mode == 'limited' and lp_status == pulp.LpStatusNotSolved):
+        # 时限内未得到可行解时与启发式相同
+        order_dock_assignments, latest_completion_time = heuristic_dock_assignment(phase_orders, phase_warehouses,
+                                                                                   existing_busy_time, table)
+        lp_status = pulp.LpStatusOptimal
+    else:
+        order_dock_assignments, latest_completion_time = parse_optimization_result(model, phase_orders,
+                                                                                   phase_warehouses)
+    # 筛查通过的订单应全部得到月台分配，否则（如求解超时）不再继续排队规划
+    missing = missing_assignments(phase_orders, phase_warehouses, order_dock_assignments)
+    if lp_status != pulp.LpStatusOptimal or missing:
+        logger.error(f"{phase} 月台分配求解失败: {pulp.LpStatus[lp_status]}, {dumps(missing)}")
+        raise SolveFailedError(missing or [order_error(order.id, "lp_not_solved",
+                                                       f"月台分配求解状态: {pulp.LpStatus[lp_status]}")
+                                           for order in phase_orders])
+    print("Order Dock Assignments:", order_dock_assignments)
+    print("Latest Completion Time:", latest_completion_time)
+
+    # 二阶段排队规划：无需 0-1 变量的部分按最长路直接排班，其余部分交给求解器
+    if plan.mode == 'heuristic':
+        chunks = [greedy_queue_schedule(phase_orders, phase_warehouses, order_dock_assignments, order_routes,
+                                        busy_slots)]
+    else:
+        chunks = iter_queue_schedule(phase_orders, phase_warehouses, order_dock_assignments, order_routes, busy_slots,
+                                     f"{phase}_queue", plan.solver, plan.exhausted)
+    for start_times, end_times, status in chunks:
+        if plan.mode == 'limited' and status == pulp.LpStatus[pulp.LpStatusNotSolved]:
+            # 该块时限内未得到可行解或时限已用完，改用启发式排班（各块涉及的月台互不相交）
+            chunk_order_ids = {op[0] for op in start_times}
+            start_times, end_times, status = greedy_queue_schedule(
+                [order for order in phase_orders if order.id in chunk_order_ids], phase_warehouses,
+                order_dock_assignments,
+                {order_id: route for order_id, route in order_routes.items() if order_id in chunk_order_ids},
+                busy_slots)
+        print("-" * 8, f"{phase}_queue_model", "-" * 8, )
+        print("Status:", status)
+        print("Objective =", schedule_makespan(end_times))
+        print("=" * 10)
+        if status != pulp.LpStatus[pulp.LpStatusOptimal]:
+            # 月台队列优先级与按序路线互相矛盾时排队模型无可行解
+            order_ids = sorted({op[0] for op in start_times}, key=str)
+            logger.error(f"{phase} 排队规划求解失败: {status}, 订单: {order_ids}")
+            raise InfeasibleOrdersError([order_error(order_id, "queue_infeasible", f"排队规划求解状态: {status}")
+                                         for order_id in order_ids])
+        # plot_order_times_on_docks(start_times, end_times, phase_warehouses, busy_slots)
+
+        # 数据持久化（请求完成后统一提交）
+        schedule = generate_schedule(start_times, end_times, "queue")
+        uow.add(schedule)
+        paused_at = time.perf_counter()
+        yield schedule
+        paused += time.perf_counter() - paused_at
+    budget.finish(phase, plan, features, time.perf_counter() - started_at - paused, "Optimal")
+
+
+def schedule_conflict_body(e):
+    return {"code": 1, "message": "调度文件已被其他请求修改，请重试。", "errors": [
+        {"code": "schedule_conflict", "docks": [{"warehouse_id": w, "dock_id": d} for w, d in e.dock_keys],
+         "message": "规划期间其他请求占用了相同月台"}]}
+
+
+def solve_external_orders(warehouses, orders, filename, budget=None):
+    """
+    外部订单两阶段规划：先月台分配，再排队时间规划，装车和卸车订单分别处理，全部成功后结果一次性写入调度文件。
+
+    :param budget: 本次请求的 SolveBudget，默认不限时
+    :return: (响应体字典, HTTP 状态码)
+    """
+    if budget is None:
+        budget = SolveBudget(None, solve_time_model)
+    try:
+        phases, excluded = screen_external_phases(warehouses, orders)
+        for attempt in range(config.SCHEDULE_COMMIT_RETRIES + 1):
+            budget.allocate(phases)
+            try:
+                with ScheduleUnitOfWork(filename) as uow:
+                    schedules = []
+                    for phase, phase_orders, phase_warehouses in phases:
+                        schedules.extend(plan_external_phase(phase, phase_orders, phase_warehouses, uow, budget))
+
+                    # 提取全部订单结果，解析成出参格式
+                    try:
+                        schedule = pd.concat(schedules, ignore_index=True)
+                        parsed_result = parse_schedule(schedule)
+                    except Exception as e:
+                        uow.rollback()
+                        logger.error(f"处理过程中发生错误: {e}")  # 错误日志
+                        return {"code": 1, "message": "处理过程中发生错误。"}, 500
+                break
+            except ScheduleConflictError as e:
+                # 其他请求在规划期间占用了相同月台，基于新的调度文件重新规划
+                logger.warning(f"{e}（第 {attempt + 1} 次）")
+                if attempt == config.SCHEDULE_COMMIT_RETRIES:
+                    return schedule_conflict_body(e), 409
+    except InfeasibleOrdersError as e:
+        logger.error(f"{e.message} {e}")
+        return {"code": 1, "message": e.message, "errors": e.errors}, 500 if isinstance(e, SolveFailedError) else 400
+
+    body = {"code": 0, "message": "处理成功。", "data": parsed_result}
+    if excluded:
+        body["excluded_orders"] = excluded  # 未通过可行性筛查、未参与规划的订单
+    if budget.reports_modes():
+        body["solve_modes"] = budget.modes  # 带截止时间的请求返回各阶段实际采用的求解方式
+    return body, 200
 
 
 # 外部订单排队叫号算法
 @app.route('/external_orders_queueing', methods=['POST'])
+@profiled
 def external_orders_queueing():
     """
     :return: JSON object containing the processed result of the method
     """
     print(version_info, flush=True)
-    data = request.json  # 获取 JSON 格式的数据
-    logger.info(f"version: {version_info} Received [external] request with data: {json.dumps(data)}")  # 记录入参
-    # 解析仓库数据
-    warehouses = [Warehouse(w['warehouse_id'], [Dock(**d) for d in w['docks']]) for w in data['warehouses']]
-
-    # 解析订单数据
-    orders = [Order(**o) for o in data['orders']]
-    # for order in orders:
-    #     if order.required_carriage is None:
-    #         # 创建一个包含错误信息的JSON响应
-    #         error_response = jsonify({
-    #             "code": 1,
-    #             "message": "订单 {} 缺少需求车型 'required_carriage'".format(order.id)
-    #         })
-    #         # 返回JSON响应和400错误状态码
-    #         return error_response, 400
-
-    # SECTION 1 划分装卸车任务类型
-    # 根据订单类型分别创建装车和卸车订单的列表
-    loading_orders = [order for order in orders if order.order_type == 1]
-    unloading_orders = [order for order in orders if order.order_type == 2]
-    # 创建两个新的仓库列表，分别用于装车和卸车任务
-    loading_warehouses = []
-    unloading_warehouses = []
-
-    # 遍历所有的仓库
-    for warehouse in warehouses:
-        # 为装车任务筛选月台
-        loading_docks = [dock for dock in warehouse.docks if dock.dock_type in [2, 3]]
-        # 设置效率并添加到装车仓库列表
-        for dock in loading_docks:
-            dock.set_efficiency(2)
-        if loading_docks:
-            loading_warehouses.append(Warehouse(warehouse.id, loading_docks))
-
-        # 为卸车任务筛选月台
-        unloading_docks = [dock for dock in warehouse.docks if dock.dock_type in [1, 3]]
-        # 设置效率并添加到卸车仓库列表
-        for dock in unloading_docks:
-            dock.set_efficiency(1)
-        if unloading_docks:
-            unloading_warehouses.append(Warehouse(warehouse.id, unloading_docks))
-
-    # SECTION 2 生成按序路径
-    loading_order_routes = generate_specific_order_route(loading_orders)
-    unloading_order_routes = generate_specific_order_route(unloading_orders)
-
-    # SECTION 3 对装车订单进行一阶段线性规划
-    # 读取已有时间表
-    filename = "local_schedule.csv"
-    loaded_schedule = load_and_prepare_schedule(filename, loading_orders, "queue")
-    existing_busy_time, busy_slots = calculate_busy_times_and_windows(loaded_schedule, loading_warehouses)
-
-    loading_model = create_lp_model(loading_orders, loading_warehouses, existing_busy_time)
-    loading_model.solve(solver=PULP_CBC_CMD(msg=False))
-    print("-" * 8, "loading_model", "-" * 8)
-    print("Status:", LpStatus[loading_model.status])
-    print("Objective =", value(loading_model.objective))
-    print("=" * 10)
-
-    # TODO when problem is infeasible，raise error/logs
-    loading_order_dock_assignments, loading_latest_completion_time = parse_optimization_result(loading_model, orders,
-                                                                                               warehouses)
-    print("Order Dock Assignments:", loading_order_dock_assignments)
-    print("Latest Completion Time:", loading_latest_completion_time)
-    # SECTION 3.5 对装车订单二阶段排队规划
-    loading_queue_model = create_queue_model(loading_orders, loading_warehouses, loading_order_dock_assignments,
-                                             loading_order_routes, busy_slots)
-    loading_queue_model.solve(solver=PULP_CBC_CMD(msg=False))
-    print("-" * 8, "loading_queue_model", "-" * 8, )
-    print("Status:", LpStatus[loading_queue_model.status])
-    print("Objective =", value(loading_queue_model.objective))
-    print("=" * 10)
-    # TODO when problem is infeasible，raise error/logs
-    loading_start_times, loading_end_times = parse_queue_results(loading_queue_model, loading_orders,
-                                                                 loading_warehouses)
-
-    # SECTION 3.8 数据持久化
-    # plot_order_times_on_docks(loading_start_times, loading_end_times, loading_warehouses, busy_slots)
-
-    loading_schedule = generate_schedule(loading_start_times, loading_end_times, "queue")
-    # 保存时间表到文件
-    save_schedule_to_file(loading_schedule, filename)
-    # SECTION 4 卸车订单的处理, 同上
-    # 查找每个月台已占用的忙碌时间窗口
-    loaded_schedule = load_and_prepare_schedule(filename, unloading_orders, "queue")
-    existing_busy_time, busy_slots = calculate_busy_times_and_windows(loaded_schedule, warehouses)
-
-    unloading_model = create_lp_model(unloading_orders, unloading_warehouses, existing_busy_time)
-    unloading_model.solve(solver=PULP_CBC_CMD(msg=False))
-    print("-" * 8, "unloading_model", "-" * 8, )
-    print("Status:", LpStatus[unloading_model.status])
-    print("Objective =", value(unloading_model.objective))
-    print("=" * 10)
-    # TODO when problem is infeasible，raise error/logs
-    # var_dicts = unloading_model.variablesDict()
-    unloading_order_dock_assignments, unloading_latest_completion_time = parse_optimization_result(unloading_model,
-                                                                                                   unloading_orders,
-                                                                                                   unloading_warehouses)
-
-    unloading_queue_model = create_queue_model(unloading_orders, unloading_warehouses, unloading_order_dock_assignments,
-                                               unloading_order_routes, busy_slots)
-    unloading_queue_model.solve(solver=PULP_CBC_CMD(msg=False))
-    print("-" * 8, "unloading_queue_model", "-" * 8, )
-    print("Status:", LpStatus[unloading_queue_model.status])
-    print("Objective =", value(unloading_queue_model.objective))
-    print("=" * 10)
-    # TODO when problem is infeasible，raise error/logs
-    unloading_start_times, unloading_end_times = parse_queue_results(unloading_queue_model, unloading_orders,
-                                                                     unloading_warehouses)
-    # plot_order_times_on_docks(unloading_start_times, unloading_end_times, busy_slots)
-
-    unloading_schedule = generate_schedule(unloading_start_times, unloading_end_times, "queue")
-    save_schedule_to_file(unloading_schedule, filename)
-
-    # SECTION 5 提取全部订单结果，解析成出参格式
+    # 解析并校验仓库、订单数据
     try:
-        schedule = pd.concat([loading_schedule, unloading_schedule], ignore_index=True)
-        parsed_result = parse_schedule(schedule)
-
-        response = jsonify({
-            "code": 0,
-            "message": "处理成功。",
-            "data": parsed_result
-        })
-        logger.info(f"处理成功，响应数据: {response.get_data(as_text=True)}")  # 处理成功的日志
-        return response
+        site_id = request_site()
+        data = read_payload("external", site_id)
+        warehouses, orders = decode_external_request(data, topology_registry.resolver(site_id))
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+
+    # 相同问题（请求体 + 涉及月台的已有占用）的重复请求直接返回缓存结果，并发的相同请求只计算一次
+    # 引用布局最新版本的请求按实际使用的版本计算签名，布局更新后不会命中旧结果
+    if 'topology' in data:
+        data = dict(data, topology=warehouses.reference)
+    filename = site_schedule_file(site_id, "local_schedule.csv")
+    dock_keys = involved_dock_keys(warehouses)
+    signature = problem_signature(data, filename, dock_keys, orders)
+
+    mode, oversize_response = admit_external_request("external", warehouses, orders, filename)
+    if oversize_response is not None:
+        return oversize_response
+    budget = SolveBudget(data.get('deadline_ms'), solve_time_model, g.request_start_time, mode)
+
+    def compute():
+        if admission is None:
+            result = solve_external_orders(warehouses, orders, filename, budget)
+        else:
+            try:
+                with admission.slot(admission_pool("external", mode), budget.remaining()):
+                    result = solve_external_orders(warehouses, orders, filename, budget)
+            except AdmissionRejected as e:
+                return (admission_rejected_body(e), 429), False
+        return result, result[1] == 200
+
+    (body, status), cached = response_cache.get_or_compute(signature, compute, filename, dock_keys)
+    response = jsonify(body)
+    if status == 429:
+        response.headers['Retry-After'] = str(body["retry_after"])
+    if status == 200:
+        logger.info(f"处理成功{'（缓存）' if cached else ''}，响应数据: {response.get_data(as_text=True)}")  # 处理成功的日志
+    else:
+        logger.info(f"错误响应: {response.get_data(as_text=True)}, 状态码: {status}")  # 错误响应的日志
+    return response, status
+
+
+def ndjson_line(record):
+    return dumps(record) + '\n'
+
+
+def stream_external_orders(warehouses, orders, filename, budget):
+    """
+    按求解完成的分量逐块产出外部订单规划结果（NDJSON 行）。
 
+    未通过可行性筛查的订单首先以 excluded 行产出；每块先产出涉及订单的仓库路线与月台分配，再产出涉及月台的排队信息；
+    全部完成并写入调度文件后产出 done，出错（或客户端断开）时调度文件保持不变，产出 error。
+    """
+    try:
+        phases, excluded = screen_external_phases(warehouses, orders)
+        budget.allocate(phases)
+        for error in excluded:
+            yield ndjson_line(dict(error, type="excluded"))
+        with ScheduleUnitOfWork(filename) as uow:
+            for phase, phase_orders, phase_warehouses in phases:
+                for schedule in plan_external_phase(phase, phase_orders, phase_warehouses, uow, budget):
+                    if schedule.empty:
+                        continue
+                    result = parse_schedule(schedule)
+                    for order_id, dock_assignments in result["order_dock_assignments"].items():
+                        yield ndjson_line({"type": "order", "order_id": order_id,
+                                           "order_sequence": result["order_sequences"][order_id],
+                                           "order_dock_assignments": dock_assignments})
+                    for dock_queue in result["docks_queues"]:
+                        yield ndjson_line(dict(dock_queue, type="docks_queue"))
+        logger.info(f"流式处理成功，订单数: {len(orders)}")
+        done = {"type": "done", "code": 0, "message": "处理成功。"}
+        if budget.reports_modes():
+            done["solve_modes"] = budget.modes
+        yield ndjson_line(done)
+    except ScheduleConflictError as e:
+        # 已产出的结果基于旧的调度文件，无法在流中替换，由客户端重新提交
+        logger.error(str(e))
+        yield ndjson_line(dict(schedule_conflict_body(e), type="error"))
+    except InfeasibleOrdersError as e:
+        logger.error(f"{e.message} {e}")
+        yield ndjson_line({"type": "error", "code": 1, "message": e.message, "errors": e.errors})
     except Exception as e:
         logger.error(f"处理过程中发生错误: {e}")  # 错误日志
-        response = jsonify({
-            "code": 1,
-            "message": "处理过程中发生错误。"
-        }), 500
-        logger.info(f"错误响应: {response[0].get_data(as_text=True)}, 状态码: {response[1]}")  # 错误响应的日志
-        return response
+        yield ndjson_line({"type": "error", "code": 1, "message": "处理过程中发生错误。"})
+
+
+# 外部订单排队叫号算法（NDJSON 流式版本，用于大批量重排）
+@app.route('/external_orders_queueing/stream', methods=['POST'])
+def external_orders_queueing_stream():
+    """
+    请求体为 NDJSON：第一行 {"warehouses": [...]}，之后每行一个订单。
+    响应为 NDJSON，按求解完成的顺序逐行返回 order / docks_queue 记录，最后一行为 done 或 error。
+
+    :return: application/x-ndjson 流式响应
+    """
+    print(version_info, flush=True)
+    # 逐行解析并校验，不在内存中保留整个请求体
+    try:
+        site_id = request_site()
+        warehouses, orders, deadline_ms = decode_external_stream(request.stream,
+                                                                 resolve_topology=topology_registry.resolver(site_id))
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+    logger.info(f"version: {version_info} Received [externalStream] request with {len(warehouses)} warehouses, "
+                f"{len(orders)} orders, site: {site_id}")
+
+    filename = site_schedule_file(site_id, "local_schedule.csv")
+    mode, oversize_response = admit_external_request("externalStream", warehouses, orders, filename)
+    if oversize_response is not None:
+        return oversize_response
+    budget = SolveBudget(deadline_ms, solve_time_model, g.request_start_time, mode)
+    # 求解名额在返回响应前占用（名额不足时直接返回 429），响应结束或客户端断开后释放
+    release = None
+    if admission is not None:
+        try:
+            release = admission.acquire(admission_pool("externalStream", mode), budget.remaining())
+        except AdmissionRejected as e:
+            body = admission_rejected_body(e)
+            logger.info(f"错误响应: {dumps(body)}, 状态码: 429")
+            return jsonify(body), 429, {'Retry-After': str(e.retry_after)}
+    response = Response(stream_with_context(stream_external_orders(warehouses, orders, filename, budget)),
+                        mimetype='application/x-ndjson')
+    if release is not None:
+        response.call_on_close(release)
+    return response
 
 
 @app.route('/internal_orders_queueing', methods=['POST'])
+@profiled
 def internal_orders_queueing():
     """
     :return: A JSON response containing the order sequences and carriage vehicle dock assignments if successful. Otherwise, a JSON response with an error code and message.
     """
     print(version_info, flush=True)
-    data = request.json  # 获取 JSON 格式的数据
-    logger.info(f"version: {version_info} Received [internal] request with data: {json.dumps(data)}")  # 记录入参
-    # 解析仓库数据
-    warehouses, orders, vehicles, carriages = parse_internal_data(data)
+    # 解析并校验仓库、订单、车辆和车厢数据
+    try:
+        site_id = request_site()
+        data = read_payload("internal", site_id)
+        warehouses, orders, vehicles, carriages = parse_internal_data(data, topology_registry.resolver(site_id))
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+    fleet = FleetPool(carriages, vehicles)
 
     # 根据订单类型分别创建装车和卸车订单的列表
     loading_orders, unloading_orders = classify_orders(orders)
-    # 设置仓库效率
+    # 设置仓库效率（已登记布局的效率在编译时已设置）
     set_dock_efficiency(warehouses)
 
     # 初始化变量
@@ -194,11 +502,11 @@ def internal_orders_queueing():
         # SECTION 内部入库单
         if loading_orders:
             order_sequences, carriage_vehicle_dock_assignments = process_loading_orders(
-                loading_orders, warehouses, carriages)
+                loading_orders, warehouses, fleet)
         # SECTION 内部出库单
         elif unloading_orders:
             order_sequences, carriage_vehicle_dock_assignments = process_unloading_orders(
-                unloading_orders, warehouses, carriages, vehicles)
+                unloading_orders, warehouses, fleet, site_schedule_file(site_id, 'internal_schedule.csv'))
 
         # 确保变量已被赋值
         if order_sequences is None or carriage_vehicle_dock_assignments is None:
@@ -208,6 +516,10 @@ def internal_orders_queueing():
         logger.info(f"响应成功创建，数据: {response.get_data(as_text=True)}")  # 成功响应的日志
         return response
 
+    except ScheduleConflictError as e:
+        # 车厢、车辆状态已按本次规划更新，不在请求内重新规划，由客户端重试
+        logger.error(str(e))
+        return jsonify(schedule_conflict_body(e)), 409
     except Exception as e:
         logger.error(f"处理过程中发生错误: {e}")  # 错误日志
         error_response = jsonify({"code": 1, "message": f"处理过程中发生错误：{e}。"}), 400
@@ -216,6 +528,7 @@ def internal_orders_queueing():
 
 
 @app.route('/drop_pull_scheduling', methods=['POST'])
+@profiled
 def drop_pull_scheduling():
     """
     Perform drop-pull scheduling based on the given data.
@@ -223,38 +536,36 @@ def drop_pull_scheduling():
     :return: JSON response with vehicle-dock assignments or error message
     """
     print(version_info, flush=True)
-    data = request.json  # 获取 JSON 格式的数据
-    logger.info(f"version: {version_info} Received [dropPull] request with data: {json.dumps(data)}")  # 记录入参
-    filename = "DropPull_schedule.csv"
+    # 解析并校验订单车厢数据（缺少需求车型 required_carriage 的订单在此被拒绝）
+    try:
+        site_id = request_site()
+        data, topology = decode_drop_pull_request(read_payload("dropPull", site_id),
+                                                  topology_registry.resolver(site_id))
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+    filename = site_schedule_file(site_id, "DropPull_schedule.csv")
 
     try:
-        parsed_orders = parse_order_carriage_info(data)
+        parsed_orders = parse_order_carriage_info(data, topology)
         orders = [order_info['order'] for order_info in parsed_orders]
 
-        for order in orders:
-            if order.required_carriage is None:
-                # 创建一个包含错误信息的JSON响应
-                error_response = jsonify({
-                    "code": 1,
-                    "message": "订单 {} 缺少需求车型 'required_carriage'".format(order.id)
-                })
-                # 返回JSON响应和400错误状态码
-                return error_response, 400
-
         loaded_schedule = load_and_prepare_schedule(filename, orders, "drop")
-        vehicles = [Vehicle(**v) for v in data['vehicles']]
+        fleet = FleetPool(vehicles=[build_vehicle(v) for v in data['vehicles']])
         vehicle_dock_assignments = []
         # 打印解析结果
         # set_efficiency_for_docks(parsed_orders)
         for order_info in parsed_orders:
             warehouse = (order_info['warehouse'])
-            unloading_docks = [dock for dock in warehouse.docks if dock.dock_type in [2, 3]]
-            for dock in unloading_docks:
-                dock.set_efficiency(1)
+            # 布局中的仓库（next_warehouse_id）效率已在编译时设置，且为共享对象，不再修改
+            shared = topology is not None and topology.by_id.get(warehouse.id) is warehouse
+            if not shared:
+                unloading_docks = [dock for dock in warehouse.docks if dock.dock_type in [2, 3]]
+                for dock in unloading_docks:
+                    dock.set_efficiency(1)
 
-            loading_docks = [dock for dock in warehouse.docks if dock.dock_type in [1, 3]]
-            for dock in loading_docks:
-                dock.set_efficiency(2)
+                loading_docks = [dock for dock in warehouse.docks if dock.dock_type in [1, 3]]
+                for dock in loading_docks:
+                    dock.set_efficiency(2)
 
             if order_info.get('perform_dock_matching'):
                 selected_dock_id = find_earliest_and_efficient_dock(order_info, loaded_schedule)
@@ -263,15 +574,16 @@ def drop_pull_scheduling():
                 lay_time = calculate_lay_time(order_info)
                 order_info["lay_time"] = lay_time
 
-            # SECTION 匹配车辆
-            if order_info.get('perform_vehicle_matching'):
-                carriage_location = order_info['carriage'].location
-                closest_vehicle = find_closest_vehicle(carriage_location, vehicles)
-                if closest_vehicle:
-                    order_info['matched_vehicle_id'] = closest_vehicle.id
-                    closest_vehicle.state = 1
-                else:
-                    order_info['matched_vehicle_id'] = None
+        # SECTION 匹配车辆（默认批量全局最优匹配，batch_matching=false 时按请求顺序贪心匹配）
+        vehicle_matching_orders = [order_info for order_info in parsed_orders
+                                   if order_info.get('perform_vehicle_matching')]
+        matched_vehicles = match_vehicles_to_locations(
+            [order_info['carriage'].location for order_info in vehicle_matching_orders], fleet,
+            data.get('batch_matching', True))
+        for order_info, matched_vehicle in zip(vehicle_matching_orders, matched_vehicles):
+            order_info['matched_vehicle_id'] = matched_vehicle.id if matched_vehicle else None
+
+        for order_info in parsed_orders:
             assignment = {
                 "order_id": order_info["order"].id,
                 "vehicle_id": order_info.get("matched_vehicle_id"),
@@ -307,5 +619,93 @@ def drop_pull_scheduling():
         return error_response
 
 
+@app.route('/topologies/<topology_id>', methods=['POST'])
+def register_topology(topology_id):
+    """
+    登记站点布局，请求体为 {"warehouses": [...]}（格式与订单请求中的 warehouses 相同），与最新版本内容相同时不新建版本。
+
+    :return: {"topology_id", "version", "created"}，新建版本时状态码为 201
+    """
+    try:
+        site_id = request_site()
+        warehouses_data = decode_topology_upload(read_payload("topology", site_id))
+        version, created = topology_registry.register(site_id, topology_id, warehouses_data)
+    except InvalidTopologyError as e:
+        return validation_error_response(PayloadValidationError([{"path": "topology_id", "message": str(e)}]))
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+    logger.info(f"布局 {topology_id} 登记{'新版本' if created else '内容未变化，沿用版本'} {version}，站点: {site_id}")
+    body = {"code": 0, "message": "处理成功。",
+            "data": {"topology_id": topology_id, "version": version, "created": created}}
+    return jsonify(body), 201 if created else 200
+
+
+@app.route('/topologies/<topology_id>', methods=['GET'])
+@app.route('/topologies/<topology_id>/<int:version>', methods=['GET'])
+def get_topology(topology_id, version=None):
+    """
+    查询已登记的布局，未指定版本时返回最新版本。
+
+    :return: {"topology_id", "version", "versions", "warehouses"}
+    """
+    try:
+        site_id = request_site()
+        topology = topology_registry.get(site_id, topology_id, version)
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+    except (InvalidTopologyError, TopologyNotFoundError) as e:
+        return jsonify({"code": 1, "message": str(e)}), 404
+    return jsonify({"code": 0, "message": "处理成功。",
+                    "data": dict(topology.reference(), versions=topology_registry.versions(site_id, topology_id),
+                                 warehouses=topology.data)})
+
+
+@app.route('/schedule_feedback', methods=['POST'])
+def schedule_feedback():
+    """
+    实际作业反馈，请求体：{"schedule": "external", "events": [{"order_id", "warehouse_id", "dock_id",
+    "actual_start", "actual_end", "cancelled"}, ...], "shift_remaining": false}
+
+    :return: {"updated", "cancelled", "shifted", "not_found"}
+    """
+    try:
+        site_id = request_site()
+        schedule, events, shift_remaining = decode_feedback_request(read_payload("feedback", site_id))
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+    filename = site_schedule_file(site_id, SCHEDULE_FILES[schedule])
+    try:
+        result = apply_feedback(filename, events, shift_remaining)
+    except Exception as e:
+        logger.error(f"处理过程中发生错误: {e}")
+        return jsonify({"code": 1, "message": "处理过程中发生错误。"}), 500
+    logger.info(f"实际作业反馈 {filename}: 更新 {result['updated']}，取消 {result['cancelled']}，"
+                f"提前 {result['shifted']}，未找到 {len(result['not_found'])}")
+    return jsonify({"code": 0, "message": "处理成功。", "data": result})
+
+
+@app.route('/schedule_gantt', methods=['GET'])
+def schedule_gantt():
+    """
+    调度文件的甘特图。
+
+    查询参数：schedule=external|internal|dropPull，format=png|svg，start/end（YYYY-MM-DD HH:MM:SS），
+    warehouse_ids（逗号分隔），site_id（或请求头 X-Site-ID）。
+    :return: PNG 或 SVG 图片
+    """
+    try:
+        site_id = request_site()
+        params = parse_gantt_params(request.args)
+    except PayloadValidationError as e:
+        return validation_error_response(e)
+    filename = site_schedule_file(site_id, SCHEDULE_FILES[params["schedule"]])
+    try:
+        image, _ = gantt_cache.render(filename, params)
+    except ImportError as e:
+        logger.error(f"甘特图渲染不可用: {e}")
+        return jsonify({"code": 1, "message": "服务端未安装 matplotlib，无法渲染甘特图。"}), 501
+    return Response(image, mimetype=FORMATS[params["format"]])
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5010, threaded=True, debug=False)
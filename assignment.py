@@ -0,0 +1,98 @@
+"""
+矩形指派问题求解（匈牙利 / Jonker-Volgenant 最短增广路）。
+
+若环境中安装了 scipy，则直接使用 scipy.optimize.linear_sum_assignment；否则使用纯 Python 实现。
+"""
+import importlib.util
+import math
+
+_scipy_linear_sum_assignment = None
+_scipy_available = importlib.util.find_spec('scipy') is not None  # scipy 为可选依赖，首次使用时才导入
+
+
+def _shortest_augmenting_path(cost):
+    """
+    行数 <= 列数 的最短增广路匈牙利算法，复杂度 O(n^2 * m)。
+
+    :param cost: 二维列表，cost[i][j] 为第 i 行分配给第 j 列的代价。
+    :return: 长度为行数的列表，第 i 项为第 i 行分配到的列下标。
+    """
+    n, m = len(cost), len(cost[0])
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)  # p[j]：第 j 列当前分配到的行（从 1 开始，0 表示未分配）
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        min_v = [math.inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            u_i0 = u[i0]
+            delta = math.inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u_i0 - v[j]
+                    if cur < min_v[j]:
+                        min_v[j] = cur
+                        way[j] = j0
+                    if min_v[j] < delta:
+                        delta = min_v[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_v[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # 沿增广路回溯，更新匹配
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    row_to_col = [0] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            row_to_col[p[j] - 1] = j - 1
+    return row_to_col
+
+
+def linear_sum_assignment(cost):
+    """
+    求解矩形指派问题，使总代价最小。与 scipy.optimize.linear_sum_assignment 接口一致。
+
+    :param cost: 二维列表（或 numpy 数组），行数与列数可以不同。
+    :return: (row_ind, col_ind) 两个等长列表，表示被分配的 (行, 列) 对。
+    """
+    if len(cost) == 0 or len(cost[0]) == 0:
+        return [], []
+
+    global _scipy_linear_sum_assignment
+    if _scipy_available and _scipy_linear_sum_assignment is None:
+        from scipy.optimize import linear_sum_assignment as _scipy_linear_sum_assignment
+    if _scipy_linear_sum_assignment is not None:
+        row_ind, col_ind = _scipy_linear_sum_assignment(cost)
+        return list(row_ind), list(col_ind)
+
+    cost = [list(row) for row in cost]
+    n, m = len(cost), len(cost[0])
+    if n <= m:
+        row_to_col = _shortest_augmenting_path(cost)
+        return list(range(n)), row_to_col
+
+    # 行数多于列数时转置求解
+    transposed = [[cost[i][j] for i in range(n)] for j in range(m)]
+    col_to_row = _shortest_augmenting_path(transposed)
+    pairs = sorted((row, col) for col, row in enumerate(col_to_row))
+    return [row for row, _ in pairs], [col for _, col in pairs]
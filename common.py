@@ -1,30 +1,21 @@
-import pulp
 import random
-import pandas as pd
 from datetime import datetime, timedelta
 import logging
+from schedule_store import schedule_lock, atomic_write_csv, schedule_version
+from lazy_import import lazy_import
+
+pulp = lazy_import('pulp')
+pd = lazy_import('pandas')
 
 
 class Order:
+    __slots__ = ('id', 'warehouse_loads', 'priority', 'sequential', 'required_carriage', 'order_type')
+
     def __init__(self, order_id, warehouse_loads, priority, sequential, required_carriage, order_type):
         self.id = order_id
-        self.warehouse_loads = []
-        for wl in warehouse_loads:
-            if isinstance(wl, dict):
-                # 检查并提取需要的字段
-                warehouse_id = wl.get('warehouse_id')
-                cargo_type = wl.get('item_code', None)  # 使用 item_code 作为 cargo_type
-                quantity = wl.get('load', None)
-                operation = wl.get('loadUnloadStatus', None)  # 使用 loadUnloadStatus 作为 operation
-                sequence = wl.get('sequence', None)  # 如果按序，则使用仓库顺序
-                # 如果字段完整，则创建 WarehouseLoad 对象
-                if all([warehouse_id is not None, quantity is not None, operation is not None]):
-                    self.warehouse_loads.append(WarehouseLoad(warehouse_id, cargo_type, quantity, operation, sequence))
-                else:
-                    # 否则，保持原样
-                    self.warehouse_loads.append(wl)
-            else:
-                self.warehouse_loads.append(wl)
+        # 统一转换为 WarehouseLoad 对象，外部订单未提供 loadUnloadStatus 时 operation 为 None
+        self.warehouse_loads = [wl if isinstance(wl, WarehouseLoad) else WarehouseLoad.from_dict(wl)
+                                for wl in warehouse_loads]
         self.priority = priority
         self.sequential = sequential
         if required_carriage is None or required_carriage == '':
@@ -37,6 +28,9 @@ class Order:
 
 
 class Dock:
+    __slots__ = ('id', 'outbound_efficiency', 'inbound_efficiency', 'efficiency', 'weight', 'dock_type',
+                 'compatible_carriage')
+
     def __init__(self, dock_id, outbound_efficiency, inbound_efficiency, weight, dock_type, compatible_carriage):
         self.id = dock_id
         self.outbound_efficiency = outbound_efficiency
@@ -61,6 +55,8 @@ class Dock:
 
 
 class WarehouseLoad:
+    __slots__ = ('warehouse_id', 'cargo_type', 'quantity', 'operation', 'sequence')
+
     def __init__(self, warehouse_id, cargo_type, quantity, operation, sequence=None):
         self.warehouse_id = warehouse_id
         self.cargo_type = cargo_type
@@ -68,12 +64,22 @@ class WarehouseLoad:
         self.operation = operation  # 1='load' ；2 = 'unload'
         self.sequence = sequence
 
+    @classmethod
+    def from_dict(cls, wl):
+        return cls(wl.get('warehouse_id'),
+                   wl.get('item_code'),  # 使用 item_code 作为 cargo_type
+                   wl.get('load'),
+                   wl.get('loadUnloadStatus'),  # 使用 loadUnloadStatus 作为 operation
+                   wl.get('sequence'))  # 如果按序，则使用仓库顺序
+
     def __repr__(self):
         return (f"WarehouseLoad({self.warehouse_id}, '{self.cargo_type}', {self.quantity}, '{self.operation}',"
                 f" {self.sequence})")
 
 
 class Warehouse:
+    __slots__ = ('id', 'docks', 'location')
+
     def __init__(self, warehouse_id, docks, location=None):
         self.id = warehouse_id
         self.docks = docks
@@ -84,6 +90,8 @@ class Warehouse:
 
 
 class Carriage:
+    __slots__ = ('id', 'location', 'type', 'state', 'current_dock_id', 'current_warehouse_id')
+
     def __init__(self, carriage_id, location, carriage_type, carriage_state, current_dock_id,
                  current_warehouse_id=None):
         self.id = carriage_id
@@ -99,6 +107,8 @@ class Carriage:
 
 
 class Vehicle:
+    __slots__ = ('id', 'location', 'state', 'workload')
+
     def __init__(self, vehicle_id, location, vehicle_state, vehicle_workload):
         self.id = vehicle_id
         self.location = location
@@ -172,13 +182,33 @@ def generate_test_data(num_orders, num_docks_per_warehouse, num_warehouses):
     return orders, warehouses
 
 
-def save_schedule_to_file(schedule, filename="test_schedule.csv"):
-    def load_existing_schedule():
-        try:
-            return pd.read_csv(filename, encoding='utf-8')
-        except FileNotFoundError:
-            return pd.DataFrame(columns=["Order ID", "Warehouse ID", "Dock ID", "Start Time", "End Time"])
+# 调度文件变更监听器，签名为 listener(filename, dock_keys)，dock_keys 为 {(仓库ID, 月台ID)}（均转为字符串）
+schedule_listeners = []
 
+
+def register_schedule_listener(listener):
+    schedule_listeners.append(listener)
+
+
+def notify_schedule_changed(filename, schedule):
+    dock_keys = {(str(w), str(d)) for w, d in zip(schedule['Warehouse ID'], schedule['Dock ID'])} \
+        if not schedule.empty else set()
+    for listener in schedule_listeners:
+        listener(filename, dock_keys)
+
+
+SCHEDULE_COLUMNS = ["Order ID", "Warehouse ID", "Dock ID", "Start Time", "End Time"]
+
+
+def _read_schedule(filename):
+    try:
+        return pd.read_csv(filename, encoding='utf-8')
+    except FileNotFoundError:
+        return pd.DataFrame(columns=SCHEDULE_COLUMNS)
+
+
+def _merge_schedule(schedule, filename):
+    """把时间表合并写入调度文件，调用方需持有 schedule_lock"""
     def filter_old_data(df):
         # 获取7天前的日期时间
         cutoff_date = datetime.now() - timedelta(days=7)
@@ -189,7 +219,7 @@ def save_schedule_to_file(schedule, filename="test_schedule.csv"):
         # 保留结束时间在7天内的数据
         return df[df['End Time'] >= cutoff_date]
 
-    existing_schedule = load_existing_schedule()
+    existing_schedule = _read_schedule(filename)
     existing_schedule['Start Time'] = pd.to_datetime(existing_schedule['Start Time'])
     existing_schedule['End Time'] = pd.to_datetime(existing_schedule['End Time'])
 
@@ -204,15 +234,24 @@ def save_schedule_to_file(schedule, filename="test_schedule.csv"):
     # 清理7天以上的旧数据
     updated_schedule = filter_old_data(updated_schedule)
     # 保存到 CSV 文件
-    updated_schedule.to_csv(filename, index=False, encoding='utf-8')
+    atomic_write_csv(updated_schedule, filename)
+
+
+def save_schedule_to_file(schedule, filename="test_schedule.csv"):
+    # 读-改-写在文件锁内完成，多进程部署时各 worker 不会互相覆盖
+    with schedule_lock(filename):
+        _merge_schedule(schedule, filename)
+    notify_schedule_changed(filename, schedule)
 
 
-def load_and_prepare_schedule(filename, orders, drop_or_queue):
+def load_and_prepare_schedule(filename, orders, drop_or_queue, pending=None, base=None):
     """
     加载调度文件，并准备数据以便后续处理。
 
     :param drop_or_queue: 判断是内外部车辆排队接口使用还是甩挂调度接口使用
     :param filename: 调度数据的文件名。
+    :param pending: 尚未写入文件的时间表（见 ScheduleUnitOfWork），叠加在文件内容之上
+    :param base: 已读取的调度文件内容，为空时读取 filename（不会被修改）
     :return: 准备好的 DataFrame。
     """
 
@@ -220,7 +259,16 @@ def load_and_prepare_schedule(filename, orders, drop_or_queue):
         return [order.id for order in orders]
 
     try:
-        loaded_schedule = pd.read_csv(filename, encoding='utf-8')
+        try:
+            loaded_schedule = base.copy() if base is not None else pd.read_csv(filename, encoding='utf-8')
+        except FileNotFoundError:
+            if pending is None:
+                raise
+            loaded_schedule = pd.DataFrame(columns=SCHEDULE_COLUMNS)
+        if pending is not None:
+            # 同一 (订单, 仓库, 月台) 以未提交的记录为准
+            loaded_schedule = pd.concat([loaded_schedule, pending], ignore_index=True).drop_duplicates(
+                subset=["Order ID", "Warehouse ID", "Dock ID"], keep='last')
 
         # 获取当前时间的时间戳
         current_timestamp = datetime.now().timestamp()
@@ -249,6 +297,96 @@ def load_and_prepare_schedule(filename, orders, drop_or_queue):
         return pd.DataFrame(columns=["Order ID", "Warehouse ID", "Dock ID", "Start Time", "End Time"])
 
 
+class ScheduleConflictError(Exception):
+    """提交时发现其他请求在本次读取调度文件之后向相同月台写入了时段，按旧快照得到的结果可能与其重叠"""
+
+    def __init__(self, dock_keys):
+        self.dock_keys = sorted(dock_keys)
+        super().__init__(f"调度文件已被其他请求修改，冲突月台: {self.dock_keys}")
+
+
+def _schedule_rows(schedule):
+    return zip(*(schedule[column].astype(str) for column in SCHEDULE_COLUMNS))
+
+
+class ScheduleUnitOfWork:
+    """
+    请求级的调度文件写入缓冲。
+
+    处理过程中产生的时间表先缓存在内存中，load 读取时叠加尚未提交的记录；处理成功后 commit 一次性合并写入
+    调度文件（文件锁内读-改-写，临时文件 + 重命名），处理失败时丢弃，调度文件保持不变。
+
+    调度文件在第一次 load 时读取一次，之后的 load 都基于这份快照。规划在锁外进行，commit 时在锁内检查文件
+    是否在此之后被修改：其他请求向本次写入的月台新增了尚未结束的时段时抛出 ScheduleConflictError，
+    调用方应重新规划，避免两个请求基于同一快照把同一月台排重。
+
+        with ScheduleUnitOfWork(filename) as uow:
+            loaded_schedule = uow.load(orders, "queue")
+            uow.add(schedule)
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._pending = []
+        self._base = None
+        self._version = None
+
+    def add(self, schedule):
+        if not schedule.empty:
+            self._pending.append(schedule)
+
+    def pending(self):
+        """尚未提交的时间表，没有时返回 None"""
+        return pd.concat(self._pending, ignore_index=True) if self._pending else None
+
+    def load(self, orders, drop_or_queue):
+        if self._base is None:
+            # 先取版本再读取：两者之间发生的写入只会导致 commit 时多做一次检查，不会漏掉
+            self._version = schedule_version(self.filename)
+            self._base = _read_schedule(self.filename)
+        return load_and_prepare_schedule(self.filename, orders, drop_or_queue, self.pending(), self._base)
+
+    def _conflicts(self, pending):
+        """load 之后其他请求写入本次涉及月台、且尚未结束的时段所在的月台"""
+        docks = set(zip(pending['Warehouse ID'].astype(str), pending['Dock ID'].astype(str)))
+        own_orders = set(pending['Order ID'].astype(str))
+        seen = set(_schedule_rows(self._base))
+        now = datetime.now().timestamp()
+        conflicts = set()
+        for row in _schedule_rows(_read_schedule(self.filename)):
+            order_id, warehouse_id, dock_id, _, end = row
+            if (warehouse_id, dock_id) in docks and order_id not in own_orders and row not in seen \
+                    and convert_str_to_timestamp(end) > now:
+                conflicts.add((warehouse_id, dock_id))
+        return conflicts
+
+    def commit(self):
+        pending = self.pending()
+        self._pending = []
+        if pending is None:
+            return
+        with schedule_lock(self.filename):
+            if self._base is not None and schedule_version(self.filename) != self._version:
+                conflicts = self._conflicts(pending)
+                if conflicts:
+                    raise ScheduleConflictError(conflicts)
+            _merge_schedule(pending, self.filename)
+        notify_schedule_changed(self.filename, pending)
+
+    def rollback(self):
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
 def generate_schedule(start_times, end_times, drop_or_queue):
     """
     从开始和结束时间生成一个日程表。
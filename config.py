@@ -0,0 +1,124 @@
+"""
+服务配置，均可通过环境变量覆盖。
+"""
+import os
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_str(name, default):
+    value = os.environ.get(name)
+    return value if value not in (None, '') else default
+
+
+# 响应缓存：最大条目数与过期时间（秒），最大条目数为 0 时关闭缓存
+RESPONSE_CACHE_SIZE = env_int('NP_RESPONSE_CACHE_SIZE', 256)
+RESPONSE_CACHE_TTL = env_float('NP_RESPONSE_CACHE_TTL', 600)
+
+# 多进程部署：worker 数量与各 worker 指标文件目录
+WORKERS = env_int('NP_WORKERS', os.cpu_count() or 1)
+BIND = env_str('NP_BIND', '0.0.0.0:5010')
+METRICS_DIR = env_str('NP_METRICS_DIR', 'metrics')
+# 请求指标在内存中累计，每隔 METRICS_FLUSH_SECONDS 秒最多写一次指标文件（准入占用数变化时立即写入），0 表示每次都写
+METRICS_FLUSH_SECONDS = env_float('NP_METRICS_FLUSH_SECONDS', 1.0)
+
+# 启动预热：开启时 worker 在后台求解一个极小实例，完成后 /ready 才返回就绪
+WARMUP = env_bool('NP_WARMUP', True)
+
+# 请求剖析：请求头 X-Profile: 1 或按抽样率开启，结果写入 PROFILE_DIR，最多保留 PROFILE_KEEP 份
+PROFILE_HEADER = env_bool('NP_PROFILE_HEADER', True)
+PROFILE_SAMPLE_RATE = env_float('NP_PROFILE_SAMPLE_RATE', 0)
+PROFILE_INTERVAL = env_float('NP_PROFILE_INTERVAL', 0.005)  # 调用栈采样间隔（秒）
+PROFILE_DIR = env_str('NP_PROFILE_DIR', 'profiles')
+PROFILE_KEEP = env_int('NP_PROFILE_KEEP', 100)
+
+# 慢求解记录：单次求解耗时超过 SLOW_SOLVE_SECONDS 秒时导出模型与上下文，负数关闭记录
+SLOW_SOLVE_SECONDS = env_float('NP_SLOW_SOLVE_SECONDS', 10)
+SOLVE_RECORD_DIR = env_str('NP_SOLVE_RECORD_DIR', 'solve_records')
+SOLVE_RECORD_KEEP = env_int('NP_SOLVE_RECORD_KEEP', 50)
+
+# 月台分配模型中对可互换月台添加对称性破除约束
+SYMMETRY_BREAKING = env_bool('NP_SYMMETRY_BREAKING', True)
+
+# 排队规划按连通分量分解，无需 0-1 变量的分量以最长路直接求解，关闭时整体交给求解器
+QUEUE_DECOMPOSITION = env_bool('NP_QUEUE_DECOMPOSITION', True)
+
+# 站点分片：各站点调度文件位于 SCHEDULE_DIR/<站点>/；router.py 启动 SHARDS 个分片进程组，
+# 分片 i 监听 127.0.0.1:(SHARD_BASE_PORT + i)，站点到分片的映射形如 "siteA=0,siteB=1"，未配置的站点按哈希分配，
+# 各分片 worker 数形如 "0=4,1=2"，未配置的分片使用 WORKERS
+SCHEDULE_DIR = env_str('NP_SCHEDULE_DIR', 'schedules')
+SHARDS = env_int('NP_SHARDS', 1)
+SITE_SHARDS = env_str('NP_SITE_SHARDS', '')
+SHARD_WORKERS = env_str('NP_SHARD_WORKERS', '')
+SHARD_BASE_PORT = env_int('NP_SHARD_BASE_PORT', 5100)
+ROUTER_THREADS = env_int('NP_ROUTER_THREADS', 64)
+
+# 内部订单装货站点按仓库间距离排序（最近邻 + 2-opt），关闭时按请求中出现的顺序
+ROUTE_OPTIMIZATION = env_bool('NP_ROUTE_OPTIMIZATION', True)
+
+# 甘特图渲染缓存条目数，调度文件变化后相应条目失效
+GANTT_CACHE_SIZE = env_int('NP_GANTT_CACHE_SIZE', 32)
+
+# 求解前可行性筛查：exclude 剔除不可行订单后继续规划（响应中列出 excluded_orders），reject 使整个请求失败
+PRESOLVE_MODE = env_str('NP_PRESOLVE_MODE', 'exclude')
+
+# 规划期间其他请求向相同月台写入了时段（调度文件提交冲突）时重新规划的次数，仍冲突时返回 409
+SCHEDULE_COMMIT_RETRIES = env_int('NP_SCHEDULE_COMMIT_RETRIES', 2)
+
+# 截止时间感知的求解：按求解历史预测各阶段耗时，选择精确求解、限时求解或启发式。
+# 历史文件保留最近 SOLVE_HISTORY_WINDOW 条，精确求解记录不少于 SOLVE_HISTORY_MIN_SAMPLES 条时启用回归预测；
+# 预测耗时乘以 SOLVE_TIME_SAFETY 不超过阶段预算时精确求解，预算不少于 MIN_MIP_SECONDS 秒时限时求解；
+# DEADLINE_RESERVE_MS 为截止时间中预留给解析与序列化的毫秒数
+SOLVE_HISTORY_FILE = env_str('NP_SOLVE_HISTORY_FILE', 'solve_history.jsonl')
+SOLVE_HISTORY_WINDOW = env_int('NP_SOLVE_HISTORY_WINDOW', 500)
+SOLVE_HISTORY_MIN_SAMPLES = env_int('NP_SOLVE_HISTORY_MIN_SAMPLES', 20)
+SOLVE_TIME_SAFETY = env_float('NP_SOLVE_TIME_SAFETY', 1.5)
+MIN_MIP_SECONDS = env_float('NP_MIN_MIP_SECONDS', 1)
+DEADLINE_RESERVE_MS = env_float('NP_DEADLINE_RESERVE_MS', 200)
+
+# 求解器组合竞速：逗号分隔的配置名（cbc、cbc_nocuts、cbc_nopresolve、highs、heuristic），为空时只用 CBC 默认参数；
+# 带时限的求解到时限后最多再等待 PORTFOLIO_GRACE_SECONDS 秒。
+# 同类模型竞速 PORTFOLIO_PRUNE_AFTER 次后，胜率低于 PORTFOLIO_MIN_WIN_RATE 的配置只以 PORTFOLIO_EXPLORE_RATE 的概率参赛
+PORTFOLIO = env_str('NP_PORTFOLIO', '')
+PORTFOLIO_GRACE_SECONDS = env_float('NP_PORTFOLIO_GRACE_SECONDS', 0.5)
+PORTFOLIO_STATS_FILE = env_str('NP_PORTFOLIO_STATS_FILE', 'portfolio_stats.jsonl')
+PORTFOLIO_PRUNE_AFTER = env_int('NP_PORTFOLIO_PRUNE_AFTER', 50)
+PORTFOLIO_MIN_WIN_RATE = env_float('NP_PORTFOLIO_MIN_WIN_RATE', 0.05)
+PORTFOLIO_EXPLORE_RATE = env_float('NP_PORTFOLIO_EXPLORE_RATE', 0.1)
+
+# 布局登记：已登记的仓库与月台定义位于 TOPOLOGY_DIR，每个 worker 缓存最近使用的 TOPOLOGY_CACHE_SIZE 个版本的编译结果
+TOPOLOGY_DIR = env_str('NP_TOPOLOGY_DIR', 'topologies')
+TOPOLOGY_CACHE_SIZE = env_int('NP_TOPOLOGY_CACHE_SIZE', 64)
+
+# 准入控制：求解接口（external、externalStream）本机同时求解数与等待队列长度，形如 "external=4,externalStream=1"，
+# 规模超限降级为启发式的请求使用名额池 heuristic（如 "heuristic=2"），
+# 未配置的接口使用 ADMISSION_DEFAULT_SLOTS（默认 CPU 核数除以组合求解的配置数）与 ADMISSION_DEFAULT_QUEUE，
+# 名额锁文件位于 ADMISSION_DIR，排队最多等待 ADMISSION_WAIT_SECONDS 秒。
+# 月台分配模型 0-1 变量数超过 ADMISSION_MAX_BINARIES 或涉及月台的忙碌窗口数超过 ADMISSION_MAX_BUSY_WINDOWS 时，
+# 按 ADMISSION_OVERSIZE 处理：heuristic 降级为启发式，reject 返回 413
+ADMISSION = env_bool('NP_ADMISSION', True)
+ADMISSION_DIR = env_str('NP_ADMISSION_DIR', 'admission')
+ADMISSION_SLOTS = env_str('NP_ADMISSION_SLOTS', '')
+ADMISSION_DEFAULT_SLOTS = env_int('NP_ADMISSION_DEFAULT_SLOTS', max(
+    1, (os.cpu_count() or 1) // max(1, len([name for name in PORTFOLIO.split(',') if name.strip()]))))
+ADMISSION_QUEUE = env_str('NP_ADMISSION_QUEUE', '')
+ADMISSION_DEFAULT_QUEUE = env_int('NP_ADMISSION_DEFAULT_QUEUE', 16)
+ADMISSION_WAIT_SECONDS = env_float('NP_ADMISSION_WAIT_SECONDS', 30)
+ADMISSION_MAX_BINARIES = env_int('NP_ADMISSION_MAX_BINARIES', 50000)
+ADMISSION_MAX_BUSY_WINDOWS = env_int('NP_ADMISSION_MAX_BUSY_WINDOWS', 10000)
+ADMISSION_OVERSIZE = env_str('NP_ADMISSION_OVERSIZE', 'heuristic')
@@ -0,0 +1,506 @@
+"""
+请求解码与校验层。
+
+- 使用可用的最快 JSON 解析器（orjson > ujson > json）解析请求体；
+- 按预编译的模式一次性校验整个请求，收集全部错误后统一返回；
+- 校验通过后批量构建领域对象，只传入模型需要的字段，多余字段不会导致构造失败。
+"""
+import json
+from datetime import datetime, timedelta
+
+from common import Warehouse, Dock, Order, Carriage, Vehicle
+
+try:
+    import orjson as _fast_json
+
+    def loads(raw):
+        return _fast_json.loads(raw)
+
+    def dumps(data):
+        # 与 json.dumps 一致，允许整数等非字符串键（转为字符串）
+        return _fast_json.dumps(data, option=_fast_json.OPT_NON_STR_KEYS).decode('utf-8')
+except ImportError:
+    try:
+        import ujson as _fast_json
+
+        def loads(raw):
+            return _fast_json.loads(raw)
+
+        def dumps(data):
+            return _fast_json.dumps(data, ensure_ascii=False)
+    except ImportError:
+        def loads(raw):
+            return json.loads(raw)
+
+        def dumps(data):
+            return json.dumps(data)
+
+
+class PayloadValidationError(Exception):
+    """请求体校验失败，errors 为 [{"path": ..., "message": ...}, ...]"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{e['path']}: {e['message']}" for e in errors))
+
+
+# SECTION 模式定义与预编译
+NUMBER = (int, float)
+IDENTIFIER = (int, str)
+
+
+class Field:
+    def __init__(self, types=None, required=True, nullable=False, items=None, schema=None, choices=None,
+                 min_value=None, exclusive_min=None, non_empty=False):
+        self.types = types
+        self.required = required
+        self.nullable = nullable
+        self.items = items  # 列表元素的 Field
+        self.schema = schema  # 嵌套对象的模式字典
+        self.choices = choices
+        self.min_value = min_value
+        self.exclusive_min = exclusive_min  # 须严格大于该值
+        self.non_empty = non_empty
+
+
+def _type_name(types):
+    names = {int: "整数", float: "数字", str: "字符串", bool: "布尔值", list: "数组", dict: "对象"}
+    if isinstance(types, tuple):
+        return "/".join(names.get(t, t.__name__) for t in types)
+    return names.get(types, types.__name__)
+
+
+def _compile_field(field):
+    """将 Field 编译为 check(value, path, errors) 闭包"""
+    item_check = _compile_field(field.items) if field.items is not None else None
+    object_check = compile_schema(field.schema) if field.schema is not None else None
+    types = field.types
+    expected = _type_name(types) if types is not None else None
+
+    def check(value, path, errors):
+        if value is None:
+            if not field.nullable:
+                errors.append({"path": path, "message": "不能为空"})
+            return
+        # bool 是 int 的子类，数值字段需要显式排除
+        if types is not None and (not isinstance(value, types) or (isinstance(value, bool) and bool not in (
+                types if isinstance(types, tuple) else (types,)))):
+            errors.append({"path": path, "message": f"应为{expected}，实际为 {type(value).__name__}"})
+            return
+        if field.non_empty and value == '':
+            errors.append({"path": path, "message": "不能为空字符串"})
+        if field.choices is not None and value not in field.choices:
+            errors.append({"path": path, "message": f"取值应为 {list(field.choices)} 之一，实际为 {value!r}"})
+        if field.min_value is not None and value < field.min_value:
+            errors.append({"path": path, "message": f"不能小于 {field.min_value}"})
+        if field.exclusive_min is not None and value <= field.exclusive_min:
+            errors.append({"path": path, "message": f"应大于 {field.exclusive_min}"})
+        if item_check is not None:
+            for i, item in enumerate(value):
+                item_check(item, f"{path}[{i}]", errors)
+        if object_check is not None:
+            object_check(value, path, errors)
+
+    return check
+
+
+def compile_schema(schema):
+    """将模式字典编译为 validate(value, path, errors) 闭包"""
+    checks = [(name, field.required, _compile_field(field)) for name, field in schema.items()]
+
+    def validate(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append({"path": path, "message": f"应为对象，实际为 {type(value).__name__}"})
+            return
+        for name, required, check in checks:
+            field_path = f"{path}.{name}"
+            if name not in value:
+                if required:
+                    errors.append({"path": field_path, "message": "缺少必填字段"})
+                continue
+            check(value[name], field_path, errors)
+
+    return validate
+
+
+LOCATION_SCHEMA = {
+    'latitude': Field(NUMBER),
+    'longitude': Field(NUMBER),
+}
+
+DOCK_SCHEMA = {
+    'dock_id': Field(IDENTIFIER),
+    'outbound_efficiency': Field(NUMBER, exclusive_min=0),  # 作业时长按 载货量 / 效率 计算，不能为 0
+    'inbound_efficiency': Field(NUMBER, exclusive_min=0),
+    'weight': Field(NUMBER, nullable=True),
+    'dock_type': Field(int, choices=(1, 2, 3)),  # 1=装货，2=卸货，3=通用
+    'compatible_carriage': Field(list, items=Field(IDENTIFIER)),
+}
+
+WAREHOUSE_SCHEMA = {
+    'warehouse_id': Field(IDENTIFIER),
+    'location': Field(dict, required=False, nullable=True, schema=LOCATION_SCHEMA),
+    'docks': Field(list, items=Field(dict, schema=DOCK_SCHEMA)),
+}
+
+WAREHOUSE_LOAD_SCHEMA = {
+    'warehouse_id': Field(IDENTIFIER),
+    'load': Field(NUMBER, min_value=0),
+    'item_code': Field(IDENTIFIER, required=False, nullable=True),
+    'loadUnloadStatus': Field(int, required=False, nullable=True, choices=(1, 2)),  # 1=装货，2=卸货
+    'sequence': Field(int, required=False, nullable=True),
+}
+
+
+def _order_schema(carriage_required):
+    return {
+        'order_id': Field(IDENTIFIER),
+        'warehouse_loads': Field(list, items=Field(dict, schema=WAREHOUSE_LOAD_SCHEMA)),
+        'priority': Field(NUMBER, nullable=True),
+        'sequential': Field(bool, nullable=True),
+        'required_carriage': Field(IDENTIFIER, required=carriage_required, nullable=not carriage_required,
+                                   non_empty=carriage_required),
+        'order_type': Field(int, choices=(1, 2)),
+    }
+
+
+VEHICLE_SCHEMA = {
+    'vehicle_id': Field(IDENTIFIER),
+    'location': Field(dict, schema=LOCATION_SCHEMA),
+    'vehicle_state': Field(int),
+    'vehicle_workload': Field(NUMBER),
+}
+
+CARRIAGE_SCHEMA = {
+    'carriage_id': Field(IDENTIFIER),
+    'location': Field(dict, schema=LOCATION_SCHEMA),
+    'carriage_type': Field(IDENTIFIER),
+    'carriage_state': Field(int),
+    'current_dock_id': Field(IDENTIFIER, nullable=True),
+    'current_warehouse_id': Field(IDENTIFIER, required=False, nullable=True),
+}
+
+ORDER_CARRIAGE_INFO_SCHEMA = {
+    'order_id': Field(IDENTIFIER),
+    'required_carriage': Field(IDENTIFIER, non_empty=True),
+    'order_type': Field(int, choices=(1, 2)),
+    'carriage_id': Field(IDENTIFIER, nullable=True),
+    'carriage_location': Field(dict, schema=LOCATION_SCHEMA),
+    'next_warehouse': Field(dict, required=False, schema=WAREHOUSE_SCHEMA),
+    'next_warehouse_id': Field(IDENTIFIER, required=False),  # 引用 topology 中的仓库，代替 next_warehouse
+    'perform_vehicle_matching': Field(bool, required=False),
+    'perform_dock_matching': Field(bool, required=False),
+    'add_cx_task': Field(bool, required=False, nullable=True),
+    'sort_no': Field(NUMBER, required=False, nullable=True),
+    'current_dock_id': Field(IDENTIFIER, required=False, nullable=True),
+    'load': Field(NUMBER, required=False, min_value=0),
+}
+
+# 已登记布局的引用（见 topology.py），version 为空时使用最新版本
+TOPOLOGY_REF_SCHEMA = {
+    'topology_id': Field(str, non_empty=True),
+    'version': Field(int, required=False, nullable=True, min_value=1),
+}
+
+# 仓库信息二选一：warehouses 为完整定义，topology 引用已登记的布局
+WAREHOUSES_FIELD = Field(list, required=False, items=Field(dict, schema=WAREHOUSE_SCHEMA))
+TOPOLOGY_FIELD = Field(dict, required=False, schema=TOPOLOGY_REF_SCHEMA)
+
+# 外部订单不强制 required_carriage（模型中 None 视为全部兼容），内部订单和甩挂调度必须提供
+# deadline_ms 为从收到请求起的求解截止时间（毫秒），不提供时不限时
+validate_external_payload = compile_schema({
+    'orders': Field(list, items=Field(dict, schema=_order_schema(carriage_required=False))),
+    'warehouses': WAREHOUSES_FIELD,
+    'topology': TOPOLOGY_FIELD,
+    'deadline_ms': Field(NUMBER, required=False, nullable=True, min_value=0),
+})
+
+# NDJSON 流式外部订单请求：首行仓库信息（可带 deadline_ms），之后每行一个订单
+validate_external_stream_header = compile_schema({
+    'warehouses': WAREHOUSES_FIELD,
+    'topology': TOPOLOGY_FIELD,
+    'deadline_ms': Field(NUMBER, required=False, nullable=True, min_value=0),
+})
+validate_external_order = compile_schema(_order_schema(carriage_required=False))
+
+validate_internal_payload = compile_schema({
+    'orders': Field(list, items=Field(dict, schema=_order_schema(carriage_required=True))),
+    'warehouses': WAREHOUSES_FIELD,
+    'topology': TOPOLOGY_FIELD,
+    'vehicles': Field(list, items=Field(dict, schema=VEHICLE_SCHEMA)),
+    'carriages': Field(list, items=Field(dict, schema=CARRIAGE_SCHEMA)),
+})
+
+validate_drop_pull_payload = compile_schema({
+    'order_carriage_info': Field(list, items=Field(dict, schema=ORDER_CARRIAGE_INFO_SCHEMA)),
+    'vehicles': Field(list, items=Field(dict, schema=VEHICLE_SCHEMA)),
+    'batch_matching': Field(bool, required=False),
+    'topology': TOPOLOGY_FIELD,
+})
+
+# 布局登记：POST /topologies/<布局ID> 的请求体
+validate_topology_upload = compile_schema({
+    'warehouses': Field(list, items=Field(dict, schema=WAREHOUSE_SCHEMA)),
+})
+
+# 实际作业反馈：POST /schedule_feedback 的请求体，时间格式为 YYYY-MM-DD HH:MM:SS
+FEEDBACK_EVENT_SCHEMA = {
+    'order_id': Field(IDENTIFIER),
+    'warehouse_id': Field(IDENTIFIER),
+    'dock_id': Field(IDENTIFIER),
+    'actual_start': Field(str, required=False, nullable=True),
+    'actual_end': Field(str, required=False, nullable=True),
+    'cancelled': Field(bool, required=False),
+}
+
+validate_feedback_payload = compile_schema({
+    'schedule': Field(str, required=False, choices=('external', 'internal', 'dropPull')),
+    'events': Field(list, items=Field(dict, schema=FEEDBACK_EVENT_SCHEMA)),
+    'shift_remaining': Field(bool, required=False),  # 是否把受影响月台上尚未开始的时段提前
+})
+FEEDBACK_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+FEEDBACK_CLOCK_SKEW = timedelta(minutes=1)  # 实际时间允许晚于服务器当前时间的误差
+
+
+def _check_unique(items, key, path, errors):
+    seen = set()
+    for i, item in enumerate(items):
+        value = item.get(key)
+        if value in seen:
+            errors.append({"path": f"{path}[{i}].{key}", "message": f"重复的 {key}: {value!r}"})
+        seen.add(value)
+
+
+def _check_warehouse_source(record, path, errors):
+    if ('warehouses' in record) == ('topology' in record):
+        errors.append({"path": path, "message": "warehouses 与 topology 必须且只能提供一个"})
+
+
+def _check_stream_header(record, path, errors):
+    # 整个请求体误发到流式接口时，第一行带 orders 会被当作表头，订单被静默丢弃
+    if isinstance(record, dict) and 'orders' in record:
+        errors.append({"path": f"{path}.orders",
+                       "message": "订单应逐行提交：第一行只包含 warehouses（或 topology）与 deadline_ms，之后每行一个订单"})
+
+
+def _check_drop_pull_warehouses(data, errors):
+    for i, info in enumerate(data['order_carriage_info']):
+        path = f"$.order_carriage_info[{i}]"
+        if ('next_warehouse' in info) == ('next_warehouse_id' in info):
+            errors.append({"path": path, "message": "next_warehouse 与 next_warehouse_id 必须且只能提供一个"})
+        elif 'next_warehouse_id' in info and 'topology' not in data:
+            errors.append({"path": f"{path}.next_warehouse_id", "message": "使用 next_warehouse_id 时必须提供 topology"})
+
+
+# SECTION 解析与批量构建
+def parse_payload(raw):
+    """解析原始请求体（bytes/str），解析失败抛出 PayloadValidationError"""
+    if not raw:
+        raise PayloadValidationError([{"path": "$", "message": "请求体为空"}])
+    try:
+        return loads(raw)
+    except ValueError as e:
+        raise PayloadValidationError([{"path": "$", "message": f"JSON 解析失败: {e}"}])
+
+
+def _validate(validator, data, warehouse_source=False):
+    """:param warehouse_source: 是否检查 warehouses 与 topology 二选一"""
+    errors = []
+    validator(data, "$", errors)
+    if not errors and isinstance(data, dict):
+        if warehouse_source:
+            _check_warehouse_source(data, "$", errors)
+        if 'orders' in data:
+            _check_unique(data['orders'], 'order_id', "$.orders", errors)
+        if 'warehouses' in data:
+            _check_unique(data['warehouses'], 'warehouse_id', "$.warehouses", errors)
+    if errors:
+        raise PayloadValidationError(errors)
+
+
+def build_dock(d):
+    return Dock(d['dock_id'], d['outbound_efficiency'], d['inbound_efficiency'], d.get('weight'), d['dock_type'],
+                d['compatible_carriage'])
+
+
+def build_warehouse(w):
+    return Warehouse(w['warehouse_id'], [build_dock(d) for d in w['docks']], w.get('location'))
+
+
+def build_order(o):
+    return Order(o['order_id'], o['warehouse_loads'], o.get('priority'), o.get('sequential'),
+                 o.get('required_carriage'), o['order_type'])
+
+
+def build_vehicle(v):
+    return Vehicle(v['vehicle_id'], v['location'], v['vehicle_state'], v['vehicle_workload'])
+
+
+def build_carriage(c):
+    return Carriage(c['carriage_id'], c['location'], c['carriage_type'], c['carriage_state'], c['current_dock_id'],
+                    c.get('current_warehouse_id'))
+
+
+def _decode_warehouses(record, path, resolve_topology):
+    """完整定义的仓库逐个构建；引用已登记布局时返回其共享的仓库列表（TopologyWarehouses，不可修改）"""
+    if 'topology' not in record:
+        return [build_warehouse(w) for w in record['warehouses']]
+    if resolve_topology is None:
+        raise PayloadValidationError([{"path": f"{path}.topology", "message": "未启用布局登记"}])
+    return resolve_topology(record['topology'], f"{path}.topology").warehouses
+
+
+def decode_external_request(data, resolve_topology=None):
+    """
+    校验外部订单请求并构建 (warehouses, orders)
+
+    :param resolve_topology: 布局解析函数 resolve(reference, path)（见 TopologyRegistry.resolver），
+                             请求引用 topology 时使用
+    """
+    _validate(validate_external_payload, data, warehouse_source=True)
+    warehouses = _decode_warehouses(data, "$", resolve_topology)
+    orders = [build_order(o) for o in data['orders']]
+    return warehouses, orders
+
+
+def decode_internal_request(data, resolve_topology=None):
+    """校验内部订单请求并构建 (warehouses, orders, vehicles, carriages)，resolve_topology 同 decode_external_request"""
+    _validate(validate_internal_payload, data, warehouse_source=True)
+    warehouses = _decode_warehouses(data, "$", resolve_topology)
+    orders = [build_order(o) for o in data['orders']]
+    vehicles = [build_vehicle(v) for v in data['vehicles']]
+    carriages = [build_carriage(c) for c in data['carriages']]
+    return warehouses, orders, vehicles, carriages
+
+
+def decode_external_stream(lines, max_errors=100, resolve_topology=None):
+    """
+    逐行解码 NDJSON 格式的外部订单请求：第一行为 {"warehouses": [...], "deadline_ms": ...}
+    （或以 "topology" 引用已登记的布局），之后每行一个订单对象。
+
+    每行解析校验后立即构建领域对象并丢弃原始数据，内存占用只与订单对象本身相关。
+    :param lines: 可迭代的字节串/字符串行，如 request.stream
+    :param max_errors: 收集的错误数上限，超过后停止校验
+    :param resolve_topology: 同 decode_external_request
+    :return: (warehouses, orders, deadline_ms)
+    """
+    errors = []
+    warehouses = None
+    deadline_ms = None
+    orders = []
+    order_ids = set()
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        path = f"$[{line_no}]"
+        try:
+            record = loads(line)
+        except ValueError as e:
+            errors.append({"path": path, "message": f"JSON 解析失败: {e}"})
+        else:
+            if warehouses is None:
+                record_errors = []
+                validate_external_stream_header(record, path, record_errors)
+                _check_stream_header(record, path, record_errors)
+                if not record_errors:
+                    _check_warehouse_source(record, path, record_errors)
+                if not record_errors and 'warehouses' in record:
+                    _check_unique(record['warehouses'], 'warehouse_id', f"{path}.warehouses", record_errors)
+                if not record_errors:
+                    try:
+                        warehouses = _decode_warehouses(record, path, resolve_topology)
+                    except PayloadValidationError as e:
+                        record_errors.extend(e.errors)
+                errors.extend(record_errors)
+                if record_errors:
+                    warehouses = []
+                deadline_ms = None if record_errors else record.get('deadline_ms')
+            else:
+                record_errors = []
+                validate_external_order(record, path, record_errors)
+                if not record_errors and record['order_id'] in order_ids:
+                    record_errors.append({"path": f"{path}.order_id",
+                                          "message": f"重复的 order_id: {record['order_id']!r}"})
+                errors.extend(record_errors)
+                if not record_errors:
+                    order_ids.add(record['order_id'])
+                    orders.append(build_order(record))
+        if len(errors) >= max_errors:
+            errors.append({"path": path, "message": f"错误超过 {max_errors} 条，停止校验"})
+            break
+
+    if warehouses is None and not errors:
+        errors.append({"path": "$", "message": "请求体为空"})
+    if errors:
+        raise PayloadValidationError(errors)
+    return warehouses, orders, deadline_ms
+
+
+def decode_drop_pull_request(data, resolve_topology=None):
+    """
+    校验甩挂调度请求，领域对象由 parse_order_carriage_info 构建。
+
+    :param resolve_topology: 同 decode_external_request，订单以 next_warehouse_id 引用布局中的仓库时使用
+    :return: (data, topology)，未引用布局时 topology 为 None
+    """
+    _validate(validate_drop_pull_payload, data)
+    errors = []
+    _check_drop_pull_warehouses(data, errors)
+    if errors:
+        raise PayloadValidationError(errors)
+    if 'topology' not in data:
+        return data, None
+    if resolve_topology is None:
+        raise PayloadValidationError([{"path": "$.topology", "message": "未启用布局登记"}])
+    topology = resolve_topology(data['topology'], "$.topology")
+    for i, info in enumerate(data['order_carriage_info']):
+        if 'next_warehouse_id' in info and info['next_warehouse_id'] not in topology.by_id:
+            errors.append({"path": f"$.order_carriage_info[{i}].next_warehouse_id",
+                           "message": f"布局 {topology.id} 版本 {topology.version} 中不存在仓库 "
+                                      f"{info['next_warehouse_id']!r}"})
+    if errors:
+        raise PayloadValidationError(errors)
+    return data, topology
+
+
+def decode_feedback_request(data):
+    """
+    校验实际作业反馈请求，时间解析为 datetime。
+
+    :return: (schedule, events, shift_remaining)，schedule 为 external/internal/dropPull
+    """
+    _validate(validate_feedback_payload, data)
+    errors = []
+    latest = datetime.now() + FEEDBACK_CLOCK_SKEW
+    events = []
+    for i, event in enumerate(data['events']):
+        path = f"$.events[{i}]"
+        event = dict(event)
+        for name in ('actual_start', 'actual_end'):
+            if event.get(name) is None:
+                continue
+            try:
+                event[name] = datetime.strptime(event[name], FEEDBACK_TIME_FORMAT)
+            except ValueError:
+                errors.append({"path": f"{path}.{name}", "message": f"时间格式应为 YYYY-MM-DD HH:MM:SS: {event[name]!r}"})
+                continue
+            if event[name] > latest:
+                errors.append({"path": f"{path}.{name}", "message": "实际时间不能晚于当前时间"})
+        reported = event.get('actual_start') is not None or event.get('actual_end') is not None
+        if event.get('cancelled') and reported:
+            errors.append({"path": path, "message": "取消的作业不能同时带实际开始或完成时间"})
+        elif not event.get('cancelled') and not reported:
+            errors.append({"path": path, "message": "缺少 actual_start、actual_end 或 cancelled"})
+        elif isinstance(event.get('actual_start'), datetime) and isinstance(event.get('actual_end'), datetime) \
+                and event['actual_end'] < event['actual_start']:
+            errors.append({"path": f"{path}.actual_end", "message": "实际完成时间不能早于实际开始时间"})
+        events.append(event)
+    if errors:
+        raise PayloadValidationError(errors)
+    return data.get('schedule', 'external'), events, data.get('shift_remaining', False)
+
+
+def decode_topology_upload(data):
+    """校验布局登记请求，返回仓库定义列表"""
+    _validate(validate_topology_upload, data)
+    return data['warehouses']
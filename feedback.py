@@ -0,0 +1,113 @@
+"""
+实际作业反馈。
+
+调度文件中的时段是规划结果，车辆实际提前完成、晚到或取消后，原时段仍占用月台，直到 7 天后被清理，
+使后续请求的忙碌窗口（calculate_busy_times_and_windows）偏多，排队模型中的重叠 0-1 变量随之增加。
+现场按 (订单, 仓库, 月台) 上报实际开始、实际完成或取消后：
+- 取消：删除该时段；
+- 实际完成：结束时间改为实际完成时间（已完成的时段不再出现在忙碌窗口中）；
+- 实际开始：开始时间改为实际开始时间，未上报完成时按原计划时长推算结束时间；
+- shift_remaining：完成提前或取消而空出时间的月台上，尚未开始的时段按原顺序依次提前，
+  不与同一订单在其他月台的时段重叠，也不早于该订单原本排在它之前的时段结束。
+读-改-写在调度文件锁内完成，写入后通知监听器清除相关缓存。
+"""
+from datetime import timedelta
+
+from common import notify_schedule_changed, pd
+from heuristics import earliest_gap
+from schedule_store import atomic_write_csv, schedule_lock
+
+COLUMNS = ["Order ID", "Warehouse ID", "Dock ID", "Start Time", "End Time"]
+
+
+def _minutes(time, now):
+    return (time - now).total_seconds() / 60
+
+
+def _shift_remaining(schedule, docks, reported, now):
+    """把 docks 上开始时间晚于 now 且本次未上报的时段依次提前，返回提前的时段数"""
+    shifted = 0
+    order_ids = schedule['Order ID'].astype(str)
+    for warehouse_id, dock_id in docks:
+        on_dock = schedule[(schedule['Warehouse ID'].astype(str) == warehouse_id) &
+                           (schedule['Dock ID'].astype(str) == dock_id)].sort_values('Start Time')
+        cursor = 0.0  # 以 now 为零点的分钟数
+        for row in on_dock.index:
+            start = _minutes(schedule.at[row, 'Start Time'], now)
+            end = _minutes(schedule.at[row, 'End Time'], now)
+            if row in reported or start <= 0:
+                cursor = max(cursor, end)
+                continue
+            others = schedule[(order_ids == order_ids[row]) & (schedule.index != row)]
+            blocked = [(_minutes(other_start, now), _minutes(other_end, now))
+                       for other_start, other_end in zip(others['Start Time'], others['End Time'])]
+            # 保持同一订单各时段的先后顺序（按序路线）
+            ready = max([cursor] + [other_end for _, other_end in blocked if other_end <= start])
+            new_start = earliest_gap(ready, end - start, blocked)
+            if new_start < start:
+                shift = timedelta(seconds=round((start - new_start) * 60))
+                schedule.at[row, 'Start Time'] -= shift
+                schedule.at[row, 'End Time'] -= shift
+                shifted += 1
+            cursor = max(cursor, _minutes(schedule.at[row, 'End Time'], now))
+    return shifted
+
+
+def apply_feedback(filename, events, shift_remaining=False, now=None):
+    """
+    按实际作业反馈更新调度文件。
+
+    :param events: decode_feedback_request 解析后的事件列表
+    :param now: 当前时间，默认为 datetime.now()，用于判断时段是否已开始
+    :return: {"updated", "cancelled", "shifted", "not_found"}，not_found 为调度文件中找不到时段的事件
+    """
+    if now is None:
+        now = pd.Timestamp.now().floor('s')
+    result = {"updated": 0, "cancelled": 0, "shifted": 0, "not_found": []}
+    with schedule_lock(filename):
+        try:
+            schedule = pd.read_csv(filename, encoding='utf-8')
+        except FileNotFoundError:
+            schedule = pd.DataFrame(columns=COLUMNS)
+        schedule['Start Time'] = pd.to_datetime(schedule['Start Time'])
+        schedule['End Time'] = pd.to_datetime(schedule['End Time'])
+        rows = {key: row for row, key in zip(schedule.index, zip(
+            schedule['Order ID'].astype(str), schedule['Warehouse ID'].astype(str), schedule['Dock ID'].astype(str)))}
+
+        cancelled, reported, freed_docks, changed = [], set(), set(), set()
+        for i, event in enumerate(events):
+            key = (str(event['order_id']), str(event['warehouse_id']), str(event['dock_id']))
+            row = rows.get(key)
+            if row is None:
+                result["not_found"].append({"path": f"$.events[{i}]", "order_id": event['order_id'],
+                                            "warehouse_id": event['warehouse_id'], "dock_id": event['dock_id'],
+                                            "message": "调度文件中没有该订单在此月台的时段"})
+                continue
+            reported.add(row)
+            changed.add(row)
+            planned_start, planned_end = schedule.at[row, 'Start Time'], schedule.at[row, 'End Time']
+            if event.get('cancelled'):
+                cancelled.append(row)
+                freed_docks.add(key[1:])
+                continue
+            start = planned_start if event.get('actual_start') is None else pd.Timestamp(event['actual_start'])
+            if event.get('actual_end') is not None:
+                end = pd.Timestamp(event['actual_end'])
+            else:
+                end = start + (planned_end - planned_start)
+            if end < planned_end:
+                freed_docks.add(key[1:])
+            schedule.at[row, 'Start Time'], schedule.at[row, 'End Time'] = start, end
+            result["updated"] += 1
+
+        if changed:
+            changed_slots = schedule.loc[sorted(changed)]
+            schedule = schedule.drop(index=cancelled)
+            result["cancelled"] = len(cancelled)
+            if shift_remaining and freed_docks:
+                result["shifted"] = _shift_remaining(schedule, sorted(freed_docks), reported, now)
+            schedule = schedule.sort_values(by='Start Time', ascending=False)
+            atomic_write_csv(schedule, filename)
+    if changed:
+        notify_schedule_changed(filename, changed_slots)
+    return result
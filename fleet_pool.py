@@ -0,0 +1,90 @@
+class FleetPool:
+    """
+    车厢与车辆的索引池。
+
+    车厢按 (月台, 车型, 状态)、(车型, 状态)、(月台, 状态) 建立索引，车辆按状态建立索引；
+    通过 claim/release 修改状态时同步维护所有索引，查询与状态变更均为 O(1)。
+    状态约定与原有代码一致：0=空闲，1=已占用。
+    """
+
+    def __init__(self, carriages=None, vehicles=None):
+        self.carriages = list(carriages or [])
+        self.vehicles = list(vehicles or [])
+        # 索引值使用 dict 充当有序集合，保持请求中的原始顺序，删除为 O(1)
+        self._carriages_by_dock_type_state = {}
+        self._carriages_by_type_state = {}
+        self._carriages_by_dock_state = {}
+        self._vehicles_by_state = {}
+        self.total_workload = 0
+
+        for carriage in self.carriages:
+            self._index_carriage(carriage)
+        for vehicle in self.vehicles:
+            self._vehicles_by_state.setdefault(vehicle.state, {})[vehicle] = None
+            self.total_workload += vehicle.workload
+
+    # 车厢索引维护
+    def _carriage_keys(self, carriage):
+        return ((self._carriages_by_dock_type_state, (carriage.current_dock_id, carriage.type, carriage.state)),
+                (self._carriages_by_type_state, (carriage.type, carriage.state)),
+                (self._carriages_by_dock_state, (carriage.current_dock_id, carriage.state)))
+
+    def _index_carriage(self, carriage):
+        for index, key in self._carriage_keys(carriage):
+            index.setdefault(key, {})[carriage] = None
+
+    def _unindex_carriage(self, carriage):
+        for index, key in self._carriage_keys(carriage):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(carriage, None)
+                if not bucket:
+                    del index[key]
+
+    def set_carriage_state(self, carriage, state):
+        self._unindex_carriage(carriage)
+        carriage.state = state
+        self._index_carriage(carriage)
+
+    def claim_carriage(self, carriage):
+        self.set_carriage_state(carriage, 1)
+
+    def release_carriage(self, carriage):
+        self.set_carriage_state(carriage, 0)
+
+    # 车辆索引维护
+    def set_vehicle_state(self, vehicle, state):
+        bucket = self._vehicles_by_state.get(vehicle.state)
+        if bucket is not None:
+            bucket.pop(vehicle, None)
+        vehicle.state = state
+        self._vehicles_by_state.setdefault(state, {})[vehicle] = None
+
+    def claim_vehicle(self, vehicle):
+        self.set_vehicle_state(vehicle, 1)
+
+    def release_vehicle(self, vehicle):
+        self.set_vehicle_state(vehicle, 0)
+
+    # 查询
+    def find_idle_carriage_at_dock(self, dock_id, carriage_type):
+        """返回停靠在该月台、车型符合且空闲的第一个车厢，没有则返回 None"""
+        bucket = self._carriages_by_dock_type_state.get((dock_id, carriage_type, 0))
+        return next(iter(bucket), None) if bucket else None
+
+    def has_conflicting_idle_carriage(self, dock_id, carriage_type):
+        """该月台上是否停有车型不符的空闲车厢"""
+        idle_at_dock = len(self._carriages_by_dock_state.get((dock_id, 0), ()))
+        idle_matching = len(self._carriages_by_dock_type_state.get((dock_id, carriage_type, 0), ()))
+        return idle_at_dock > idle_matching
+
+    def idle_carriages(self, carriage_type):
+        return list(self._carriages_by_type_state.get((carriage_type, 0), ()))
+
+    def idle_vehicles(self):
+        return list(self._vehicles_by_state.get(0, ()))
+
+    def average_workload(self):
+        if not self.vehicles:
+            return 0  # 如果列表为空，返回 0
+        return self.total_workload / len(self.vehicles)
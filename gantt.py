@@ -0,0 +1,184 @@
+"""
+调度文件的甘特图渲染（无界面，服务端使用）。
+
+不经过 pyplot 全局状态，直接创建 Figure + Agg 画布；全部时段合并为一个 PolyCollection 绘制，
+月台行号与订单颜色均通过 pandas 向量化计算，数千个时段也只需一次绘制调用。
+
+渲染结果按 (调度文件, 文件版本, 参数) 缓存，文件版本取修改时间与大小，其他 worker 写入调度文件后版本随之变化；
+本进程写入时通过调度文件变更监听器立即清除该文件的缓存。
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from common import register_schedule_listener, pd
+from decoding import PayloadValidationError
+
+SCHEDULE_FILES = {
+    'external': 'local_schedule.csv',
+    'internal': 'internal_schedule.csv',
+    'dropPull': 'DropPull_schedule.csv',
+}
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+LABEL_LIMIT = 300  # 时段数不超过该值时在色块上标注订单号
+TICK_LIMIT = 120  # 月台行数超过该值时纵轴标签抽稀
+
+
+def parse_gantt_params(args):
+    """
+    解析查询参数：schedule（external/internal/dropPull）、format（png/svg）、start、end（YYYY-MM-DD HH:MM:SS）、
+    warehouse_ids（逗号分隔）。校验失败抛出 PayloadValidationError。
+
+    :return: 参数字典，可作为缓存键的一部分
+    """
+    errors = []
+    schedule = args.get('schedule', 'external')
+    if schedule not in SCHEDULE_FILES:
+        errors.append({"path": "schedule", "message": f"取值应为 {'/'.join(SCHEDULE_FILES)}"})
+    fmt = args.get('format', 'png')
+    if fmt not in FORMATS:
+        errors.append({"path": "format", "message": f"取值应为 {'/'.join(FORMATS)}"})
+    times = {}
+    for name in ('start', 'end'):
+        value = args.get(name)
+        if value:
+            try:
+                times[name] = datetime.strptime(value, TIME_FORMAT)
+            except ValueError:
+                errors.append({"path": name, "message": f"时间格式应为 YYYY-MM-DD HH:MM:SS: {value!r}"})
+    if 'start' in times and 'end' in times and times['start'] >= times['end']:
+        errors.append({"path": "end", "message": "结束时间应晚于开始时间"})
+    if errors:
+        raise PayloadValidationError(errors)
+    warehouse_ids = args.get('warehouse_ids')
+    return {
+        "schedule": schedule,
+        "format": fmt,
+        "start": times.get('start'),
+        "end": times.get('end'),
+        "warehouse_ids": tuple(sorted(w.strip() for w in warehouse_ids.split(',') if w.strip()))
+        if warehouse_ids else None,
+    }
+
+
+def load_slots(filename, start=None, end=None, warehouse_ids=None):
+    """读取调度文件中与时间范围相交、属于指定仓库的时段，按仓库、月台、开始时间排序"""
+    try:
+        schedule = pd.read_csv(filename, encoding='utf-8', dtype={'Warehouse ID': str, 'Dock ID': str})
+    except FileNotFoundError:
+        schedule = pd.DataFrame(columns=["Order ID", "Warehouse ID", "Dock ID", "Start Time", "End Time"])
+    schedule['Start Time'] = pd.to_datetime(schedule['Start Time'])
+    schedule['End Time'] = pd.to_datetime(schedule['End Time'])
+    mask = pd.Series(True, index=schedule.index)
+    if start is not None:
+        mask &= schedule['End Time'] > start
+    if end is not None:
+        mask &= schedule['Start Time'] < end
+    if warehouse_ids:
+        mask &= schedule['Warehouse ID'].isin(warehouse_ids)
+    return schedule[mask].sort_values(['Warehouse ID', 'Dock ID', 'Start Time'], ignore_index=True)
+
+
+def render_gantt(slots, fmt='png', start=None, end=None, title=None):
+    """
+    将时段绘制为甘特图，每个仓库-月台一行。
+
+    :return: 图片字节
+    """
+    import matplotlib
+    from matplotlib.collections import PolyCollection
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import matplotlib.dates as mdates
+    import numpy as np
+
+    dock_labels = 'W' + slots['Warehouse ID'].astype(str) + '-D' + slots['Dock ID'].astype(str)
+    rows, labels = pd.factorize(dock_labels, sort=False)  # slots 已按仓库、月台排序，行号即排序后的顺序
+    x0 = mdates.date2num(slots['Start Time'].to_numpy())
+    x1 = mdates.date2num(slots['End Time'].to_numpy())
+    y = rows.astype(float)
+
+    figure = Figure(figsize=(16, min(max(2 + 0.25 * len(labels), 3), 60)), dpi=100)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    if len(slots):
+        vertices = np.stack([np.column_stack([x0, y - 0.4]), np.column_stack([x1, y - 0.4]),
+                             np.column_stack([x1, y + 0.4]), np.column_stack([x0, y + 0.4])], axis=1)
+        palette = np.array(matplotlib.colormaps['tab20'].colors)
+        order_codes, _ = pd.factorize(slots['Order ID'].astype(str))
+        ax.add_collection(PolyCollection(vertices, facecolors=palette[order_codes % len(palette)],
+                                         edgecolors='white' if len(slots) <= LABEL_LIMIT else 'none',
+                                         linewidths=0.5))
+        if len(slots) <= LABEL_LIMIT:
+            for order_id, xc, yc in zip(slots['Order ID'], (x0 + x1) / 2, y):
+                ax.text(xc, yc, str(order_id), ha='center', va='center', fontsize=7, clip_on=True)
+        left = mdates.date2num(start) if start is not None else x0.min()
+        right = mdates.date2num(end) if end is not None else x1.max()
+        ax.set_xlim(left, right)
+    else:
+        ax.text(0.5, 0.5, 'No slots', ha='center', va='center', transform=ax.transAxes)
+    ax.set_ylim(len(labels) - 0.5, -0.5)
+    step = max(len(labels) // TICK_LIMIT, 1)
+    ax.set_yticks(range(0, len(labels), step))
+    ax.set_yticklabels(labels[::step], fontsize=7)
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M'))
+    ax.grid(True, axis='x', alpha=0.3)
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Warehouse-Dock")
+    if title:
+        ax.set_title(title)
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def schedule_version(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class GanttCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # (文件绝对路径, 版本, 参数) -> 图片
+        self._lock = threading.Lock()
+
+    def render(self, filename, params):
+        """返回 (图片字节, 是否命中缓存)"""
+        key = (os.path.abspath(filename), schedule_version(filename), tuple(sorted(params.items())))
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                return image, True
+
+        slots = load_slots(filename, params['start'], params['end'], params['warehouse_ids'])
+        image = render_gantt(slots, params['format'], params['start'], params['end'],
+                             title=f"{params['schedule']} schedule ({len(slots)} slots)")
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = image
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return image, False
+
+    def invalidate(self, filename, dock_keys):
+        path = os.path.abspath(filename)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                del self._entries[key]
+
+
+def create_gantt_cache(maxsize):
+    cache = GanttCache(maxsize)
+    register_schedule_listener(cache.invalidate)
+    return cache
@@ -0,0 +1,19 @@
+# gunicorn -c gunicorn.conf.py wsgi:application
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config as service_config  # noqa: E402  (模块名 config 与 gunicorn 配置项同名)
+from metrics import clear_metrics  # noqa: E402
+
+bind = service_config.BIND
+workers = service_config.WORKERS
+worker_class = 'sync'  # CBC 求解为 CPU 密集型，每个进程同一时间只处理一个请求
+timeout = service_config.env_int('NP_WORKER_TIMEOUT', 600)  # 大批量订单求解可能耗时较长
+preload_app = False  # 每个 worker 独立导入应用，避免 fork 后共享求解器状态
+
+
+def on_starting(server):
+    # 清理上一次运行遗留的 worker 指标文件
+    clear_metrics(service_config.METRICS_DIR)
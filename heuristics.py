@@ -0,0 +1,158 @@
+"""
+不调用求解器的外部订单规划，用于截止时间不足以求解 MIP 的请求，结果格式与两阶段规划一致。
+
+- 月台分配：按订单总作业量从大到小，逐个仓库选择完成时间最早的兼容月台（LPT 列表调度），
+  再把完成最晚的月台上的作业移到同仓库其他兼容月台，直到最迟完成时间不再下降；
+- 排队规划：与排队模型相同的优先关系（月台队列按优先级、按序订单按路径），作业按可开始时间依次排入，
+  放在不与月台忙碌窗口及本订单其他作业重叠的最早时段。得到的是排队模型的一个可行解，未必最优。
+"""
+import heapq
+import itertools
+
+from common import pulp
+from lp import queue_processing_times
+from problem_table import ProblemTable
+
+TOLERANCE = 1e-6
+
+
+def greedy_dock_assignment(orders, warehouses, total_busy_time=None, problem_table=None):
+    """
+    :param total_busy_time: 月台已占用总时长 {(仓库ID, 月台ID): 分钟}
+    :return: (order_dock_assignments, latest_completion_time)，格式与 parse_optimization_result 一致
+    """
+    if total_busy_time is None:
+        total_busy_time = {}
+    table = problem_table or ProblemTable(orders, warehouses)
+    completion = {(warehouse.id, dock.id): total_busy_time.get((warehouse.id, dock.id), 0)
+                  for warehouse in warehouses for dock in warehouse.docks}
+    order_dock_assignments = {}
+    for i in sorted(range(len(orders)), key=lambda i: -table.loads[i].sum()):
+        order = orders[i]
+        for w, warehouse in enumerate(warehouses):
+            load = table.loads[i, w]
+            if load <= 0:
+                continue
+            candidates = [dock for d, dock in zip(table.dock_range(warehouse.id), warehouse.docks)
+                          if table.compatible[i, d]]
+            if not candidates:
+                continue
+            best = min(candidates, key=lambda dock: completion[warehouse.id, dock.id] + load / dock.efficiency)
+            completion[warehouse.id, best.id] += load / best.efficiency
+            order_dock_assignments.setdefault(order.id, {})[warehouse.id] = best.id
+    return order_dock_assignments, max(completion.values(), default=0)
+
+
+def improve_dock_assignment(orders, warehouses, order_dock_assignments, total_busy_time=None, problem_table=None,
+                            max_moves=1000):
+    """
+    局部搜索改进月台分配：每次从完成最晚的月台移出一个作业，移到使其完成时间最早的同仓库兼容月台，
+    移动后该月台仍早于原最迟完成时间才接受。
+
+    :return: (order_dock_assignments, latest_completion_time)，原分配不被修改
+    """
+    if total_busy_time is None:
+        total_busy_time = {}
+    table = problem_table or ProblemTable(orders, warehouses)
+    assignments = {order_id: dict(docks) for order_id, docks in order_dock_assignments.items()}
+    docks = {(warehouse.id, dock.id): (w, d, dock) for w, warehouse in enumerate(warehouses)
+             for d, dock in zip(table.dock_range(warehouse.id), warehouse.docks)}
+    completion = {dock_key: total_busy_time.get(dock_key, 0) for dock_key in docks}
+    dock_ops = {dock_key: [] for dock_key in docks}
+    for order_id, warehouse_docks in assignments.items():
+        i = table.order_index[order_id]
+        for warehouse_id, dock_id in warehouse_docks.items():
+            w, _, dock = docks[warehouse_id, dock_id]
+            completion[warehouse_id, dock_id] += table.loads[i, w] / dock.efficiency
+            dock_ops[warehouse_id, dock_id].append(i)
+
+    for _ in range(max_moves):
+        critical = max(completion, key=completion.get)
+        warehouse_id = critical[0]
+        w = docks[critical][0]
+        best = None
+        for i in dock_ops[critical]:
+            for other in docks:
+                _, d, dock = docks[other]
+                if other[0] != warehouse_id or other == critical or not table.compatible[i, d]:
+                    continue
+                finish = completion[other] + table.loads[i, w] / dock.efficiency
+                if finish < completion[critical] - TOLERANCE and (best is None or finish < best[0]):
+                    best = (finish, i, other)
+        if best is None:
+            break
+        _, i, other = best
+        completion[critical] -= table.loads[i, w] / docks[critical][2].efficiency
+        completion[other] += table.loads[i, w] / docks[other][2].efficiency
+        dock_ops[critical].remove(i)
+        dock_ops[other].append(i)
+        assignments[orders[i].id][warehouse_id] = other[1]
+    return assignments, max(completion.values(), default=0)
+
+
+def heuristic_dock_assignment(orders, warehouses, total_busy_time=None, problem_table=None):
+    """贪心分配后做局部搜索改进，返回格式与 parse_optimization_result 一致"""
+    table = problem_table or ProblemTable(orders, warehouses)
+    order_dock_assignments, _ = greedy_dock_assignment(orders, warehouses, total_busy_time, table)
+    return improve_dock_assignment(orders, warehouses, order_dock_assignments, total_busy_time, table)
+
+
+def earliest_gap(ready, duration, blocked):
+    """不早于 ready、长度为 duration 且不与 blocked 中任一时段重叠的最早开始时间"""
+    start = ready
+    for blocked_start, blocked_end in sorted(blocked):
+        if start + duration <= blocked_start + TOLERANCE:
+            break
+        if blocked_end > start:
+            start = blocked_end
+    return start
+
+
+def greedy_queue_schedule(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows=None):
+    """
+    参数与 create_queue_model 一致。
+
+    :return: (start_times, end_times, status)，格式与 iter_queue_schedule 的每一项一致，排定全部作业时 status 为
+             Optimal（表示结果可直接采用）；优先关系成环（月台优先级与按序路径矛盾）时 status 为 Infeasible，环上作业不排定
+    """
+    if busy_windows is None:
+        busy_windows = {}
+    table = ProblemTable(orders, warehouses)
+    dock_queues, processing_times = queue_processing_times(orders, warehouses, order_dock_assignments, table)
+
+    successors = {op: [] for op in processing_times}
+    for (warehouse_id, dock_id), orders_in_dock in dock_queues.items():
+        for order, next_order in zip(orders_in_dock, orders_in_dock[1:]):
+            successors[order.id, warehouse_id, dock_id].append((next_order.id, warehouse_id, dock_id))
+    for order_id, expected_route in specific_order_route.items():
+        for prev_warehouse, curr_warehouse in zip(expected_route, expected_route[1:]):
+            successors[order_id, prev_warehouse, order_dock_assignments[order_id][prev_warehouse]].append(
+                (order_id, curr_warehouse, order_dock_assignments[order_id][curr_warehouse]))
+    in_degree = {op: 0 for op in processing_times}
+    for op in processing_times:
+        for successor in successors[op]:
+            in_degree[successor] += 1
+
+    # 按可开始时间依次排入，同一订单已排入的作业与月台忙碌窗口一样视为占用
+    ready_times = {op: 0.0 for op in processing_times}
+    order_slots = {}
+    start_times, end_times = {}, {}
+    counter = itertools.count()
+    heap = [(0.0, next(counter), op) for op, degree in in_degree.items() if degree == 0]
+    heapq.heapify(heap)
+    while heap:
+        ready, _, op = heapq.heappop(heap)
+        order_id, warehouse_id, dock_id = op
+        blocked = busy_windows.get((warehouse_id, dock_id), []) + order_slots.get(order_id, [])
+        start = earliest_gap(ready, processing_times[op], blocked)
+        start_times[op], end_times[op] = start, start + processing_times[op]
+        order_slots.setdefault(order_id, []).append((start, end_times[op]))
+        for successor in successors[op]:
+            ready_times[successor] = max(ready_times[successor], end_times[op])
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                heapq.heappush(heap, (ready_times[successor], next(counter), successor))
+
+    if len(end_times) < len(processing_times):
+        return start_times, end_times, pulp.LpStatus[pulp.LpStatusInfeasible]
+    return start_times, end_times, pulp.LpStatus[pulp.LpStatusOptimal]
@@ -1,28 +1,25 @@
-import copy
 from datetime import datetime, timedelta
 import random
 
-import pandas as pd
 from flask import jsonify
-from common import Warehouse, Dock, Order, Carriage, Vehicle, WarehouseLoad, generate_schedule, save_schedule_to_file, \
-    load_and_prepare_schedule
-from utils import haversine_distance, find_closest_vehicle
+from common import Warehouse, Dock, Order, Carriage, Vehicle, WarehouseLoad, generate_schedule, ScheduleUnitOfWork, pd
+from utils import find_closest_vehicle, find_closest_carriage
+from problem_table import ProblemTable
+from routing import sequence_stops
+import config
+from decoding import decode_internal_request
 
 
-def parse_internal_data(request_data):
+def parse_internal_data(request_data, resolve_topology=None):
     """
-    解析请求数据，初始化仓库、订单、车辆和车厢的数据模型。
+    校验请求数据，初始化仓库、订单、车辆和车厢的数据模型；校验失败抛出 PayloadValidationError。
     参数:
         request_data: 包含仓库、订单、车辆和车厢信息的请求数据。
+        resolve_topology: 请求以 topology 引用已登记布局时的解析函数（见 TopologyRegistry.resolver）。
     返回:
         初始化后的仓库、订单、车辆和车厢对象。
     """
-    warehouses = [Warehouse(w['warehouse_id'], [Dock(**d) for d in w['docks']], w.get('location', None)) for w in
-                  request_data['warehouses']]
-    orders = [Order(**o) for o in request_data['orders']]
-    vehicles = [Vehicle(**v) for v in request_data['vehicles']]
-    carriages = [Carriage(**c) for c in request_data['carriages']]
-    return warehouses, orders, vehicles, carriages
+    return decode_internal_request(request_data, resolve_topology)
 
 
 def classify_orders(orders):
@@ -38,7 +35,11 @@ def create_response(order_sequences, carriage_vehicle_dock_assignments):
                              "carriage_vehicle_dock_assignments": carriage_vehicle_dock_assignments}})
 
 
-def generate_loading_route(cargo_operations):
+def generate_loading_route(cargo_operations, locations=None, sequential=False):
+    """
+    :param locations: {仓库ID: 位置}，提供且订单非按序时按里程排序装货站点（卸货顺序随之按后进先出确定），
+                      否则按请求中出现的顺序
+    """
     loading_operations = [op for op in cargo_operations if op.operation == 1]
     warehouse_aggregate = {}
     for op in loading_operations:
@@ -46,31 +47,47 @@ def generate_loading_route(cargo_operations):
             warehouse_aggregate[op.warehouse_id] = []
         warehouse_aggregate[op.warehouse_id].append(op)
 
+    warehouse_ids = list(warehouse_aggregate)
+    if locations and not sequential and config.ROUTE_OPTIMIZATION:
+        matches = unloading_matches(cargo_operations)
+
+        def full_route(sequence):
+            cargo_stack = [op for warehouse_id in sequence for op in warehouse_aggregate[warehouse_id]]
+            return sequence + extract_unique_warehouse_ids(match_unloading_route(cargo_stack, matches))
+
+        warehouse_ids = sequence_stops(warehouse_ids, locations, full_route)
+
     optimized_loading_route = []
-    for warehouse_id in warehouse_aggregate:
+    for warehouse_id in warehouse_ids:
         optimized_loading_route.extend(warehouse_aggregate[warehouse_id])
 
     return optimized_loading_route
 
 
-def generate_unloading_route(cargo_operations, cargo_stack):
-    cargo_stack_copy = copy.deepcopy(cargo_stack)
-    unloading_route = []
-    unloading_operations = [op for op in cargo_operations if op.operation == 2]
-
-    for i in range(len(cargo_stack_copy) - 1, -1, -1):
-        stack_op = cargo_stack_copy[i]
-        for operation in unloading_operations:
-            # 从栈顶部（最后一个装载的货物）开始寻找匹配货物
-            if stack_op.cargo_type == operation.cargo_type and stack_op.quantity == operation.quantity:
-                # 卸载操作
-                unloading_route.append(
-                    WarehouseLoad(operation.warehouse_id, stack_op.cargo_type, operation.quantity, 2))
-                break
+def unloading_matches(cargo_operations):
+    """按 (货物类型, 数量) 索引卸货操作，同一键保留第一个卸货操作"""
+    matches = {}
+    for operation in cargo_operations:
+        if operation.operation == 2:
+            matches.setdefault((operation.cargo_type, operation.quantity), operation)
+    return matches
+
 
+def match_unloading_route(cargo_stack, matches):
+    unloading_route = []
+    # 从栈顶部（最后一个装载的货物）开始寻找匹配货物
+    for stack_op in reversed(cargo_stack):
+        operation = matches.get((stack_op.cargo_type, stack_op.quantity))
+        if operation is not None:
+            # 卸载操作
+            unloading_route.append(WarehouseLoad(operation.warehouse_id, stack_op.cargo_type, operation.quantity, 2))
     return unloading_route
 
 
+def generate_unloading_route(cargo_operations, cargo_stack):
+    return match_unloading_route(cargo_stack, unloading_matches(cargo_operations))
+
+
 # 装货路线和卸货路线 去重
 def extract_unique_warehouse_ids(route):
     seen_warehouses = set()
@@ -107,21 +124,23 @@ def calculate_total_quantity(cargo_stack, first_warehouse_id):
     return total_quantity
 
 
-def process_loading_orders(loading_orders, warehouses, carriages):
+def process_loading_orders(loading_orders, warehouses, fleet):
     """
 
     :param loading_orders: 内部入库单
     :param warehouses: 仓库信息
-    :param carriages: 车厢信息
+    :param fleet: 车厢与车辆的索引池 FleetPool
     :return: 仓库路线，车厢id
     """
     order_sequences = {}
     carriage_vehicle_dock_assignments = []
+    warehouses_dict = {w.id: w for w in warehouses}
+    locations = {w.id: w.location for w in warehouses}
 
     for order in loading_orders:
         order_id = str(order.id)
         cargo_operations = parse_cargo_operations(order)
-        loading_route = generate_loading_route(cargo_operations)
+        loading_route = generate_loading_route(cargo_operations, locations, order.sequential)
         required_carriage = order.required_carriage
         cargo_stack = [operation for operation in loading_route if operation.operation == 1]  # 1 =装货， 2=卸货
         unloading_route = generate_unloading_route(cargo_operations, cargo_stack)
@@ -131,16 +150,11 @@ def process_loading_orders(loading_orders, warehouses, carriages):
         combined_warehouse_ids = unique_loading_ids + unique_unloading_ids
         order_sequences[order_id] = combined_warehouse_ids
         first_warehouse_id = combined_warehouse_ids[0]
-        first_warehouse = next((w for w in warehouses if w.id == first_warehouse_id), None)
+        first_warehouse = warehouses_dict.get(first_warehouse_id)
         warehouse_location = first_warehouse.location
-        closest_carriage = min(
-            (c for c in carriages if c.state == 0 and c.type == required_carriage),
-            key=lambda c: haversine_distance(c.location['latitude'], c.location['longitude'],
-                                             warehouse_location['latitude'], warehouse_location['longitude']),
-            default=None
-        )
+        closest_carriage = find_closest_carriage(warehouse_location, required_carriage, fleet)
         if closest_carriage:
-            closest_carriage.state = 1
+            fleet.claim_carriage(closest_carriage)
             carriage_vehicle_dock_assignments.append({"order_id": order.id,
                                                       "carriage_id": closest_carriage.id})
         else:
@@ -150,18 +164,22 @@ def process_loading_orders(loading_orders, warehouses, carriages):
     return order_sequences, carriage_vehicle_dock_assignments
 
 
-def process_unloading_orders(unloading_orders, warehouses, carriages, vehicles):
+def process_unloading_orders(unloading_orders, warehouses, fleet, filename='internal_schedule.csv'):
     order_sequences = {}
     carriage_vehicle_dock_assignments = []
-    filename = 'internal_schedule.csv'
-    loaded_schedule = load_and_prepare_schedule(filename, unloading_orders, "queue")
+    warehouses_dict = {w.id: w for w in warehouses}
+    locations = {w.id: w.location for w in warehouses}
+    table = ProblemTable(unloading_orders, warehouses)
+    # 各订单的月台占用在全部订单处理完成后一次性写入调度文件
+    uow = ScheduleUnitOfWork(filename)
+    loaded_schedule = uow.load(unloading_orders, "queue")
     for order in unloading_orders:
         order_info = {}
         order_id = str(order.id)
         order_info["order_id"] = order.id
         required_carriage = order.required_carriage
         cargo_operations = parse_cargo_operations(order)
-        loading_route = generate_loading_route(cargo_operations)
+        loading_route = generate_loading_route(cargo_operations, locations, order.sequential)
 
         cargo_stack = [operation for operation in loading_route if operation.operation == 1]  # 订单类型 1 代表装货
         unloading_route = generate_unloading_route(cargo_operations, cargo_stack)
@@ -175,14 +193,15 @@ def process_unloading_orders(unloading_orders, warehouses, carriages, vehicles):
         first_warehouse_id = combined_warehouse_ids[0]
         first_load = calculate_total_quantity(cargo_stack, first_warehouse_id)
         order_info["warehouse_id"] = first_warehouse_id
-        first_warehouse = next((w for w in warehouses if w.id == first_warehouse_id), None)
+        first_warehouse = warehouses_dict.get(first_warehouse_id)
         """
         如果一个月台上有不符合要求的车厢且该车厢处于空闲状态（c.state == 0），这个月台就不会被包括在兼容月台列表中。
         """
-        compatible_docks = [dock for dock in first_warehouse.docks if
-                            (dock.dock_type in [1, 3]) and required_carriage in dock.compatible_carriage and
-                            all(c.type == required_carriage or c.state != 0 for c in carriages if
-                                c.current_dock_id == dock.id)]  # 月台类型1代表装货，3代表通用
+        order_index = table.order_index[order.id]
+        compatible_docks = [dock for d, dock in zip(table.dock_range(first_warehouse_id), first_warehouse.docks) if
+                            table.dock_types[d] in (1, 3) and required_carriage is not None and
+                            table.compatible[order_index, d] and
+                            not fleet.has_conflicting_idle_carriage(dock.id, required_carriage)]  # 月台类型1代表装货，3代表通用
         # 在选择月台之前，提取每个月台的最早可用时间
         dock_available_times = {}
         for dock in compatible_docks:
@@ -202,7 +221,7 @@ def process_unloading_orders(unloading_orders, warehouses, carriages, vehicles):
         3 随机选择
         """
         compatible_docks.sort(key=lambda dock: (
-            -any(c.current_dock_id == dock.id and c.type == required_carriage and c.state == 0 for c in carriages),
+            -(fleet.find_idle_carriage_at_dock(dock.id, required_carriage) is not None),
             dock_available_times[dock.id],
             -dock.outbound_efficiency,
             random.random()
@@ -222,45 +241,41 @@ def process_unloading_orders(unloading_orders, warehouses, carriages, vehicles):
             end_times = {(order_info["order_id"], order_info["warehouse_id"], order_info["dock_id"]): end_time}
 
             schedule = generate_schedule(start_times, end_times, "drop")
-            save_schedule_to_file(schedule, filename)
+            uow.add(schedule)
 
             # 判断月台是否已有符合条件的车厢
-            matching_carriage = next((c for c in carriages if c.current_dock_id == assigned_dock_id
-                                      and c.type == required_carriage
-                                      and c.state == 0), None)
+            matching_carriage = fleet.find_idle_carriage_at_dock(assigned_dock_id, required_carriage)
             if matching_carriage:
                 # 如果找到匹配的车厢，则分配该车厢并无须分配车辆
                 order_info["carriage_id"] = matching_carriage.id
                 # 更新车厢状态
-                matching_carriage.state = 1
+                fleet.claim_carriage(matching_carriage)
                 order_info['vehicle_id'] = None
             else:
                 # 如果没有找到匹配的车厢，根据距离寻找车厢
                 warehouse_location = first_warehouse.location
-                closest_carriage = min(
-                    (c for c in carriages if c.type == required_carriage and c.state == 0),
-                    key=lambda c: haversine_distance(c.location['latitude'], c.location['longitude'],
-                                                     warehouse_location['latitude'],
-                                                     warehouse_location['longitude']),
-                    default=None
-                )
+                closest_carriage = find_closest_carriage(warehouse_location, required_carriage, fleet)
                 if closest_carriage:
                     order_info["carriage_id"] = closest_carriage.id
-                    closest_carriage.state = 1
+                    fleet.claim_carriage(closest_carriage)
 
                     # 为车厢选择合适的车辆
-                    closest_vehicle = find_closest_vehicle(closest_carriage.location, vehicles)
+                    closest_vehicle = find_closest_vehicle(closest_carriage.location, fleet)
                     order_info["vehicle_id"] = closest_vehicle.id if closest_vehicle else None
-                    closest_vehicle.state = 1  # 更新车辆状态
+                    if closest_vehicle:
+                        fleet.claim_vehicle(closest_vehicle)  # 更新车辆状态
                 else:
                     order_info["carriage_id"] = None
                     order_info["vehicle_id"] = None
         carriage_vehicle_dock_assignments.append(order_info)
 
+    uow.commit()
     return order_sequences, carriage_vehicle_dock_assignments
 
 
 def set_dock_efficiency(warehouses):
+    if getattr(warehouses, 'precomputed', False):
+        return None  # 已登记布局的月台效率在编译时已设置
     for warehouse in warehouses:
         # 卸货月台
         unloading_docks = [dock for dock in warehouse.docks if dock.dock_type in [2, 3]]
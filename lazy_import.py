@@ -0,0 +1,28 @@
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """模块代理：第一次访问属性时通过常规 import 加载真实模块，之后将其属性复制到代理上"""
+
+    def __getattr__(self, attr):
+        # 常规 import 自带按模块的导入锁，多个线程同时首次访问时会等待同一次导入完成，不会拿到未初始化完的模块
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    延迟导入模块：返回的模块对象在第一次访问属性时才真正执行导入。
+
+    用于 pandas、PuLP、NumPy 等导入耗时较长的依赖，使服务启动时不必立即加载。
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return _LazyModule(name)
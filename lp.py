@@ -1,56 +1,95 @@
-from pulp import LpProblem, LpMinimize, LpVariable, lpSum, LpContinuous, LpInteger, value
+import math
+
 from common import *
+from problem_table import ProblemTable
+import config
+
+FIXED_COST = 6  # 驶入驶离固定耗时4+2分钟
+
+
+def dock_equivalence_classes(warehouse, table, total_busy_time):
+    """
+    划分仓库内可互换的月台：效率、月台类型、兼容车型与已占用时长均相同的月台互为等价。
 
+    :return: 月台列表的列表，只包含两个及以上月台的等价类，类内保持请求中的顺序
+    """
+    classes = {}
+    for d, dock in zip(table.dock_range(warehouse.id), warehouse.docks):
+        key = (dock.efficiency, dock.dock_type, int(table.dock_carriage_mask[d]),
+               total_busy_time.get((warehouse.id, dock.id), 0))
+        classes.setdefault(key, []).append(dock)
+    return [docks for docks in classes.values() if len(docks) > 1]
 
-def create_lp_model(orders, warehouses, total_busy_time=None):
-    model = LpProblem("Vehicle_Scheduling_with_Queue", LpMinimize)
+
+def create_lp_model(orders, warehouses, total_busy_time=None, problem_table=None, symmetry_breaking=None):
+    model = pulp.LpProblem("Vehicle_Scheduling_with_Queue", pulp.LpMinimize)
     if total_busy_time is None:
         total_busy_time = {}
+    if problem_table is None:
+        problem_table = ProblemTable(orders, warehouses)
+    table = problem_table
     # 月台分配决策变量
-    owd = LpVariable.dicts("OrderWarehouseDock",
-                           [(o.id, w.id, d.id) for o in orders for w in warehouses for d in w.docks],
-                           cat='Binary')
+    owd = pulp.LpVariable.dicts("OrderWarehouseDock",
+                                [(o.id, w.id, d.id) for o in orders for w in warehouses for d in w.docks],
+                                cat='Binary')
 
     # 最迟完成时间变量
-    latest_completion_time = LpVariable("Latest_Completion_Time", lowBound=0, cat=LpInteger)
+    latest_completion_time = pulp.LpVariable("Latest_Completion_Time", lowBound=0, cat=pulp.LpInteger)
 
     # 目标函数：最小化最迟的订单完成时间
     model += latest_completion_time
 
     # 装货时间约束
-    for warehouse in warehouses:
+    for w, warehouse in enumerate(warehouses):
+        # 在该仓库有载货的订单及其载货量
+        loaded_orders = [(orders[i].id, table.loads[i, w]) for i in table.orders_with_load(warehouse.id)]
         for dock in warehouse.docks:
             dock_key = (warehouse.id, dock.id)
-            dock_completion_time = LpVariable(f"DockCompletionTime_{warehouse.id}_{dock.id}", lowBound=0, cat=LpInteger)
+            dock_completion_time = pulp.LpVariable(f"DockCompletionTime_{warehouse.id}_{dock.id}", lowBound=0,
+                                                   cat=pulp.LpInteger)
             model += dock_completion_time <= latest_completion_time  # 最迟完成时间为最长的一条月台队列完成的时间
             existing_dock_queueingTime = total_busy_time.get(dock_key, 0)
             # 每个仓库的月台队列 总载货量
-            total_load = pulp.lpSum(
-                next((load['load'] for load in order.warehouse_loads if load['warehouse_id'] == warehouse.id), 0) * owd[
-                    order.id, warehouse.id, dock.id]
-                for order in orders if
-                order.warehouse_loads and any(load['warehouse_id'] == warehouse.id for load in order.warehouse_loads)
-            )
+            total_load = pulp.lpSum(load * owd[order_id, warehouse.id, dock.id] for order_id, load in loaded_orders)
             model += dock_completion_time >= total_load / dock.efficiency + existing_dock_queueingTime
             # 月台完成时间为总载货量/该月台效率
 
     # 确保每个订单在所有装货量非零的仓库中只选择一个月台
-    for order in orders:
-        for warehouse in warehouses:
-            # 寻找与当前仓库匹配的 load 值
-            load_for_warehouse = next(
-                (load['load'] for load in order.warehouse_loads if load['warehouse_id'] == warehouse.id), 0)
-
-            # 如果找到的 load 值大于 0，添加约束
-            if load_for_warehouse > 0:
+    for i, order in enumerate(orders):
+        for w, warehouse in enumerate(warehouses):
+            # 如果该仓库的 load 值大于 0，添加约束
+            if table.loads[i, w] > 0:
                 model += pulp.lpSum(owd[order.id, warehouse.id, dock.id] for dock in warehouse.docks) == 1
             else:
                 model += pulp.lpSum(owd[order.id, warehouse.id, dock.id] for dock in warehouse.docks) == 0
 
-            for dock in warehouse.docks:
-                if order.required_carriage is not None and order.required_carriage not in dock.compatible_carriage:
+            for d, dock in zip(table.dock_range(warehouse.id), warehouse.docks):
+                if not table.compatible[i, d]:
                     model += owd[order.id, warehouse.id, dock.id] == 0
 
+    # 对称性破除：等价月台交换后的分配方案目标值相同，只保留其中一种。
+    # 类内月台按所接收订单的最小下标排序，第 k 个月台接收第 j 个订单的前提是第 k-1 个月台已接收了更早的订单。
+    # 第 k-1 个月台已接收的更早订单数用前缀和辅助变量递推，约束非零元随订单数线性增长
+    if symmetry_breaking is None:
+        symmetry_breaking = config.SYMMETRY_BREAKING
+    if symmetry_breaking:
+        for warehouse in warehouses:
+            loaded_order_ids = [orders[i].id for i in table.orders_with_load(warehouse.id)]
+            for docks in dock_equivalence_classes(warehouse, table, total_busy_time):
+                for prev_dock, dock in zip(docks, docks[1:]):
+                    assigned_before = None  # 第 k-1 个月台在前 j 个订单中接收的订单数
+                    for j, order_id in enumerate(loaded_order_ids):
+                        if assigned_before is None:
+                            model += owd[order_id, warehouse.id, dock.id] == 0
+                            assigned_before = owd[order_id, warehouse.id, prev_dock.id]
+                            continue
+                        model += owd[order_id, warehouse.id, dock.id] <= assigned_before
+                        if j + 1 < len(loaded_order_ids):
+                            running = pulp.LpVariable(f"AssignedBefore_{warehouse.id}_{prev_dock.id}_{j + 1}",
+                                                      lowBound=0)
+                            model += running == assigned_before + owd[order_id, warehouse.id, prev_dock.id]
+                            assigned_before = running
+
     return model
     #  检查逻辑
     #  解析函数
@@ -65,60 +104,100 @@ def generate_specific_order_route(orders):
             # 根据sequence对warehouse_loads排序，忽略sequence为None的情况
             sorted_loads = sorted(order.warehouse_loads, key=lambda load: (load.sequence is not None, load.sequence))
             # 获取订单中仓库负载的仓库ID，并按照出现的顺序创建路径
-            route = [load['warehouse_id'] for load in sorted_loads]
+            route = [load.warehouse_id for load in sorted_loads]
             specific_order_route[order.id] = route
 
     return specific_order_route
 
 
-def create_queue_model(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows=None):
+def queue_processing_times(orders, warehouses, order_dock_assignments, table):
+    """
+    列出每个仓库-月台上的订单队列及各作业时长。
+
+    :return: (dock_queues, processing_times)，dock_queues[(仓库ID, 月台ID)] 为按优先级排序的订单列表，
+             processing_times[(订单ID, 仓库ID, 月台ID)] 为作业时长（分钟）
+    """
+    dock_queues = {}
+    processing_times = {}
+    for warehouse in warehouses:
+        for dock in warehouse.docks:
+            orders_in_dock = [order for order in orders if order.id in order_dock_assignments and warehouse.id in order_dock_assignments[order.id] and order_dock_assignments[order.id][warehouse.id] == dock.id]
+            orders_in_dock.sort(key=lambda order: order.priority, reverse=True)  # 给每个月台列的订单排出一个优先级。
+            dock_queues[warehouse.id, dock.id] = orders_in_dock
+            for order in orders_in_dock:
+                processing_times[order.id, warehouse.id, dock.id] = \
+                    FIXED_COST + table.load(order.id, warehouse.id) / (dock.efficiency+0.0000001)
+    return dock_queues, processing_times
+
+
+def create_queue_model(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows=None,
+                       problem_table=None):
     if busy_windows is None:
         busy_windows = {}
-    M = 100000
-    model = LpProblem("Queue_Optimization", LpMinimize)
-    fixed_cost = 6  # 驶入驶离固定耗时4+2分钟
+    if problem_table is None:
+        problem_table = ProblemTable(orders, warehouses)
+    table = problem_table
+    model = pulp.LpProblem("Queue_Optimization", pulp.LpMinimize)
     # 定义开始时间和结束时间变量
-    start_times = LpVariable.dicts("Start_Time",
-                                   [(order.id, warehouse.id, dock.id) for order in orders for warehouse in warehouses
-                                    for dock in warehouse.docks],
-                                   lowBound=0, cat=LpContinuous)
+    start_times = pulp.LpVariable.dicts("Start_Time",
+                                        [(order.id, warehouse.id, dock.id) for order in orders
+                                         for warehouse in warehouses for dock in warehouse.docks],
+                                        lowBound=0, cat=pulp.LpContinuous)
+
+    end_times = pulp.LpVariable.dicts("End_Time",
+                                      [(order.id, warehouse.id, dock.id) for order in orders
+                                       for warehouse in warehouses for dock in warehouse.docks],
+                                      lowBound=0, cat=pulp.LpContinuous)
+
+    dock_queues, processing_times = queue_processing_times(orders, warehouses, order_dock_assignments, table)
 
-    end_times = LpVariable.dicts("End_Time",
-                                 [(order.id, warehouse.id, dock.id) for order in orders for warehouse in warehouses for
-                                  dock in warehouse.docks],
-                                 lowBound=0, cat=LpContinuous)
+    # 由实例推导时间界，替代固定的大M：
+    # 所有忙碌窗口结束后，按（优先级, 路径顺序）逐个串行作业是一个可行排班，其完成时间 horizon 是最优最迟结束时间的上界；
+    # 月台队列中排在前面的作业时长之和为开始时间下界，horizon 扣除排在后面的作业时长之和为结束时间上界。
+    latest_busy_end = max((end for windows in busy_windows.values() for _, end in windows), default=0)
+    horizon = math.ceil(max(latest_busy_end, 0) + sum(processing_times.values())) + 1
+    earliest_start = {}
+    latest_end = {}
+    for (warehouse_id, dock_id), orders_in_dock in dock_queues.items():
+        head, tail = 0, sum(processing_times[order.id, warehouse_id, dock_id] for order in orders_in_dock)
+        for order in orders_in_dock:
+            key = (order.id, warehouse_id, dock_id)
+            tail -= processing_times[key]
+            earliest_start[key] = head
+            latest_end[key] = horizon - tail
+            head += processing_times[key]
+            # 显式变量界
+            start_times[key].lowBound = earliest_start[key]
+            start_times[key].upBound = latest_end[key] - processing_times[key]
+            end_times[key].lowBound = earliest_start[key] + processing_times[key]
+            end_times[key].upBound = latest_end[key]
 
     # 目标函数：最小化最迟订单的结束时间
-    latest_end_time = LpVariable("Latest_End_Time", lowBound=0, cat=LpContinuous)
+    latest_end_time = pulp.LpVariable("Latest_End_Time", lowBound=0, upBound=horizon, cat=pulp.LpContinuous)
     model += latest_end_time
 
     # 约束条件 首先排序订单优先级。
-    for warehouse in warehouses:
-        for dock in warehouse.docks:
-            # 列出所有的在这个仓库-月台上的订单
-            orders_in_dock = [order for order in orders if order.id in order_dock_assignments and warehouse.id in order_dock_assignments[order.id] and order_dock_assignments[order.id][warehouse.id] == dock.id]
-            orders_in_dock.sort(key=lambda order: order.priority, reverse=True)  # 给每个月台列的订单排出一个优先级。
+    for (warehouse_id, dock_id), orders_in_dock in dock_queues.items():
+        for i in range(len(orders_in_dock)):
+            order = orders_in_dock[i]
+            processing_time = processing_times[order.id, warehouse_id, dock_id]
+            # TODO 加权
+            model += end_times[order.id, warehouse_id, dock_id] == start_times[
+                order.id, warehouse_id, dock_id] + processing_time
+            model += end_times[order.id, warehouse_id, dock_id] <= latest_end_time  # 最迟完成时间
+
+            # 优先级约束：优先级高的订单先完成 结束时间<=下一个优先级排序订单的开始时间
+            if i < len(orders_in_dock) - 1:
+                next_order = orders_in_dock[i + 1]
+                if order.priority != next_order.priority:
+                    model += end_times[order.id, warehouse_id, dock_id] <= start_times[
+                        next_order.id, warehouse_id, dock_id]
 
-            for i in range(len(orders_in_dock)):
-                order = orders_in_dock[i]
-                processing_time = fixed_cost + next((load['load'] for load in order.warehouse_loads if load['warehouse_id'] == warehouse.id), 0) / (dock.efficiency+0.0000001)
-                # TODO 加权
-                model += end_times[order.id, warehouse.id, dock.id] == start_times[
-                    order.id, warehouse.id, dock.id] + processing_time
-                model += end_times[order.id, warehouse.id, dock.id] <= latest_end_time  # 最迟完成时间
-
-                # 优先级约束：优先级高的订单先完成 结束时间<=下一个优先级排序订单的开始时间
-                if i < len(orders_in_dock) - 1:
-                    next_order = orders_in_dock[i + 1]
-                    if order.priority != next_order.priority:
-                        model += end_times[order.id, warehouse.id, dock.id] <= start_times[
-                            next_order.id, warehouse.id, dock.id]
-
-            # 同一时间同一月台仅一个订单
-            for i in range(len(orders_in_dock)):
-                for j in range(i + 1, len(orders_in_dock)):
-                    model += end_times[orders_in_dock[i].id, warehouse.id, dock.id] <= start_times[
-                        orders_in_dock[j].id, warehouse.id, dock.id]
+        # 同一时间同一月台仅一个订单
+        for i in range(len(orders_in_dock)):
+            for j in range(i + 1, len(orders_in_dock)):
+                model += end_times[orders_in_dock[i].id, warehouse_id, dock_id] <= start_times[
+                    orders_in_dock[j].id, warehouse_id, dock_id]
 
     # 按序订单的时间约束
     for order_id in specific_order_route:
@@ -140,8 +219,8 @@ def create_queue_model(orders, warehouses, order_dock_assignments, specific_orde
                 w_id2, d_id2 = assigned_docks[j]
 
                 # 引入辅助二元变量，表示订单在两个月台中的先后顺序
-                before = LpVariable(f"Order_{order.id}_Dock_{w_id1}_{d_id1}_Before_Dock_{w_id2}_{d_id2}", 0, 1,
-                                    LpInteger)
+                before = pulp.LpVariable(f"Order_{order.id}_Dock_{w_id1}_{d_id1}_Before_Dock_{w_id2}_{d_id2}", 0, 1,
+                                         pulp.LpInteger)
 
                 '''
                 添加约束，确保两个月台作业的时间不重叠， 
@@ -149,26 +228,35 @@ def create_queue_model(orders, warehouses, order_dock_assignments, specific_orde
                 如果before=1，则下面的约束不具有约束性，第一个作业在第二个作业之前完成
                 如果before=0，则上面的约束不具有约束性，同时保证第二个作业在第一个作业之前完成
                 '''
-                model += end_times[order.id, w_id1, d_id1] <= start_times[order.id, w_id2, d_id2] + (1 - before) * M
-                model += end_times[order.id, w_id2, d_id2] <= start_times[order.id, w_id1, d_id1] + before * M
+                key1, key2 = (order.id, w_id1, d_id1), (order.id, w_id2, d_id2)
+                m12 = latest_end.get(key1, horizon) - earliest_start.get(key2, 0)
+                m21 = latest_end.get(key2, horizon) - earliest_start.get(key1, 0)
+                model += end_times[key1] <= start_times[key2] + (1 - before) * m12
+                model += end_times[key2] <= start_times[key1] + before * m21
 
     # 【约束】订单作业窗口不与已存在的忙碌时间窗口重叠
     for order in orders:
         for warehouse in warehouses:
-            load_for_warehouse = next(
-                (load['load'] for load in order.warehouse_loads if load['warehouse_id'] == warehouse.id), 0)
-            if load_for_warehouse > 0:
+            if table.load(order.id, warehouse.id) > 0:
                 dock_id = order_dock_assignments[order.id][warehouse.id]
                 dock_key = (warehouse.id, dock_id)
                 existing_windows = busy_windows.get(dock_key, [])
 
+                key = (order.id, warehouse.id, dock_id)
+                op_earliest_start = earliest_start.get(key, 0)
+                op_latest_end = latest_end.get(key, horizon)
+
                 # 对于每个忙碌时间窗口，添加不重叠的约束
                 for idx, (busy_start, busy_end) in enumerate(existing_windows):
+                    # 窗口在作业最早开始前已结束，或在作业最迟结束后才开始，不可能重叠，无需辅助变量
+                    if busy_end <= op_earliest_start or busy_start >= op_latest_end:
+                        continue
                     # 为每个忙碌时间窗口创建一个唯一的overlap辅助决策变量
-                    overlap = LpVariable(f"Overlap_{order.id}_{warehouse.id}_{dock_id}_{idx}", 0, 1, LpInteger)
+                    overlap = pulp.LpVariable(f"Overlap_{order.id}_{warehouse.id}_{dock_id}_{idx}", 0, 1,
+                                              pulp.LpInteger)
 
                     # 添加不与忙碌时间窗口重叠的约束
-                    model += end_times[order.id, warehouse.id, dock_id] <= busy_start + (1 - overlap) * M
-                    model += busy_end <= start_times[order.id, warehouse.id, dock_id] + overlap * M
+                    model += end_times[key] <= busy_start + (1 - overlap) * (op_latest_end - busy_start)
+                    model += busy_end <= start_times[key] + overlap * (busy_end - op_earliest_start)
 
     return model
@@ -0,0 +1,194 @@
+"""
+按 worker 进程记录的请求指标。
+
+每个进程在内存中累计各接口的请求数、错误数和耗时分布，由后台定时器每隔 flush_interval 秒最多写一次
+METRICS_DIR/<pid>.json（请求路径上不写文件），进程退出与 /metrics 汇总前也会写入；
+/metrics 接口读取目录下所有进程的文件并汇总，多进程部署时可得到整体吞吐。
+文件中同时记录本进程各准入名额池当前的求解数与排队数，其他 worker 的准入判断依赖它，变化时立即写入；
+汇总时只计入仍存活的进程。
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60)  # 秒
+WAIT_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30)  # 准入等待时间（秒）
+ADMISSION_OUTCOMES = ("admitted", "queue_full", "wait_timeout", "oversize_rejected", "oversize_downgraded")
+
+
+def _empty_endpoint_metrics():
+    return {"count": 0, "errors": 0, "latency_sum": 0.0, "latency_max": 0.0,
+            "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+
+
+def _empty_admission_metrics():
+    metrics = {outcome: 0 for outcome in ADMISSION_OUTCOMES}
+    metrics.update({"wait_sum": 0.0, "wait_max": 0.0, "wait_buckets": [0] * (len(WAIT_BUCKETS) + 1)})
+    return metrics
+
+
+class WorkerMetrics:
+    def __init__(self, directory, flush_interval=1.0):
+        """
+        :param flush_interval: 两次写入指标文件的最短间隔（秒），0 表示每次记录后立即写入
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.endpoints = {}
+        self.admission = {}
+        self.occupancy = {}  # {名额池: {"running": 求解数, "queued": 排队数}}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        self._timer_pid = None
+        atexit.register(self.flush)
+
+    def record(self, endpoint, status, elapsed):
+        with self._lock:
+            metrics = self.endpoints.setdefault(endpoint, _empty_endpoint_metrics())
+            metrics["count"] += 1
+            if status >= 400:
+                metrics["errors"] += 1
+            metrics["latency_sum"] += elapsed
+            metrics["latency_max"] = max(metrics["latency_max"], elapsed)
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if elapsed <= bound), len(LATENCY_BUCKETS))
+            metrics["buckets"][bucket] += 1
+            self._changed_locked()
+
+    def record_admission(self, endpoint, outcome, waited=0.0):
+        """记录一次准入结果（ADMISSION_OUTCOMES 之一），waited 为排队等待秒数"""
+        with self._lock:
+            metrics = self.admission.setdefault(endpoint, _empty_admission_metrics())
+            metrics[outcome] += 1
+            if outcome in ("admitted", "wait_timeout"):
+                metrics["wait_sum"] += waited
+                metrics["wait_max"] = max(metrics["wait_max"], waited)
+                bucket = next((i for i, bound in enumerate(WAIT_BUCKETS) if waited <= bound), len(WAIT_BUCKETS))
+                metrics["wait_buckets"][bucket] += 1
+            self._changed_locked()
+
+    def set_occupancy(self, occupancy):
+        """更新本进程各准入名额池当前的求解数与排队数，立即写入（其他 worker 据此判断排队人数）"""
+        with self._lock:
+            self.occupancy = occupancy
+            self._flush_locked()
+
+    def flush(self):
+        """把尚未写入的指标写入文件"""
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+
+    def _timer_flush(self):
+        with self._lock:
+            self._timer = None
+            if self._dirty:
+                self._flush_locked()
+
+    def _changed_locked(self):
+        self._dirty = True
+        if self.flush_interval <= 0:
+            self._flush_locked()
+        elif self._timer is None or self._timer_pid != os.getpid():
+            # fork 前创建的定时器线程不会出现在子进程中，按进程号判断后重新创建
+            self._timer_pid = os.getpid()
+            self._timer = threading.Timer(self.flush_interval, self._timer_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_locked(self):
+        self._dirty = False
+        snapshot = {"pid": os.getpid(), "started_at": self.started_at, "updated_at": time.time(),
+                    "endpoints": self.endpoints, "admission": self.admission, "occupancy": self.occupancy}
+        # 同一进程的多个线程共用同一个临时文件，写入与替换需在锁内完成
+        try:
+            self._flush(snapshot)
+        except OSError as e:
+            logger.warning(f"写入请求指标失败: {e}")
+
+    def _flush(self, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{snapshot['pid']}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+
+def _snapshots(directory):
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            continue  # 文件正在被替换或已损坏，跳过
+
+
+def _alive(pid):
+    if os.name != 'posix':
+        return True  # os.kill 在 Windows 上会结束进程，无法用于探测
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def aggregate_occupancy(directory):
+    """汇总仍存活的 worker 各准入名额池的求解数与排队数，已退出进程残留的文件不计入"""
+    totals = {}
+    for snapshot in _snapshots(directory):
+        if not snapshot.get("occupancy") or not _alive(snapshot["pid"]):
+            continue
+        for pool, counts in snapshot["occupancy"].items():
+            total = totals.setdefault(pool, {"running": 0, "queued": 0})
+            total["running"] += counts["running"]
+            total["queued"] += counts["queued"]
+    return totals
+
+
+def aggregate_metrics(directory):
+    """汇总目录下所有 worker 的指标"""
+    workers = []
+    endpoints = {}
+    admission = {}
+    for snapshot in _snapshots(directory):
+        workers.append({"pid": snapshot["pid"], "updated_at": snapshot["updated_at"],
+                        "requests": sum(m["count"] for m in snapshot["endpoints"].values())})
+        for endpoint, metrics in snapshot["endpoints"].items():
+            total = endpoints.setdefault(endpoint, _empty_endpoint_metrics())
+            total["count"] += metrics["count"]
+            total["errors"] += metrics["errors"]
+            total["latency_sum"] += metrics["latency_sum"]
+            total["latency_max"] = max(total["latency_max"], metrics["latency_max"])
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], metrics["buckets"])]
+        for endpoint, metrics in snapshot.get("admission", {}).items():
+            total = admission.setdefault(endpoint, _empty_admission_metrics())
+            for outcome in ADMISSION_OUTCOMES:
+                total[outcome] += metrics[outcome]
+            total["wait_sum"] += metrics["wait_sum"]
+            total["wait_max"] = max(total["wait_max"], metrics["wait_max"])
+            total["wait_buckets"] = [a + b for a, b in zip(total["wait_buckets"], metrics["wait_buckets"])]
+
+    for metrics in endpoints.values():
+        metrics["latency_avg"] = metrics["latency_sum"] / metrics["count"] if metrics["count"] else 0
+        metrics["buckets"] = dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], metrics["buckets"]))
+    for metrics in admission.values():
+        waits = metrics["admitted"] + metrics["wait_timeout"]
+        metrics["wait_avg"] = metrics["wait_sum"] / waits if waits else 0
+        metrics["wait_buckets"] = dict(zip([str(b) for b in WAIT_BUCKETS] + ["+Inf"], metrics["wait_buckets"]))
+    return {"workers": workers, "endpoints": endpoints, "admission": admission}
+
+
+def clear_metrics(directory):
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
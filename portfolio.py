@@ -0,0 +1,355 @@
+"""
+求解器组合竞速。
+
+同一实例在不同求解器配置下的耗时差别很大，且事先无法判断哪种最快。开启 NP_PORTFOLIO（如 "cbc,cbc_nocuts,highs,heuristic"）后，
+solve_model 为每种配置各启动一个进程同时求解月台分配模型与排队模型：
+- 先得到已证明最优解的配置获胜，其余进程（连同其求解器子进程）立即终止；
+- 求解器带时限（见 solve_budget.py）时，到时限后取已返回结果中目标值最好的可行解；
+- heuristic 配置为不调用求解器的贪心 + 局部搜索，只提供可行解，不证明最优。
+本机未安装的求解器（如 HiGHS）自动跳过。
+
+每次竞速的各配置结果追加到 PORTFOLIO_STATS_FILE（JSON Lines）。同类模型（lp/queue）竞速次数达到
+NP_PORTFOLIO_PRUNE_AFTER 后，胜率低于 NP_PORTFOLIO_MIN_WIN_RATE 的配置不再参赛，仅以 NP_PORTFOLIO_EXPLORE_RATE 的概率
+重新参赛，以便实例分布变化后恢复。查看统计：
+
+    python portfolio.py stats
+"""
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from multiprocessing.connection import wait
+
+from common import pulp
+from heuristics import greedy_queue_schedule, heuristic_dock_assignment
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _cbc(time_limit, **options):
+    return pulp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, **options)
+
+
+def _highs(time_limit):
+    solver = pulp.HiGHS_CMD(msg=False, timeLimit=time_limit)
+    return solver if solver.available() else pulp.HiGHS(msg=False, timeLimit=time_limit)
+
+
+# 配置名 -> 按时限创建求解器的函数；heuristic 不使用求解器
+CONFIGURATIONS = {
+    'cbc': _cbc,
+    'cbc_nocuts': lambda time_limit: _cbc(time_limit, cuts=False),
+    'cbc_nopresolve': lambda time_limit: _cbc(time_limit, presolve=False),
+    'highs': _highs,
+    'heuristic': None,
+}
+
+
+def configured_names():
+    return [name.strip() for name in config.PORTFOLIO.split(',') if name.strip()]
+
+
+_available = {}
+
+
+def available(name):
+    """配置的求解器是否已安装，结果按进程缓存"""
+    if name == 'heuristic':
+        return True
+    if name not in _available:
+        try:
+            _available[name] = bool(CONFIGURATIONS[name](None).available())
+        except (KeyError, AttributeError, pulp.PulpSolverError):
+            _available[name] = False
+        if not _available[name]:
+            logger.warning(f"组合求解配置 {name} 不可用，已跳过")
+    return _available[name]
+
+
+# SECTION 启发式
+def lp_heuristic(orders, warehouses, total_busy_time):
+    """月台分配模型的启发式解，变量名与 parse_optimization_result 一致"""
+
+    def run():
+        assignments, latest_completion_time = heuristic_dock_assignment(orders, warehouses, total_busy_time)
+        values = {f"OrderWarehouseDock_({order_id},_{warehouse_id},_{dock_id})": 1
+                  for order_id, warehouse_docks in assignments.items()
+                  for warehouse_id, dock_id in warehouse_docks.items()}
+        values["Latest_Completion_Time"] = latest_completion_time
+        return values, latest_completion_time
+
+    return run
+
+
+def queue_heuristic(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows):
+    """排队模型的启发式解，变量名与 parse_queue_results 一致"""
+
+    def run():
+        start_times, end_times, status = greedy_queue_schedule(orders, warehouses, order_dock_assignments,
+                                                               specific_order_route, busy_windows)
+        if status != pulp.LpStatus[pulp.LpStatusOptimal]:
+            return None, None
+        values = {}
+        for (order_id, warehouse_id, dock_id), start in start_times.items():
+            values[f"Start_Time_({order_id},_{warehouse_id},_{dock_id})"] = start
+            values[f"End_Time_({order_id},_{warehouse_id},_{dock_id})"] = end_times[order_id, warehouse_id, dock_id]
+        makespan = max(end_times.values(), default=0)
+        values["Latest_End_Time"] = makespan
+        return values, makespan
+
+    return run
+
+
+# SECTION 竞速
+def _run(conn, model, name, time_limit, heuristic, tmp_dir):
+    """子进程：求解并通过管道返回结果，求解器临时文件写入 tmp_dir，由父进程清理"""
+    os.setpgrp()  # 求解器子进程与本进程同组，终止时整组结束
+    try:
+        if name == 'heuristic':
+            values, objective = heuristic()
+            result = {"status": pulp.LpStatusOptimal if values is not None else pulp.LpStatusNotSolved,
+                      "sol_status": pulp.LpSolutionIntegerFeasible if values is not None
+                      else pulp.LpSolutionNoSolutionFound,
+                      "values": values, "objective": objective, "proven": False}
+        else:
+            solver = CONFIGURATIONS[name](time_limit)
+            solver.tmpDir = tmp_dir
+            model.solve(solver)
+            result = {"status": model.status, "sol_status": model.sol_status,
+                      "values": {variable.name: variable.varValue for variable in model.variables()},
+                      "objective": pulp.value(model.objective),
+                      "proven": model.status == pulp.LpStatusOptimal and model.sol_status == pulp.LpSolutionOptimal}
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    conn.send(result)
+    conn.close()
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        process.kill()  # 尚未调用 setpgrp
+    process.join()
+
+
+def _feasible(result):
+    return result.get("values") is not None and result.get("status") == pulp.LpStatusOptimal and \
+        result.get("objective") is not None
+
+
+def race(model, phase, solver=None, heuristic=None):
+    """
+    用组合中的各配置同时求解 model，将获胜配置的解写回 model。
+
+    :param solver: 原本使用的求解器，仅取其时限
+    :param heuristic: 无参函数，返回 ({变量名: 值}, 目标值)，为 None 时不启动 heuristic 配置
+    :return: 模型求解状态
+    """
+    time_limit = getattr(solver, 'timeLimit', None)
+    kind = phase.rsplit('_', 1)[-1]
+    names = [name for name in configured_names() if name in CONFIGURATIONS and available(name) and
+             (name != 'heuristic' or heuristic is not None)]
+    names = portfolio_stats.active(kind, names)
+    if not any(name != 'heuristic' for name in names):
+        model.solve(solver=solver)  # 没有可用的求解器配置
+        return model.status
+
+    context = multiprocessing.get_context('fork')
+    started_at = time.perf_counter()
+    tmp_dir = tempfile.mkdtemp(prefix='portfolio_')  # 被终止的求解器来不及删除临时文件
+    runners = {}
+    for name in names:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run, args=(sender, model, name, time_limit, heuristic, tmp_dir))
+        process.start()
+        sender.close()
+        runners[receiver] = (name, process)
+
+    # 到时限后留出 PORTFOLIO_GRACE_SECONDS 等待求解器返回时限内的最好解
+    deadline = None if time_limit is None else started_at + time_limit + config.PORTFOLIO_GRACE_SECONDS
+    results, winner = {}, None
+    try:
+        while runners and winner is None:
+            timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            ready = wait(list(runners), timeout)
+            if not ready:
+                break
+            for receiver in ready:
+                name, process = runners.pop(receiver)
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    result = {"error": f"进程退出，退出码 {process.exitcode}"}
+                receiver.close()
+                process.join()
+                result["elapsed"] = time.perf_counter() - started_at
+                results[name] = result
+                if result.get("proven"):
+                    winner = name
+                    break
+    finally:
+        for receiver, (name, process) in runners.items():
+            _kill(process)
+            receiver.close()
+            results[name] = {"killed": True, "elapsed": time.perf_counter() - started_at}
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if winner is None:
+        feasible = [(result["objective"], result["elapsed"], name) for name, result in results.items()
+                    if _feasible(result)]
+        if feasible:
+            winner = min(feasible)[2]
+    if winner is not None:
+        result = results[winner]
+        values = result["values"]
+        model.assignVarsVals({variable.name: values.get(variable.name, 0) for variable in model.variables()})
+        model.status, model.sol_status = result["status"], result["sol_status"]
+    else:
+        statuses = {result.get("status") for result in results.values()}
+        model.status = pulp.LpStatusInfeasible if pulp.LpStatusInfeasible in statuses else pulp.LpStatusNotSolved
+        model.sol_status = pulp.LpSolutionNoSolutionFound
+
+    portfolio_stats.record(phase, kind, winner, time_limit, results)
+    for name, result in results.items():
+        if "error" in result:
+            logger.error(f"{phase} 组合求解配置 {name} 失败: {result['error']}")
+    logger.info(f"{phase} 组合求解: {', '.join(names)}，获胜 {winner}"
+                f"{'（已证明最优）' if winner and results[winner].get('proven') else ''}，"
+                f"耗时 {time.perf_counter() - started_at:.2f}s")
+    return model.status
+
+
+# SECTION 胜率统计
+def _result_summary(result):
+    if result.get("killed"):
+        status = "Killed"
+    elif "error" in result:
+        status = "Error"
+    else:
+        status = pulp.LpStatus.get(result.get("status"), "Undefined")
+    return {"status": status, "proven": bool(result.get("proven")), "objective": result.get("objective"),
+            "elapsed": round(result.get("elapsed", 0), 4)}
+
+
+class PortfolioStats:
+    """各配置的竞速记录，多个 worker 共用同一文件，文件变化后重新统计"""
+
+    def __init__(self, path, window=1000):
+        self.path = path
+        self.window = window
+        self._wins = {}  # 模型类别 -> {配置名: 获胜次数}
+        self._races = {}  # 模型类别 -> 竞速次数
+        self._version = None
+        self._lock = threading.Lock()
+
+    def read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        if len(lines) > 2 * self.window:
+            # 只保留最近 window 条，其他 worker 同时追加的记录可能丢失
+            lines = lines[-self.window:]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.path)
+        records = []
+        for line in lines[-self.window:]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            version = None
+        with self._lock:
+            if version == self._version:
+                return
+            self._version = version
+            self._wins, self._races = {}, {}
+            for record in self.read():
+                kind = record.get("kind")
+                self._races[kind] = self._races.get(kind, 0) + 1
+                if record.get("winner"):
+                    wins = self._wins.setdefault(kind, {})
+                    wins[record["winner"]] = wins.get(record["winner"], 0) + 1
+
+    def active(self, kind, names):
+        """竞速次数足够后剔除胜率过低的配置（按概率重新参赛），至少保留胜率最高的配置"""
+        self.refresh()
+        races = self._races.get(kind, 0)
+        if races < config.PORTFOLIO_PRUNE_AFTER:
+            return names
+        wins = self._wins.get(kind, {})
+        best = max(names, key=lambda name: wins.get(name, 0), default=None)
+        return [name for name in names if name == best or wins.get(name, 0) / races >= config.PORTFOLIO_MIN_WIN_RATE
+                or random.random() < config.PORTFOLIO_EXPLORE_RATE]
+
+    def record(self, phase, kind, winner, time_limit, results):
+        entry = {"time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "phase": phase, "kind": kind,
+                 "winner": winner, "proven": bool(winner and results[winner].get("proven")),
+                 "time_limit": time_limit,
+                 "results": {name: _result_summary(result) for name, result in results.items()}}
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.error(f"组合求解统计写入失败: {e}")
+
+
+portfolio_stats = PortfolioStats(config.PORTFOLIO_STATS_FILE)
+
+
+def summarize(records):
+    """{模型类别: {配置名: {races, wins, proven, finished, mean_elapsed}}}"""
+    summary = {}
+    for record in records:
+        for name, result in record.get("results", {}).items():
+            row = summary.setdefault(record.get("kind"), {}).setdefault(
+                name, {"races": 0, "wins": 0, "proven": 0, "finished": 0, "elapsed": 0.0})
+            row["races"] += 1
+            row["wins"] += record.get("winner") == name
+            row["proven"] += result.get("proven", False)
+            if result.get("status") != "Killed":
+                row["finished"] += 1
+                row["elapsed"] += result.get("elapsed", 0)
+    for rows in summary.values():
+        for row in rows.values():
+            # 平均耗时只计算未被终止的参赛
+            row["mean_elapsed"] = row.pop("elapsed") / row["finished"] if row["finished"] else None
+    return summary
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ['stats']:
+        print("用法: python portfolio.py stats", file=sys.stderr)
+        return 2
+    for kind, rows in sorted(summarize(portfolio_stats.read()).items(), key=lambda item: str(item[0])):
+        print(f"[{kind}]")
+        for name, row in sorted(rows.items(), key=lambda item: -item[1]["wins"]):
+            mean_elapsed = '-' if row['mean_elapsed'] is None else f"{row['mean_elapsed']:.2f}s"
+            print(f"  {name}\t参赛 {row['races']}\t获胜 {row['wins']} ({row['wins'] / row['races']:.0%})\t"
+                  f"证明最优 {row['proven']}\t完成 {row['finished']}\t平均耗时 {mean_elapsed}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
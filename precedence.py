@@ -0,0 +1,192 @@
+"""
+排队规划的分解与闭式求解。
+
+排队模型中的约束可分为两类：
+- 优先关系：同一月台队列按优先级依次作业、按序订单按路径依次作业，构成一个有向图；
+- 析取关系：同一订单在多个月台的作业互不重叠、作业不与已有忙碌窗口重叠，需要 0-1 变量。
+
+按优先关系与同订单关系将作业划分为互不相关的连通分量，对每个分量先按拓扑序计算最长路（最早开始时间）。
+最长路排班是去掉析取约束后的最优解，若它恰好满足该分量的全部析取约束，则也是原问题在该分量上的最优解，
+无需调用求解器；只有不满足的分量才构建 create_queue_model 子模型交给 CBC。
+"""
+from collections import deque
+
+from common import pulp, parse_queue_results
+from lp import create_queue_model, queue_processing_times
+from portfolio import queue_heuristic
+from problem_table import ProblemTable
+from solve_recorder import solve_model
+import config
+
+TOLERANCE = 1e-6
+
+
+def longest_path_schedule(processing_times, successors):
+    """
+    拓扑序最长路：每个作业在全部前驱结束后立即开始。
+
+    :return: (start_times, end_times, cyclic)，cyclic 为处在环上（或依赖环）而无法排定的作业集合
+    """
+    in_degree = {op: 0 for op in processing_times}
+    for op in processing_times:
+        for successor in successors[op]:
+            in_degree[successor] += 1
+
+    start_times = {op: 0.0 for op in processing_times}
+    end_times = {}
+    ready = deque(op for op, degree in in_degree.items() if degree == 0)
+    while ready:
+        op = ready.popleft()
+        end_times[op] = start_times[op] + processing_times[op]
+        for successor in successors[op]:
+            start_times[successor] = max(start_times[successor], end_times[op])
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                ready.append(successor)
+
+    cyclic = {op for op in processing_times if op not in end_times}
+    return {op: start for op, start in start_times.items() if op not in cyclic}, end_times, cyclic
+
+
+def _overlaps(start1, end1, start2, end2):
+    return end1 > start2 + TOLERANCE and end2 > start1 + TOLERANCE
+
+
+def schedule_makespan(end_times):
+    """排班的最迟结束时间，对应排队模型的目标值"""
+    return max((end for end in end_times.values() if end is not None), default=None)
+
+
+def _solve_queue_model(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows, phase,
+                       solver_factory=None):
+    model = create_queue_model(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows)
+    solve_model(model, phase, busy_windows=busy_windows, solver=solver_factory() if solver_factory else None,
+                heuristic=queue_heuristic(orders, warehouses, order_dock_assignments, specific_order_route,
+                                          busy_windows))
+    start_times, end_times = parse_queue_results(model, orders, warehouses)
+    return start_times, end_times, pulp.LpStatus[model.status]
+
+
+def _unsolved(orders, order_dock_assignments):
+    """未求解的分量：各作业时间为 None，状态为 Not Solved"""
+    ops = [(order.id, warehouse_id, dock_id) for order in orders
+           for warehouse_id, dock_id in order_dock_assignments[order.id].items()]
+    return dict.fromkeys(ops), dict.fromkeys(ops), pulp.LpStatus[pulp.LpStatusNotSolved]
+
+
+def iter_queue_schedule(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows=None,
+                        phase="queue", solver_factory=None, stop_solving=None):
+    """
+    逐块产出排队规划结果：先产出全部可闭式求解分量的最长路排班（可能为空），再逐个产出子模型求解的分量。
+
+    参数与 create_queue_model 一致。
+    :param solver_factory: 每次求解子模型前调用以创建求解器（如按剩余时间设置时限），默认使用 CBC 默认参数
+    :param stop_solving: 每次求解子模型前调用，返回 True 时（如时限已用完）不再构建、求解该分量，
+                         直接产出 Not Solved，各作业时间为 None，由调用方改用启发式
+    :return: 生成器，每项为 (start_times, end_times, status)，格式与 parse_queue_results 一致，
+             status 为 LpStatus 字符串；各块涉及的月台互不相交
+    """
+    if busy_windows is None:
+        busy_windows = {}
+    if not config.QUEUE_DECOMPOSITION:
+        if stop_solving is not None and stop_solving():
+            yield _unsolved(orders, order_dock_assignments)
+            return
+        yield _solve_queue_model(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows,
+                                 phase, solver_factory)
+        return
+    table = ProblemTable(orders, warehouses)
+    dock_queues, processing_times = queue_processing_times(orders, warehouses, order_dock_assignments, table)
+
+    # 并查集：同一月台、同一订单的作业属于同一分量
+    parent = {op: op for op in processing_times}
+
+    def find(op):
+        while parent[op] != op:
+            parent[op] = parent[parent[op]]
+            op = parent[op]
+        return op
+
+    def union(op1, op2):
+        parent[find(op1)] = find(op2)
+
+    # 优先关系：月台队列与按序路径
+    successors = {op: [] for op in processing_times}
+    for (warehouse_id, dock_id), orders_in_dock in dock_queues.items():
+        for order, next_order in zip(orders_in_dock, orders_in_dock[1:]):
+            op, next_op = (order.id, warehouse_id, dock_id), (next_order.id, warehouse_id, dock_id)
+            successors[op].append(next_op)
+            union(op, next_op)
+    for order_id, expected_route in specific_order_route.items():
+        for prev_warehouse, curr_warehouse in zip(expected_route, expected_route[1:]):
+            op = (order_id, prev_warehouse, order_dock_assignments[order_id][prev_warehouse])
+            next_op = (order_id, curr_warehouse, order_dock_assignments[order_id][curr_warehouse])
+            successors[op].append(next_op)
+            union(op, next_op)
+
+    # 析取关系：同一订单的多个作业
+    order_ops = {}
+    for order in orders:
+        ops = [(order.id, w_id, d_id) for w_id, d_id in order_dock_assignments[order.id].items()]
+        order_ops[order.id] = ops
+        for op in ops[1:]:
+            union(ops[0], op)
+
+    start_times, end_times, cyclic = longest_path_schedule(processing_times, successors)
+
+    # 检查最长路排班是否满足各分量的析取约束
+    needs_solver = {find(op) for op in cyclic}
+    for ops in order_ops.values():
+        for i in range(len(ops)):
+            for j in range(i + 1, len(ops)):
+                if ops[i] in end_times and ops[j] in end_times and _overlaps(
+                        start_times[ops[i]], end_times[ops[i]], start_times[ops[j]], end_times[ops[j]]):
+                    needs_solver.add(find(ops[i]))
+    for op in end_times:
+        order_id, warehouse_id, dock_id = op
+        for busy_start, busy_end in busy_windows.get((warehouse_id, dock_id), []):
+            if _overlaps(start_times[op], end_times[op], busy_start, busy_end):
+                needs_solver.add(find(op))
+                break
+
+    yield ({op: start for op, start in start_times.items() if find(op) not in needs_solver},
+           {op: end for op, end in end_times.items() if find(op) not in needs_solver},
+           pulp.LpStatus[pulp.LpStatusOptimal])
+
+    # 需要 0-1 变量的分量分别构建子模型
+    component_orders = {}
+    for order in orders:
+        if order_ops[order.id] and find(order_ops[order.id][0]) in needs_solver:
+            component_orders.setdefault(find(order_ops[order.id][0]), []).append(order)
+    component_docks = {}
+    for op in processing_times:
+        if find(op) in needs_solver:
+            component_docks.setdefault(find(op), set()).add((op[1], op[2]))
+
+    for component, sub_orders in component_orders.items():
+        sub_order_ids = {order.id for order in sub_orders}
+        sub_routes = {order_id: route for order_id, route in specific_order_route.items() if order_id in sub_order_ids}
+        if stop_solving is not None and stop_solving():
+            yield _unsolved(sub_orders, order_dock_assignments)
+            continue
+        sub_windows = {dock_key: busy_windows.get(dock_key, []) for dock_key in component_docks[component]}
+        yield _solve_queue_model(sub_orders, warehouses, order_dock_assignments, sub_routes, sub_windows, phase,
+                                 solver_factory)
+
+
+def schedule_queue(orders, warehouses, order_dock_assignments, specific_order_route, busy_windows=None,
+                   phase="queue"):
+    """
+    排队规划：可闭式求解的分量直接取最长路排班，其余分量分别构建子模型求解。
+
+    :return: (start_times, end_times, status)，status 为各分量中第一个非最优的状态，全部最优时为 Optimal
+    """
+    start_times, end_times = {}, {}
+    status = pulp.LpStatus[pulp.LpStatusOptimal]
+    for chunk_start_times, chunk_end_times, chunk_status in iter_queue_schedule(
+            orders, warehouses, order_dock_assignments, specific_order_route, busy_windows, phase):
+        start_times.update(chunk_start_times)
+        end_times.update(chunk_end_times)
+        if status == pulp.LpStatus[pulp.LpStatusOptimal]:
+            status = chunk_status
+    return start_times, end_times, status
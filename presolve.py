@@ -0,0 +1,112 @@
+"""
+求解前的可行性筛查。
+
+月台分配模型要求订单在每个有载货的仓库恰好选择一个兼容月台，任何一个订单无法满足都会使整个模型不可行，
+而这要等 CBC 完整运行后才能发现。这里在建模前逐个订单检查：
+- 仓库存在且有可用于本阶段（装车/卸车）的月台；
+- 仓库中有与订单需求车型兼容的月台；
+- 订单至少在一个仓库有载货；
+- 按序订单的路线不重复经过同一仓库，且路线上每个仓库都有载货（否则排队模型找不到对应的月台分配）。
+
+不满足的订单按 PRESOLVE_MODE 从本次规划中剔除（exclude，默认）或使整个请求失败（reject），
+错误为 [{"order_id", "warehouse_id", "code", "message"}, ...]。
+求解后再检查每个订单在有载货的仓库都得到了月台分配。
+"""
+from lp import generate_specific_order_route
+from problem_table import ProblemTable
+import config
+
+PHASE_NAMES = {"loading": "装车", "unloading": "卸车"}
+
+
+class InfeasibleOrdersError(Exception):
+    """订单无法排队，errors 为结构化错误列表"""
+
+    def __init__(self, errors, message="存在无法排队的订单。"):
+        self.errors = errors
+        self.message = message
+        super().__init__("; ".join(error["message"] for error in errors))
+
+
+class SolveFailedError(InfeasibleOrdersError):
+    """筛查通过但求解器未给出完整的可行解（如超时）"""
+
+    def __init__(self, errors):
+        super().__init__(errors, "求解失败。")
+
+
+def order_error(order_id, code, message, warehouse_id=None):
+    error = {"order_id": order_id, "code": code, "message": message}
+    if warehouse_id is not None:
+        error["warehouse_id"] = warehouse_id
+    return error
+
+
+def screen_orders(orders, warehouses, all_warehouse_ids, phase):
+    """
+    :param orders: 本阶段订单
+    :param warehouses: 本阶段仓库（只含可用于本阶段的月台）
+    :param all_warehouse_ids: 请求中的全部仓库 ID，用于区分“仓库不存在”与“仓库没有本阶段可用的月台”
+    :return: (可行订单列表, 错误列表)
+    """
+    table = ProblemTable(orders, warehouses)
+    phase_name = PHASE_NAMES.get(phase, phase)
+    routes = generate_specific_order_route(orders)
+    feasible, errors = [], []
+    for i, order in enumerate(orders):
+        order_errors = []
+        for load in order.warehouse_loads:
+            if not load.quantity or load.quantity <= 0 or load.warehouse_id in table.warehouse_index:
+                continue
+            if load.warehouse_id in all_warehouse_ids:
+                order_errors.append(order_error(order.id, "no_dock_for_phase",
+                                                f"仓库 {load.warehouse_id} 没有可用于{phase_name}的月台",
+                                                load.warehouse_id))
+            else:
+                order_errors.append(order_error(order.id, "unknown_warehouse", f"仓库 {load.warehouse_id} 不存在",
+                                                load.warehouse_id))
+
+        for w, warehouse in enumerate(warehouses):
+            if table.loads[i, w] > 0 and not table.compatible[i, slice(*table.warehouse_dock_slices[w])].any():
+                order_errors.append(order_error(
+                    order.id, "no_compatible_dock",
+                    f"仓库 {warehouse.id} 没有兼容车型 {order.required_carriage} 的{phase_name}月台", warehouse.id))
+
+        if not order_errors and not (table.loads[i] > 0).any():
+            order_errors.append(order_error(order.id, "no_load", "订单在各仓库均没有载货"))
+
+        route = routes.get(order.id)
+        if route is not None:
+            if len(set(route)) != len(route):
+                order_errors.append(order_error(order.id, "route_inconsistent", "按序路线重复经过同一仓库"))
+            flagged = {error.get("warehouse_id") for error in order_errors}
+            for warehouse_id in route:
+                if table.load(order.id, warehouse_id) <= 0 and warehouse_id not in flagged:
+                    order_errors.append(order_error(order.id, "route_inconsistent",
+                                                    f"按序路线经过仓库 {warehouse_id}，但订单在该仓库没有载货",
+                                                    warehouse_id))
+
+        if order_errors:
+            errors.extend(order_errors)
+        else:
+            feasible.append(order)
+    return feasible, errors
+
+
+def check_presolve(errors):
+    """reject 模式下存在不可行订单时整个请求失败"""
+    if errors and config.PRESOLVE_MODE == 'reject':
+        raise InfeasibleOrdersError(errors)
+
+
+def missing_assignments(orders, warehouses, order_dock_assignments):
+    """求解后检查：订单在每个有载货的仓库都应得到月台分配"""
+    table = ProblemTable(orders, warehouses)
+    errors = []
+    for i, order in enumerate(orders):
+        assigned = order_dock_assignments.get(order.id, {})
+        for w, warehouse in enumerate(warehouses):
+            if table.loads[i, w] > 0 and warehouse.id not in assigned:
+                errors.append(order_error(order.id, "missing_assignment", f"仓库 {warehouse.id} 未分配月台",
+                                          warehouse.id))
+    return errors
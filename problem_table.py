@@ -0,0 +1,135 @@
+from functools import cached_property
+
+from lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+
+class DockView:
+    """
+    月台维度的列式数据，只依赖仓库与月台，同一仓库列表上构建的多个 ProblemTable 可共用。
+
+    - dock_ids, dock_warehouse, dock_efficiency, dock_types：展平后的月台维度数组，
+      warehouse_dock_slices[w] 为第 w 个仓库在月台数组中的 [start, stop) 区间
+    - dock_carriage_mask：月台车型兼容位图，carriage_bits 记录车型到位的映射
+
+    dock_efficiency 取构建时 dock.efficiency 的值，应在 set_efficiency 之后构建。
+    """
+
+    def __init__(self, warehouses):
+        self.docks = [dock for warehouse in warehouses for dock in warehouse.docks]
+        self.dock_ids = np.array([dock.id for dock in self.docks])
+        self.dock_warehouse = np.array([w for w, warehouse in enumerate(warehouses) for _ in warehouse.docks],
+                                       dtype=np.int64)
+        self.dock_efficiency = np.array(
+            [dock.efficiency if dock.efficiency is not None else np.nan for dock in self.docks], dtype=float)
+        self.dock_types = np.array([dock.dock_type for dock in self.docks])
+        self.warehouse_dock_slices = []
+        start = 0
+        for warehouse in warehouses:
+            self.warehouse_dock_slices.append((start, start + len(warehouse.docks)))
+            start += len(warehouse.docks)
+
+        carriage_types = {}
+        for dock in self.docks:
+            for carriage in dock.compatible_carriage or []:
+                carriage_types.setdefault(carriage, len(carriage_types))
+        self.carriage_bits = carriage_types
+        # 月台都不兼容的车型共用最高一位，车型超过 63 种时退化为 Python 整数（object 数组）
+        self.mask_dtype = np.uint64 if len(carriage_types) < 64 else object
+        self.dock_carriage_mask = np.array([self.carriage_mask(dock.compatible_carriage or []) for dock in self.docks],
+                                           dtype=self.mask_dtype)
+
+    def carriage_mask(self, carriages):
+        mask = 0
+        for carriage in carriages:
+            mask |= 1 << self.carriage_bits.get(carriage, len(self.carriage_bits))
+        return mask
+
+
+class WarehouseList(list):
+    """仓库列表，首次使用时构建并缓存 DockView；构建后不应再修改仓库、月台或月台效率"""
+
+    @cached_property
+    def dock_view(self):
+        return DockView(self)
+
+
+class ProblemTable:
+    """
+    订单/仓库/月台的列式视图，供模型构建与匹配代码按下标读取。
+
+    - order_ids, priorities：订单维度数组
+    - warehouse_ids：仓库维度数组
+    - loads：形状为 (订单数, 仓库数) 的载货量矩阵，订单在该仓库无载货时为 0
+    - dock_ids, dock_warehouse, dock_efficiency, dock_types：展平后的月台维度数组，
+      warehouse_dock_slices[w] 为第 w 个仓库在月台数组中的 [start, stop) 区间
+    - order_carriage_mask, dock_carriage_mask：车型兼容位图，carriage_bits 记录车型到位的映射；
+      compatible 为形状 (订单数, 月台数) 的布尔矩阵，订单未指定车型时视为全部兼容
+
+    注意：dock_efficiency 取构建时 dock.efficiency 的值，应在 set_efficiency 之后构建。
+    warehouses 为 WarehouseList 时复用其缓存的月台数组与位图。
+    """
+
+    def __init__(self, orders, warehouses):
+        self.orders = list(orders)
+        self.warehouses = list(warehouses)
+        self.order_ids = np.array([order.id for order in self.orders])
+        self.order_index = {order.id: i for i, order in enumerate(self.orders)}
+        self.priorities = np.array([order.priority or 0 for order in self.orders], dtype=float)
+        self.warehouse_ids = np.array([warehouse.id for warehouse in self.warehouses])
+        self.warehouse_index = {warehouse.id: i for i, warehouse in enumerate(self.warehouses)}
+
+        # 载货量矩阵，同一仓库出现多次时取第一条记录（与原有 next(...) 查找一致）
+        self.loads = np.zeros((len(self.orders), len(self.warehouses)))
+        for i, order in enumerate(self.orders):
+            seen = set()
+            for load in order.warehouse_loads:
+                w = self.warehouse_index.get(load.warehouse_id)
+                if w is None or w in seen:
+                    continue
+                seen.add(w)
+                self.loads[i, w] = load.quantity or 0
+
+        # 月台数组与车型兼容位图
+        view = warehouses.dock_view if isinstance(warehouses, WarehouseList) else DockView(self.warehouses)
+        self.docks = view.docks
+        self.dock_ids = view.dock_ids
+        self.dock_warehouse = view.dock_warehouse
+        self.dock_efficiency = view.dock_efficiency
+        self.dock_types = view.dock_types
+        self.warehouse_dock_slices = view.warehouse_dock_slices
+        self.carriage_bits = view.carriage_bits
+        self.dock_carriage_mask = view.dock_carriage_mask
+        self.order_carriage_mask = np.array(
+            [0 if order.required_carriage is None else view.carriage_mask([order.required_carriage])
+             for order in self.orders], dtype=view.mask_dtype)
+        if len(self.orders) and len(self.docks):
+            self.compatible = ((self.order_carriage_mask[:, None] & self.dock_carriage_mask[None, :]) != 0) | \
+                              (self.order_carriage_mask == 0)[:, None]
+            self.compatible = self.compatible.astype(bool)
+        else:
+            self.compatible = np.zeros((len(self.orders), len(self.docks)), dtype=bool)
+
+    def load(self, order_id, warehouse_id):
+        """订单在某仓库的载货量，不存在时为 0"""
+        i = self.order_index.get(order_id)
+        w = self.warehouse_index.get(warehouse_id)
+        if i is None or w is None:
+            return 0
+        return self.loads[i, w]
+
+    def orders_with_load(self, warehouse_id):
+        """在某仓库有载货的订单下标数组"""
+        w = self.warehouse_index[warehouse_id]
+        return np.nonzero(self.loads[:, w] > 0)[0]
+
+    def dock_range(self, warehouse_id):
+        start, stop = self.warehouse_dock_slices[self.warehouse_index[warehouse_id]]
+        return range(start, stop)
+
+    def assignment_binaries(self):
+        """月台分配模型中未被固定为 0 的 0-1 变量数：每个订单在有载货仓库中的兼容月台数之和"""
+        if not len(self.docks):
+            return 0
+        return int(((self.loads > 0)[:, self.dock_warehouse] & self.compatible).sum())
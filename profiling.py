@@ -0,0 +1,126 @@
+"""
+按请求开启的 CPU 性能剖析。
+
+请求头 X-Profile: 1（NP_PROFILE_HEADER 开启时）或按 NP_PROFILE_SAMPLE_RATE 抽样命中的请求，
+在 cProfile 下执行接口函数，同时由采样线程定时抓取该请求线程的调用栈。结果写入 PROFILE_DIR：
+- <时间>_<接口>_<请求ID>.pstats：cProfile 调用树，可用 pstats / snakeviz 查看；
+- <时间>_<接口>_<请求ID>.collapsed：折叠调用栈（每行 "帧;帧;帧 次数"），可直接交给 flamegraph.pl / speedscope。
+请求 ID 取自请求头 X-Request-ID，没有时随机生成，并通过响应头 X-Profile-Id 返回。
+"""
+import cProfile
+import functools
+import glob
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import request, make_response
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 同一进程内同时只剖析一个请求：cProfile 在较新的 Python 中不允许多个实例同时启用
+_profile_lock = threading.Lock()
+
+
+class StackSampler:
+    """后台线程定时抓取目标线程的调用栈，累计为折叠栈计数"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def should_profile():
+    if config.PROFILE_HEADER and request.headers.get('X-Profile', '').strip().lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    return config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE
+
+
+def request_id():
+    """请求 ID 用于文件名，只保留字母数字、'-' 和 '_'"""
+    value = re.sub(r'[^0-9A-Za-z_-]', '', request.headers.get('X-Request-ID', ''))[:64]
+    return value or uuid.uuid4().hex
+
+
+def prune_profiles(directory, keep):
+    """只保留最近的 keep 份剖析结果"""
+    paths = sorted(glob.glob(os.path.join(directory, '*.pstats')), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        for stale in (path, path[:-len('.pstats')] + '.collapsed'):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def profiled(view):
+    """接口函数装饰器，命中剖析条件时记录调用树与折叠栈，否则原样执行"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not should_profile() or not _profile_lock.acquire(blocking=False):
+            return view(*args, **kwargs)
+
+        profile_id = request_id()
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), config.PROFILE_INTERVAL)
+        started_at = time.perf_counter()
+        try:
+            sampler.start()
+            profiler.enable()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                profiler.disable()
+                sampler.stop()
+
+            elapsed = time.perf_counter() - started_at
+            os.makedirs(config.PROFILE_DIR, exist_ok=True)
+            base = os.path.join(config.PROFILE_DIR,
+                                f"{time.strftime('%Y%m%d-%H%M%S')}_{request.endpoint}_{profile_id}")
+            profiler.dump_stats(base + '.pstats')
+            sampler.write(base + '.collapsed')
+            prune_profiles(config.PROFILE_DIR, config.PROFILE_KEEP)
+            logger.info(f"请求剖析完成: {base}.pstats, 耗时 {elapsed:.3f}s, 采样 {sum(sampler.stacks.values())} 次")
+        finally:
+            _profile_lock.release()
+
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    return wrapper
@@ -0,0 +1,212 @@
+"""
+生产日志回放压测。
+
+从 application.log 及其轮转文件（application.log.1 ~ .5）中提取
+"Received [external|internal|dropPull] request with data: {...}" 记录的请求体（及所属站点），按原始时间间隔
+（可按倍数压缩）或固定速率并发回放到本地服务，统计各接口的吞吐、p50/p95/p99 延迟与错误率。
+
+回放会写入目标服务的调度文件，应在独立目录启动的本地实例上运行：
+
+    python replay_logs.py --url http://127.0.0.1:5010 --logs 'logs/application.log*' --speed 10 --concurrency 8
+    python replay_logs.py --rate 20 --output current.json --baseline last_release.json
+
+指定 --baseline 时，总吞吐下降或某接口 p95 上升超过 --max-regression 则以状态码 1 退出。
+"""
+import argparse
+import glob
+import json
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ENDPOINTS = {
+    'external': '/external_orders_queueing',
+    'internal': '/internal_orders_queueing',
+    'dropPull': '/drop_pull_scheduling',
+}
+
+LOG_LINE = re.compile(r"^\[(?P<time>[^\]]+)\] - .*? (?:site: (?P<site>[A-Za-z0-9_-]+) )?"
+                      r"Received \[(?P<type>external|internal|dropPull)\] request with data: (?P<data>.*)$")
+LOG_TIME_FORMAT = '%d/%b/%Y %H:%M:%S'
+
+
+def log_files(pattern):
+    """按时间从旧到新排列轮转日志：application.log.5, ..., application.log.1, application.log"""
+
+    def rotation_index(path):
+        suffix = path.rsplit('.', 1)[-1]
+        return int(suffix) if suffix.isdigit() else 0
+
+    return sorted(glob.glob(pattern), key=rotation_index, reverse=True)
+
+
+def extract_requests(paths, request_types=None):
+    """
+    提取日志中的请求记录，无法解析为 JSON 的行（如校验失败时记录的原始请求体）跳过。
+
+    :return: [(时间戳, 请求类型, 请求体字符串, 站点), ...]，按时间排序，未记录站点时站点为 None
+    """
+    requests = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                match = LOG_LINE.match(line.rstrip('\n'))
+                if match is None or (request_types and match['type'] not in request_types):
+                    continue
+                try:
+                    json.loads(match['data'])
+                    timestamp = datetime.strptime(match['time'], LOG_TIME_FORMAT).timestamp()
+                except ValueError:
+                    continue
+                requests.append((timestamp, match['type'], match['data'], match['site']))
+    requests.sort(key=lambda r: r[0])  # 稳定排序，同一秒内保持日志顺序
+    return requests
+
+
+def send(url, body, timeout, site_id=None):
+    """发送请求，返回 (HTTP 状态码, 耗时)，连接失败时状态码为 None"""
+    headers = {'Content-Type': 'application/json'}
+    if site_id is not None:
+        headers['X-Site-ID'] = site_id
+    req = urllib.request.Request(url, data=body.encode('utf-8'), headers=headers, method='POST')
+    started_at = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = None
+    return status, time.perf_counter() - started_at
+
+
+def percentile(sorted_values, q):
+    """最近秩百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def replay(requests, base_url, concurrency=4, speed=1.0, rate=None, timeout=600):
+    """
+    回放请求。
+
+    :param speed: 时间压缩倍数，按日志中的时间间隔除以 speed 发送；0 表示不等待、尽快发送
+    :param rate: 固定发送速率（请求/秒），指定时忽略日志时间
+    :return: 统计结果字典
+    """
+    results = {request_type: [] for request_type in ENDPOINTS}
+    lock = threading.Lock()
+    lags = []
+
+    def run(request_type, body, site_id, scheduled_at):
+        lag = time.perf_counter() - scheduled_at
+        status, elapsed = send(base_url.rstrip('/') + ENDPOINTS[request_type], body, timeout, site_id)
+        with lock:
+            results[request_type].append((status, elapsed))
+            lags.append(lag)
+
+    first_timestamp = requests[0][0] if requests else 0
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, (timestamp, request_type, body, site_id) in enumerate(requests):
+            if rate:
+                offset = i / rate
+            elif speed > 0:
+                offset = (timestamp - first_timestamp) / speed
+            else:
+                offset = 0
+            scheduled_at = started_at + offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, request_type, body, site_id, scheduled_at)
+    wall_time = time.perf_counter() - started_at
+
+    report = {"requests": len(requests), "wall_time": wall_time,
+              "throughput": len(requests) / wall_time if wall_time > 0 else 0,
+              "max_dispatch_lag": max(lags, default=0), "endpoints": {}}
+    for request_type, samples in results.items():
+        if not samples:
+            continue
+        latencies = sorted(elapsed for _, elapsed in samples)
+        errors = sum(1 for status, _ in samples if status is None or status >= 400)
+        report["endpoints"][request_type] = {
+            "count": len(samples),
+            "throughput": len(samples) / wall_time if wall_time > 0 else 0,
+            "error_rate": errors / len(samples),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1],
+        }
+    return report
+
+
+def compare(report, baseline, max_regression):
+    """与基线报告比较，返回回退描述列表"""
+    regressions = []
+    if baseline["throughput"] and report["throughput"] < baseline["throughput"] * (1 - max_regression):
+        regressions.append(f"总吞吐 {report['throughput']:.2f}/s < 基线 {baseline['throughput']:.2f}/s")
+    for request_type, current in report["endpoints"].items():
+        previous = baseline["endpoints"].get(request_type)
+        if previous and previous["p95"] and current["p95"] > previous["p95"] * (1 + max_regression):
+            regressions.append(f"{request_type} p95 {current['p95']:.3f}s > 基线 {previous['p95']:.3f}s")
+    return regressions
+
+
+def print_report(report):
+    print(f"请求数 {report['requests']}，耗时 {report['wall_time']:.2f}s，吞吐 {report['throughput']:.2f} 请求/秒，"
+          f"最大发送延迟 {report['max_dispatch_lag']:.2f}s")
+    print(f"{'接口':<10}{'请求数':>8}{'吞吐/s':>10}{'错误率':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for request_type, stats in report["endpoints"].items():
+        print(f"{request_type:<10}{stats['count']:>8}{stats['throughput']:>10.2f}{stats['error_rate']:>10.2%}"
+              f"{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从 application.log 提取请求并回放压测")
+    parser.add_argument('--url', default='http://127.0.0.1:5010')
+    parser.add_argument('--logs', default='application.log*', help="日志文件通配符，包含轮转文件")
+    parser.add_argument('--types', nargs='*', choices=list(ENDPOINTS), help="只回放指定类型的请求")
+    parser.add_argument('--limit', type=int, help="最多回放的请求数")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--speed', type=float, default=1.0, help="时间压缩倍数，0 表示尽快发送")
+    parser.add_argument('--rate', type=float, help="固定发送速率（请求/秒），忽略日志时间")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', help="将报告写入 JSON 文件")
+    parser.add_argument('--baseline', help="基线报告 JSON 文件")
+    parser.add_argument('--max-regression', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    requests = extract_requests(log_files(args.logs), args.types)
+    if args.limit:
+        requests = requests[:args.limit]
+    if not requests:
+        print("日志中没有可回放的请求")
+        return 1
+
+    report = replay(requests, args.url, args.concurrency, args.speed, args.rate, args.timeout)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"性能回退: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+幂等响应缓存。
+
+上游超时重试会重复发送相同的请求，缓存以“问题签名”为键：请求体按键排序后的规范化 JSON，
+加上涉及月台在调度文件中的已有占用记录（排除本次请求自身的订单）。
+- TTL + LRU 淘汰；
+- 单飞（single-flight）：并发的相同请求只计算一次，其余请求等待结果（结果不可缓存时各自重新计算）；
+- 调度文件中涉及月台的记录发生变化时，相关缓存条目失效。
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from common import register_schedule_listener, convert_str_to_timestamp, pd
+
+
+def involved_dock_keys(warehouses):
+    return {(str(warehouse.id), str(dock.id)) for warehouse in warehouses for dock in warehouse.docks}
+
+
+def problem_signature(data, filename, dock_keys, orders):
+    """
+    计算请求的规范化签名。
+
+    :param data: 原始请求数据
+    :param filename: 调度文件名
+    :param dock_keys: 涉及的 (仓库ID, 月台ID) 集合（字符串）
+    :param orders: 本次请求的订单，其在调度文件中的记录不参与签名
+    :return: 十六进制签名字符串
+    """
+    digest = hashlib.sha256()
+    digest.update(filename.encode('utf-8'))  # 不同站点的调度文件互不相干，相同请求体不能共用结果
+    digest.update(b'\n')
+    digest.update(json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+    try:
+        schedule = pd.read_csv(filename, encoding='utf-8')
+    except FileNotFoundError:
+        schedule = None
+
+    if schedule is not None and not schedule.empty:
+        order_ids = {str(order.id) for order in orders}
+        current_timestamp = datetime.now().timestamp()
+        busy_rows = sorted(
+            (w, d, start, end)
+            for o, w, d, start, end in zip(schedule['Order ID'].astype(str), schedule['Warehouse ID'].astype(str),
+                                           schedule['Dock ID'].astype(str), schedule['Start Time'].astype(str),
+                                           schedule['End Time'].astype(str))
+            if (w, d) in dock_keys and o not in order_ids and convert_str_to_timestamp(end) > current_timestamp)
+        for row in busy_rows:
+            digest.update('|'.join(row).encode('utf-8'))
+            digest.update(b'\n')
+
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.cacheable = False  # 领头请求正常返回且结果可缓存时为 True
+
+
+class ResponseCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 值, 调度文件名, 涉及月台)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute, filename, dock_keys):
+        """
+        命中缓存时直接返回；否则由第一个请求执行 compute，并发的相同请求等待其结果。
+        领头请求的结果不可缓存（如准入拒绝的 429、400、500）或抛出异常时，等待的请求重新查询并自行计算，
+        不共用该结果。
+
+        :param compute: 无参函数，返回 (value, cacheable)，cacheable 为 False 时结果不写入缓存
+        :return: (value, cached)
+        """
+        if self.maxsize <= 0:
+            return compute()[0], False
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[0] > time.monotonic():
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return entry[1], True
+                    del self._entries[key]
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = _Flight()
+                    self.misses += 1
+            if leader:
+                break
+            flight.event.wait()
+            if flight.cacheable:
+                with self._lock:
+                    self.hits += 1
+                return flight.value, True
+
+        value, cacheable = None, False
+        try:
+            value, cacheable = compute()
+            flight.value = value
+            flight.cacheable = cacheable
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if flight.cacheable:
+                    self._entries[key] = (time.monotonic() + self.ttl, value, filename, frozenset(dock_keys))
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+            flight.event.set()
+        return value, False
+
+    def invalidate(self, filename, dock_keys):
+        """调度文件中的月台记录变化时，使涉及这些月台的缓存条目失效"""
+        with self._lock:
+            stale = [key for key, (_, _, entry_filename, entry_docks) in self._entries.items()
+                     if entry_filename == filename and not entry_docks.isdisjoint(dock_keys)]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def create_response_cache(maxsize, ttl):
+    cache = ResponseCache(maxsize, ttl)
+    register_schedule_listener(cache.invalidate)
+    return cache
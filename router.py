@@ -0,0 +1,162 @@
+"""
+站点路由：按站点将请求转发到各自的分片进程组。
+
+每个分片是一组独立的 gunicorn worker（wsgi:application），拥有各自的调度文件目录、响应缓存、求解进程与指标目录，
+某个站点拥堵时只占用所属分片的 worker，不影响其他站点的延迟；增加站点时可增加分片横向扩展。
+
+    NP_SHARDS=2 NP_SITE_SHARDS='siteA=0,siteB=1' NP_SHARD_WORKERS='0=4,1=2' python router.py
+
+路由进程监听 NP_BIND，分片 i 监听 127.0.0.1:(NP_SHARD_BASE_PORT + i)。请求头 X-Site-ID（或查询参数 site_id）
+决定所属分片，未指定站点的请求进入 0 号分片；/ready 在全部分片就绪后返回 200，/metrics 按分片汇总指标。
+"""
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs
+
+import config
+from metrics import aggregate_metrics
+from sites import InvalidSiteError, parse_mapping, request_site_id, shard_for_site
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROXY_TIMEOUT = config.env_int('NP_WORKER_TIMEOUT', 600)
+CHUNK_SIZE = 64 * 1024
+
+# 逐跳首部不转发，由各段连接自行处理（分块传输由 http.client 与 gunicorn 分别重新编码）
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+                      'transfer-encoding', 'upgrade'}
+
+
+def shard_port(shard):
+    return config.SHARD_BASE_PORT + shard
+
+
+def shard_metrics_dir(shard):
+    return os.path.join(config.METRICS_DIR, f"shard-{shard}")
+
+
+def json_response(start_response, status, body):
+    payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(payload)))])
+    return [payload]
+
+
+def request_headers(environ):
+    """从 WSGI environ 还原请求首部"""
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            name = key[5:].replace('_', '-').title()
+            if name.lower() not in HOP_BY_HOP_HEADERS:
+                headers[name] = value
+    if environ.get('CONTENT_TYPE'):
+        headers['Content-Type'] = environ['CONTENT_TYPE']
+    if environ.get('CONTENT_LENGTH'):
+        headers['Content-Length'] = environ['CONTENT_LENGTH']
+    return headers
+
+
+def has_body(environ):
+    return bool(environ.get('CONTENT_LENGTH')) or 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower()
+
+
+def stream_response(connection, response):
+    """逐块转发分片的响应，流式接口的每一行在分片产出后即可到达客户端"""
+    try:
+        while True:
+            chunk = response.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        connection.close()
+
+
+def forward(environ, start_response, shard):
+    path = environ.get('RAW_URI') or environ.get('PATH_INFO', '/')
+    if not environ.get('RAW_URI') and environ.get('QUERY_STRING'):
+        path = f"{path}?{environ['QUERY_STRING']}"
+    connection = http.client.HTTPConnection('127.0.0.1', shard_port(shard), timeout=PROXY_TIMEOUT)
+    try:
+        # 请求体按块读取转发（无 Content-Length 时以分块编码发送），不在路由进程中缓存整个请求
+        connection.request(environ['REQUEST_METHOD'], path,
+                           body=environ['wsgi.input'] if has_body(environ) else None,
+                           headers=request_headers(environ))
+        response = connection.getresponse()
+    except OSError:
+        connection.close()
+        return json_response(start_response, '502 Bad Gateway',
+                             {"code": 1, "message": f"站点分片 {shard} 不可用。"})
+    headers = [(name, value) for name, value in response.getheaders() if name.lower() not in HOP_BY_HOP_HEADERS]
+    headers.append(('X-Shard', str(shard)))
+    start_response(f"{response.status} {response.reason}", headers)
+    return stream_response(connection, response)
+
+
+def shard_ready(shard):
+    connection = http.client.HTTPConnection('127.0.0.1', shard_port(shard), timeout=5)
+    try:
+        connection.request('GET', '/ready')
+        response = connection.getresponse()
+        response.read()
+        return response.status == 200
+    except OSError:
+        return False
+    finally:
+        connection.close()
+
+
+def application(environ, start_response):
+    path = environ.get('PATH_INFO', '/')
+    if path == '/ready':
+        shards = {str(shard): shard_ready(shard) for shard in range(config.SHARDS)}
+        status = '200 OK' if all(shards.values()) else '503 Service Unavailable'
+        return json_response(start_response, status, {"ready": all(shards.values()), "shards": shards})
+    if path == '/metrics':
+        return json_response(start_response, '200 OK', {
+            "shards": {str(shard): aggregate_metrics(shard_metrics_dir(shard)) for shard in range(config.SHARDS)}})
+
+    args = {key: values[0] for key, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+    try:
+        site_id = request_site_id({'X-Site-ID': environ.get('HTTP_X_SITE_ID')}, args)
+    except InvalidSiteError as e:
+        return json_response(start_response, '400 Bad Request', {
+            "code": 1, "message": "请求参数校验失败。", "errors": [{"path": "site_id", "message": str(e)}]})
+    return forward(environ, start_response, shard_for_site(site_id))
+
+
+def main():
+    """启动全部分片与路由进程，任一进程退出时停止其余进程"""
+    shard_workers = parse_mapping(config.SHARD_WORKERS)
+    processes = []
+    for shard in range(config.SHARDS):
+        env = dict(os.environ, NP_BIND=f"127.0.0.1:{shard_port(shard)}",
+                   NP_WORKERS=str(shard_workers.get(str(shard), config.WORKERS)),
+                   NP_METRICS_DIR=shard_metrics_dir(shard))
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'], cwd=BASE_DIR, env=env))
+    # 路由进程只做转发，使用单进程多线程，命令行参数覆盖 gunicorn.conf.py 中的分片配置
+    processes.append(subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', config.BIND, '--workers', '1',
+         '--worker-class', 'gthread', '--threads', str(config.ROUTER_THREADS), 'router:application'],
+        cwd=BASE_DIR))
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while all(process.poll() is None for process in processes):
+        time.sleep(1)
+    stop(None, None)
+    return max(process.wait() for process in processes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
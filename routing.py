@@ -0,0 +1,80 @@
+"""
+内部订单多站点路线排序。
+
+装货站点原先按请求中出现的顺序依次访问，不考虑仓库位置。这里按仓库间的球面距离（haversine）排序：
+以每个站点为起点各做一次最近邻构造，再用 2-opt 反转片段改进，取总里程最短的顺序。
+
+卸货顺序由装货顺序决定（后装先卸），因此评估一个装货顺序时按 route_of 展开为完整路线（装货站点 + 卸货站点）
+计算里程，保证排序后的路线仍满足后进先出。
+"""
+from utils import haversine_distance
+
+IMPROVEMENT_TOLERANCE = 1e-9
+
+
+def _distance(locations, warehouse_id1, warehouse_id2):
+    if warehouse_id1 == warehouse_id2:
+        return 0.0
+    location1, location2 = locations[warehouse_id1], locations[warehouse_id2]
+    return haversine_distance(location1['latitude'], location1['longitude'],
+                              location2['latitude'], location2['longitude'])
+
+
+def route_length(route, locations):
+    """路线总里程（千米），相邻的重复站点不计"""
+    return sum(_distance(locations, a, b) for a, b in zip(route, route[1:]))
+
+
+def _nearest_neighbour(start, stops, locations):
+    path = [start]
+    remaining = [stop for stop in stops if stop != start]
+    while remaining:
+        nearest = min(remaining, key=lambda stop: _distance(locations, path[-1], stop))
+        path.append(nearest)
+        remaining.remove(nearest)
+    return path
+
+
+def _two_opt(path, cost):
+    """开放路径的 2-opt：反转任意片段，有改进即接受，直到没有改进"""
+    best_cost = cost(path)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(path) - 1):
+            for j in range(i + 1, len(path)):
+                candidate = path[:i] + path[i:j + 1][::-1] + path[j + 1:]
+                candidate_cost = cost(candidate)
+                if candidate_cost < best_cost - IMPROVEMENT_TOLERANCE:
+                    path, best_cost = candidate, candidate_cost
+                    improved = True
+    return path, best_cost
+
+
+def sequence_stops(stops, locations, route_of=None):
+    """
+    按里程排序站点。
+
+    :param stops: 站点（仓库 ID）列表，互不重复
+    :param locations: {仓库ID: {'latitude': ..., 'longitude': ...}}
+    :param route_of: 由站点顺序得到完整路线的函数，默认为站点顺序本身
+    :return: 排序后的站点列表；有站点缺少位置，或没有更短的顺序时保持原顺序
+    """
+    if route_of is None:
+        route_of = list
+    stops = list(stops)
+    if len(stops) < 2:
+        return stops
+
+    def cost(sequence):
+        return route_length(route_of(sequence), locations)
+
+    try:
+        best, best_cost = stops, cost(stops)
+    except (KeyError, TypeError):
+        return stops  # 路线中有仓库缺少位置
+    for start in stops:
+        path, path_cost = _two_opt(_nearest_neighbour(start, stops, locations), cost)
+        if path_cost < best_cost - IMPROVEMENT_TOLERANCE:
+            best, best_cost = path, path_cost
+    return best
@@ -0,0 +1,62 @@
+"""
+调度文件的进程安全存取。
+
+多进程部署时多个 worker 共享同一份调度文件，读-改-写需要在文件锁内完成，
+写入使用“临时文件 + 重命名”保证其他进程读到的始终是完整文件。
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台只能保证进程内互斥
+    fcntl = None
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(filename):
+    path = os.path.abspath(filename)
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(path, threading.RLock())
+
+
+@contextmanager
+def schedule_lock(filename):
+    """对调度文件加排他锁（进程内线程锁 + 跨进程文件锁）"""
+    with _thread_lock(filename):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{filename}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def schedule_version(filename):
+    """调度文件的版本标识（inode、修改时间、大小），文件不存在时为 None；每次写入都替换文件，版本随之变化"""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def atomic_write_csv(df, filename):
+    """先写入同目录下的临时文件，再原子地替换目标文件"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(filename)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            df.to_csv(f, index=False)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,470 @@
+"""
+堆场离散事件仿真，用于容量规划（如“订单量 1.5 倍时站点需要多少月台/车辆”），不读写生产调度文件。
+
+订单按到达时间进入仿真，每隔 batch_minutes 分钟将已到达的订单作为一批交给调度：
+- pipeline：与外部订单接口相同的两阶段规划（月台分配 + 排队规划，按 NP_QUEUE_DECOMPOSITION 分解）；
+- full：两阶段规划，排队模型不分解，整体交给求解器；
+- greedy：按路线依次为每个仓库选择最早完成的兼容月台，不调用求解器，适合大规模扫描。
+
+执行阶段由事件堆驱动：车辆在仓库之间按球面距离与车速行驶，到达后在月台队列中按计划开始时间排队，
+作业时长为驶入驶离固定耗时加装卸量 / 月台效率（可按 service_cv 加入随机波动）。
+统计月台利用率、排队长度、订单周转时间与完工时间（makespan），多次重复的 makespan 给出百分位数。
+
+场景文件为 JSON，格式与外部订单请求相同，订单可带 arrival（到达时间，分钟），另可指定 vehicles、speed_kmh 等：
+
+    python simulator.py scenario.json --scale 1 1.5 --extra-docks 0 1 2 --vehicles 10 20 --replications 50
+    python simulator.py --logs 'application.log*' --mode pipeline --replications 5
+
+--scale / --extra-docks / --vehicles 给出多个取值时按笛卡尔积扫描，全部场景与重复次数在多进程中并行运行。
+"""
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from common import Warehouse, parse_optimization_result
+from decoding import PayloadValidationError, build_dock, build_order, build_warehouse, decode_external_request
+from lp import FIXED_COST, create_lp_model, generate_specific_order_route
+from precedence import iter_queue_schedule
+from replay_logs import extract_requests, log_files, percentile
+from solve_recorder import solve_model
+from utils import haversine_distance
+import config
+
+MODES = ('pipeline', 'full', 'greedy')
+# 订单类型 1（装车）使用类型 2、3 的月台和出库效率，订单类型 2（卸车）使用类型 1、3 的月台和入库效率
+PHASE_DOCK_TYPES = {1: (2, 3), 2: (1, 3)}
+
+
+def dock_efficiency(dock, order_type):
+    return dock.outbound_efficiency if order_type == 1 else dock.inbound_efficiency
+
+
+def service_minutes(load, efficiency):
+    """月台作业时长，与排队模型一致"""
+    return FIXED_COST + load / (efficiency + 0.0000001)
+
+
+def dock_compatible(dock, order):
+    return dock.dock_type in PHASE_DOCK_TYPES.get(order.order_type, ()) and (
+            not order.required_carriage or order.required_carriage in (dock.compatible_carriage or []))
+
+
+# SECTION 场景
+
+
+def load_scenario(path):
+    with open(path, encoding='utf-8') as f:
+        scenario = json.load(f)
+    decode_external_request(scenario)  # 校验失败抛出 PayloadValidationError
+    return scenario
+
+
+def scenario_from_logs(pattern):
+    """由日志中的外部订单请求构建场景：仓库取最后一次请求中的仓库，订单的到达时间为请求时间相对第一次请求的分钟数"""
+    requests = extract_requests(log_files(pattern), ['external'])
+    if not requests:
+        raise ValueError("日志中没有外部订单请求")
+    first_timestamp = requests[0][0]
+    warehouses, orders = {}, []
+    for timestamp, _, body, _ in requests:
+        data = json.loads(body)
+        try:
+            decode_external_request(data)
+        except PayloadValidationError:
+            continue
+        warehouses.update((w['warehouse_id'], w) for w in data['warehouses'])
+        orders.extend(dict(o, arrival=(timestamp - first_timestamp) / 60) for o in data['orders'])
+    return {"warehouses": list(warehouses.values()), "orders": orders}
+
+
+def build_variant(scenario, scale, extra_docks, rng):
+    """
+    构建一次仿真的仓库与订单。
+
+    :param scale: 订单量倍数，整数部分复制全部订单，小数部分按概率抽样复制，复制的订单到达时间在原时间附近随机扰动
+    :param extra_docks: 每个仓库增加的月台数，依次复制仓库已有的月台
+    :return: (warehouses, orders, arrivals)，订单重新编号为 1..N
+    """
+    warehouses = [build_warehouse(w) for w in scenario['warehouses']]
+    for warehouse in warehouses:
+        template_docks = list(warehouse.docks)
+        numeric_ids = all(isinstance(dock.id, int) for dock in template_docks)
+        next_id = max((dock.id for dock in template_docks), default=0) + 1 if numeric_ids else None
+        for k in range(extra_docks if template_docks else 0):
+            template = template_docks[k % len(template_docks)]
+            warehouse.docks.append(build_dock({
+                'dock_id': next_id + k if numeric_ids else f"{template.id}_extra{k}",
+                'outbound_efficiency': template.outbound_efficiency, 'inbound_efficiency': template.inbound_efficiency,
+                'weight': template.weight, 'dock_type': template.dock_type,
+                'compatible_carriage': template.compatible_carriage}))
+
+    raw_orders = scenario['orders']
+    horizon = max((o.get('arrival', 0) for o in raw_orders), default=0)
+    jitter = horizon / max(len(raw_orders), 1)
+    copies = []
+    for o in raw_orders:
+        count = int(scale) + (rng.random() < scale - int(scale))
+        for k in range(count):
+            arrival = o.get('arrival', 0)
+            if k > 0:
+                arrival = max(arrival + rng.uniform(-jitter, jitter), 0)
+            copies.append((arrival, o))
+    copies.sort(key=lambda c: c[0])
+    orders, arrivals = [], {}
+    for order_id, (arrival, o) in enumerate(copies, start=1):
+        order = build_order(dict(o, order_id=order_id))
+        orders.append(order)
+        arrivals[order_id] = arrival
+    return warehouses, orders, arrivals
+
+
+# SECTION 仿真
+
+
+class YardSimulation:
+    def __init__(self, warehouses, orders, arrivals, vehicles=None, speed_kmh=20, mode='greedy', batch_minutes=15,
+                 service_cv=0, rng=None):
+        self.warehouses = warehouses
+        self.warehouses_dict = {w.id: w for w in warehouses}
+        self.docks = {(w.id, d.id): d for w in warehouses for d in w.docks}
+        self.orders = {order.id: order for order in orders}
+        self.arrivals = arrivals
+        self.vehicles = vehicles
+        self.speed_kmh = speed_kmh
+        self.mode = mode
+        self.batch_minutes = batch_minutes
+        self.service_cv = service_cv
+        self.rng = rng or random.Random()
+
+        self._events = []
+        self._seq = itertools.count()
+        self.now = 0.0
+        self.pending = []  # 已到达、等待下一次调度的订单
+        self.planned = {dock_key: [] for dock_key in self.docks}  # 月台计划占用 [(开始, 结束)]
+        self.planned_available = {dock_key: 0.0 for dock_key in self.docks}
+        self.stops = {}  # 订单ID -> [(计划开始, 仓库ID, 月台ID)]
+        self.waiting_orders = deque()  # 已调度、等待车辆的订单
+        self.free_vehicles = [None] * vehicles if vehicles else None  # 空闲车辆所在仓库，None 表示在场外
+
+        self.dock_queue = {dock_key: [] for dock_key in self.docks}  # 堆：(计划开始, 序号, 订单ID, 站点序号)
+        self.dock_busy = {dock_key: False for dock_key in self.docks}
+        self.busy_time = {dock_key: 0.0 for dock_key in self.docks}
+        self.queue_area = {dock_key: 0.0 for dock_key in self.docks}
+        self.queue_max = {dock_key: 0 for dock_key in self.docks}
+        self.queue_changed_at = {dock_key: 0.0 for dock_key in self.docks}
+        self.vehicle_wait = {}
+        self.completed_at = {}
+
+    def schedule(self, time, handler, *args):
+        heapq.heappush(self._events, (time, next(self._seq), handler, args))
+
+    def run(self):
+        for order_id, arrival in self.arrivals.items():
+            self.schedule(arrival, self.on_arrival, order_id)
+        if self.arrivals:
+            self.schedule(min(self.arrivals.values()), self.on_plan)
+        while self._events:
+            self.now, _, handler, args = heapq.heappop(self._events)
+            handler(*args)
+        return self.statistics()
+
+    # 调度
+
+    def on_arrival(self, order_id):
+        self.pending.append(self.orders[order_id])
+
+    def on_plan(self):
+        if self.pending:
+            batch, self.pending = self.pending, []
+            if self.mode == 'greedy':
+                self.plan_greedy(batch)
+            else:
+                self.plan_pipeline(batch)
+            for order in batch:
+                self.stops.setdefault(order.id, []).sort(key=lambda stop: stop[0])
+                self.vehicle_wait[order.id] = self.now
+                self.waiting_orders.append(order.id)
+            self.dispatch_vehicles()
+        if len(self.stops) < len(self.orders):
+            self.schedule(self.now + self.batch_minutes, self.on_plan)
+
+    def reserve(self, order, warehouse_id, dock_id, start, end):
+        self.stops.setdefault(order.id, []).append((start, warehouse_id, dock_id))
+        self.planned[warehouse_id, dock_id].append((start, end))
+        self.planned_available[warehouse_id, dock_id] = max(self.planned_available[warehouse_id, dock_id], end)
+
+    def plan_greedy(self, orders):
+        for order in sorted(orders, key=lambda o: -(o.priority or 0)):
+            loads = order.warehouse_loads
+            if order.sequential:
+                loads = sorted(loads, key=lambda load: (load.sequence is not None, load.sequence))
+            ready = self.now
+            for load in loads:
+                warehouse = self.warehouses_dict[load.warehouse_id]
+                candidates = [dock for dock in warehouse.docks if dock_compatible(dock, order)]
+                if not candidates:
+                    continue
+                best = min(candidates, key=lambda dock: (
+                    max(self.planned_available[warehouse.id, dock.id], ready) +
+                    service_minutes(load.quantity, dock_efficiency(dock, order.order_type))))
+                start = max(self.planned_available[warehouse.id, best.id], ready)
+                end = start + service_minutes(load.quantity, dock_efficiency(best, order.order_type))
+                self.reserve(order, warehouse.id, best.id, start, end)
+                ready = end
+
+    def plan_pipeline(self, orders):
+        """与外部订单接口相同的两阶段规划，模型时间 0 对应当前仿真时间"""
+        unplanned = []
+        for order_type, dock_types in PHASE_DOCK_TYPES.items():
+            phase_orders = [order for order in orders if order.order_type == order_type]
+            if not phase_orders:
+                continue
+            phase_warehouses = []
+            for warehouse in self.warehouses:
+                docks = [dock for dock in warehouse.docks if dock.dock_type in dock_types]
+                for dock in docks:
+                    dock.set_efficiency(2 if order_type == 1 else 1)
+                if docks:
+                    phase_warehouses.append(Warehouse(warehouse.id, docks, warehouse.location))
+
+            busy_windows, busy_time = {}, {}
+            for dock_key, windows in self.planned.items():
+                future = [(max(start - self.now, 0), end - self.now) for start, end in windows if end > self.now]
+                if future:
+                    busy_windows[dock_key] = future
+                    busy_time[dock_key] = sum(end - start for start, end in future)
+
+            model = create_lp_model(phase_orders, phase_warehouses, busy_time)
+            solve_model(model, "simulation_lp", busy_time=busy_time)
+            assignments, _ = parse_optimization_result(model, phase_orders, phase_warehouses)
+            routes = generate_specific_order_route(phase_orders)
+            assigned = [order for order in phase_orders if order.id in assignments]
+            unplanned.extend(order for order in phase_orders if order.id not in assignments)
+            for start_times, end_times, status in iter_queue_schedule(
+                    assigned, phase_warehouses, assignments, routes, busy_windows, "simulation_queue"):
+                for (order_id, warehouse_id, dock_id), start in start_times.items():
+                    if start is not None and end_times.get((order_id, warehouse_id, dock_id)) is not None:
+                        self.reserve(self.orders[order_id], warehouse_id, dock_id, start + self.now,
+                                     end_times[order_id, warehouse_id, dock_id] + self.now)
+            unplanned.extend(order for order in assigned if order.id not in self.stops)
+        if unplanned:
+            self.plan_greedy(unplanned)  # 模型无解的订单退化为贪心分配
+
+    # 执行
+
+    def travel_minutes(self, from_warehouse_id, to_warehouse_id):
+        if from_warehouse_id is None or from_warehouse_id == to_warehouse_id:
+            return 0.0
+        a = self.warehouses_dict[from_warehouse_id].location
+        b = self.warehouses_dict[to_warehouse_id].location
+        if not a or not b:
+            return 0.0
+        return haversine_distance(a['latitude'], a['longitude'], b['latitude'], b['longitude']) / self.speed_kmh * 60
+
+    def dispatch_vehicles(self):
+        while self.waiting_orders and (self.free_vehicles is None or self.free_vehicles):
+            order_id = self.waiting_orders.popleft()
+            self.vehicle_wait[order_id] = self.now - self.vehicle_wait[order_id]
+            stops = self.stops[order_id]
+            if not stops:
+                self.completed_at[order_id] = self.now
+                continue
+            location = None
+            if self.free_vehicles is not None:
+                # 选择离第一个站点最近的空闲车辆
+                index = min(range(len(self.free_vehicles)),
+                            key=lambda i: self.travel_minutes(self.free_vehicles[i], stops[0][1]))
+                location = self.free_vehicles.pop(index)
+            self.schedule(self.now + self.travel_minutes(location, stops[0][1]), self.on_reach, order_id, 0)
+
+    def update_queue_stats(self, dock_key):
+        queue_length = len(self.dock_queue[dock_key])
+        self.queue_area[dock_key] += queue_length * (self.now - self.queue_changed_at[dock_key])
+        self.queue_changed_at[dock_key] = self.now
+
+    def on_reach(self, order_id, stop_index):
+        planned_start, warehouse_id, dock_id = self.stops[order_id][stop_index]
+        dock_key = (warehouse_id, dock_id)
+        self.update_queue_stats(dock_key)
+        heapq.heappush(self.dock_queue[dock_key], (planned_start, next(self._seq), order_id, stop_index))
+        self.queue_max[dock_key] = max(self.queue_max[dock_key], len(self.dock_queue[dock_key]))
+        if not self.dock_busy[dock_key]:
+            self.start_service(dock_key)
+
+    def start_service(self, dock_key):
+        self.update_queue_stats(dock_key)
+        _, _, order_id, stop_index = heapq.heappop(self.dock_queue[dock_key])
+        order = self.orders[order_id]
+        load = sum(wl.quantity for wl in order.warehouse_loads if wl.warehouse_id == dock_key[0])
+        duration = service_minutes(load, dock_efficiency(self.docks[dock_key], order.order_type))
+        if self.service_cv > 0:
+            sigma = math.sqrt(math.log(1 + self.service_cv ** 2))
+            duration *= self.rng.lognormvariate(-sigma ** 2 / 2, sigma)
+        self.dock_busy[dock_key] = True
+        self.busy_time[dock_key] += duration
+        self.schedule(self.now + duration, self.on_service_end, dock_key, order_id, stop_index)
+
+    def on_service_end(self, dock_key, order_id, stop_index):
+        self.dock_busy[dock_key] = False
+        if self.dock_queue[dock_key]:
+            self.start_service(dock_key)
+
+        stops = self.stops[order_id]
+        if stop_index + 1 < len(stops):
+            next_warehouse_id = stops[stop_index + 1][1]
+            self.schedule(self.now + self.travel_minutes(dock_key[0], next_warehouse_id), self.on_reach, order_id,
+                          stop_index + 1)
+            return
+        self.completed_at[order_id] = self.now
+        if self.free_vehicles is not None:
+            self.free_vehicles.append(dock_key[0])
+        self.dispatch_vehicles()
+
+    def statistics(self):
+        first_arrival = min(self.arrivals.values(), default=0)
+        makespan = max(self.completed_at.values(), default=first_arrival) - first_arrival
+        cycle_times = sorted(self.completed_at[o] - self.arrivals[o] for o in self.completed_at)
+        vehicle_waits = sorted(self.vehicle_wait.values())
+        utilization = {f"{w}-{d}": self.busy_time[w, d] / makespan if makespan else 0 for w, d in self.docks}
+        queue_avg = {f"{w}-{d}": self.queue_area[w, d] / makespan if makespan else 0 for w, d in self.docks}
+        return {
+            "orders": len(self.orders),
+            "completed": len(self.completed_at),
+            "makespan": makespan,
+            "cycle_time_p50": percentile(cycle_times, 50),
+            "cycle_time_p95": percentile(cycle_times, 95),
+            "vehicle_wait_p95": percentile(vehicle_waits, 95),
+            "dock_utilization": utilization,
+            "dock_utilization_mean": sum(utilization.values()) / len(utilization) if utilization else 0,
+            "dock_utilization_max": max(utilization.values(), default=0),
+            "queue_length_avg": queue_avg,
+            "queue_length_mean": sum(queue_avg.values()) / len(queue_avg) if queue_avg else 0,
+            "queue_length_max": max(self.queue_max.values(), default=0),
+        }
+
+
+# SECTION 扫描
+
+_scenario = None
+
+
+def _init_worker(scenario):
+    global _scenario
+    _scenario = scenario
+
+
+def run_replication(variant, seed):
+    """运行一次仿真。variant 为 {"scale", "extra_docks", "vehicles", "mode", ...}"""
+    if variant['mode'] == 'full':
+        config.QUEUE_DECOMPOSITION = False
+    elif variant['mode'] == 'pipeline':
+        config.QUEUE_DECOMPOSITION = True
+    rng = random.Random(seed)
+    warehouses, orders, arrivals = build_variant(_scenario, variant['scale'], variant['extra_docks'], rng)
+    simulation = YardSimulation(warehouses, orders, arrivals, variant['vehicles'], variant['speed_kmh'],
+                                variant['mode'], variant['batch_minutes'], variant['service_cv'], rng)
+    return simulation.run()
+
+
+def summarize(runs):
+    """汇总同一场景多次重复的结果"""
+    makespans = sorted(run["makespan"] for run in runs)
+    cycle_p95 = sorted(run["cycle_time_p95"] for run in runs if run["cycle_time_p95"] is not None)
+    return {
+        "replications": len(runs),
+        "makespan_p50": percentile(makespans, 50),
+        "makespan_p90": percentile(makespans, 90),
+        "makespan_p95": percentile(makespans, 95),
+        "cycle_time_p95": percentile(cycle_p95, 50),
+        "dock_utilization_mean": sum(run["dock_utilization_mean"] for run in runs) / len(runs),
+        "dock_utilization_max": max(run["dock_utilization_max"] for run in runs),
+        "queue_length_mean": sum(run["queue_length_mean"] for run in runs) / len(runs),
+        "queue_length_max": max(run["queue_length_max"] for run in runs),
+    }
+
+
+def sweep(scenario, variants, replications=10, processes=None, seed=0):
+    """
+    并行运行各场景的多次重复。
+
+    :return: [(variant, 汇总结果), ...]，顺序与 variants 一致
+    """
+    tasks = [(i, variant, seed + r) for i, variant in enumerate(variants) for r in range(replications)]
+    results = [[] for _ in variants]
+    if processes == 1:
+        _init_worker(scenario)
+        for i, variant, task_seed in tasks:
+            results[i].append(run_replication(variant, task_seed))
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(scenario,)) as executor:
+            chunksize = max(len(tasks) // ((processes or 8) * 4), 1)
+            for (i, _, _), run in zip(tasks, executor.map(run_replication, [t[1] for t in tasks],
+                                                          [t[2] for t in tasks], chunksize=chunksize)):
+                results[i].append(run)
+    return [(variant, summarize(runs)) for variant, runs in zip(variants, results)]
+
+
+def print_sweep(results):
+    print(f"{'倍数':>6}{'加月台':>8}{'车辆':>6}{'p50完工':>10}{'p95完工':>10}{'p95周转':>10}{'平均利用率':>12}"
+          f"{'平均排队':>10}{'最大排队':>10}")
+    for variant, summary in results:
+        print(f"{variant['scale']:>6}{variant['extra_docks']:>8}{str(variant['vehicles'] or '-'):>6}"
+              f"{summary['makespan_p50']:>10.1f}{summary['makespan_p95']:>10.1f}"
+              f"{summary['cycle_time_p95'] or 0:>10.1f}{summary['dock_utilization_mean']:>12.2%}"
+              f"{summary['queue_length_mean']:>10.2f}{summary['queue_length_max']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="堆场离散事件仿真与容量规划扫描")
+    parser.add_argument('scenario', nargs='?', help="场景 JSON 文件（外部订单请求格式，订单可带 arrival）")
+    parser.add_argument('--logs', help="从日志中的外部订单请求构建场景，日志文件通配符")
+    parser.add_argument('--mode', choices=MODES, default='greedy')
+    parser.add_argument('--scale', type=float, nargs='+', default=[1.0], help="订单量倍数")
+    parser.add_argument('--extra-docks', type=int, nargs='+', default=[0], help="每个仓库增加的月台数")
+    parser.add_argument('--vehicles', type=int, nargs='+', default=None, help="车辆数，不指定时每个订单自带车辆")
+    parser.add_argument('--speed-kmh', type=float, default=None, help="场内车速（千米/小时）")
+    parser.add_argument('--batch-minutes', type=float, default=None, help="调度批次间隔（分钟）")
+    parser.add_argument('--service-cv', type=float, default=None, help="作业时长的变异系数")
+    parser.add_argument('--replications', type=int, default=10)
+    parser.add_argument('--processes', type=int, help="并行进程数，默认为 CPU 数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="将结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    if args.logs:
+        try:
+            scenario = scenario_from_logs(args.logs)
+        except ValueError as e:
+            print(e)
+            return 1
+    elif args.scenario:
+        scenario = load_scenario(args.scenario)
+    else:
+        parser.error("需要指定场景文件或 --logs")
+
+    def option(name, default):
+        value = getattr(args, name)
+        return value if value is not None else scenario.get(name, default)
+
+    variants = [{"scale": scale, "extra_docks": extra_docks, "vehicles": vehicles, "mode": args.mode,
+                 "speed_kmh": option('speed_kmh', 20), "batch_minutes": option('batch_minutes', 15),
+                 "service_cv": option('service_cv', 0)}
+                for scale, extra_docks, vehicles in itertools.product(
+                    args.scale, args.extra_docks, args.vehicles or [scenario.get('vehicles')])]
+    results = sweep(scenario, variants, args.replications, args.processes, args.seed)
+    print_sweep(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump([{"variant": variant, "summary": summary} for variant, summary in results], f,
+                      ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
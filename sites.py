@@ -0,0 +1,61 @@
+"""
+站点（租户）分片。
+
+各物理站点之间不共享月台，请求通过请求头 X-Site-ID（或查询参数 site_id）标明所属站点：
+- 每个站点使用独立的调度文件目录 SCHEDULE_DIR/<站点>/，互不影响；未指定站点时沿用原有的根目录调度文件；
+- router.py 按站点将请求转发到各自的分片进程组，分片映射由 NP_SITE_SHARDS 配置，未配置的站点按哈希分配。
+"""
+import os
+import re
+import zlib
+
+import config
+
+SITE_HEADER = 'X-Site-ID'
+SITE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class InvalidSiteError(ValueError):
+    pass
+
+
+def request_site_id(headers, args):
+    """从请求头或查询参数中读取站点 ID，未指定时返回 None，格式非法时抛出 InvalidSiteError"""
+    site_id = headers.get(SITE_HEADER) or args.get('site_id')
+    if site_id is None or site_id == '':
+        return None
+    if not SITE_ID_PATTERN.match(site_id):
+        raise InvalidSiteError(f"站点 ID 只能包含字母、数字、'-' 和 '_'，长度不超过 64: {site_id!r}")
+    return site_id
+
+
+def site_schedule_file(site_id, filename):
+    """站点对应的调度文件路径"""
+    if site_id is None:
+        return filename
+    directory = os.path.join(config.SCHEDULE_DIR, site_id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def parse_mapping(spec):
+    """解析 "a=0,b=1" 形式的配置"""
+    mapping = {}
+    for item in spec.split(','):
+        if item.strip():
+            key, value = item.split('=', 1)
+            mapping[key.strip()] = int(value)
+    return mapping
+
+
+def shard_for_site(site_id, site_shards=None, shard_count=None):
+    """站点所属的分片编号：优先使用显式映射，否则按站点 ID 的 CRC32 取模；未指定站点的请求进入 0 号分片"""
+    if site_shards is None:
+        site_shards = parse_mapping(config.SITE_SHARDS)
+    if shard_count is None:
+        shard_count = config.SHARDS
+    if site_id is None:
+        return 0
+    if site_id in site_shards:
+        return site_shards[site_id] % shard_count
+    return zlib.crc32(site_id.encode('utf-8')) % shard_count
@@ -0,0 +1,210 @@
+"""
+按截止时间分配求解预算。
+
+请求可带 deadline_ms（从收到请求起的毫秒数）。每个阶段（装车/卸车）求解前，由实例特征（订单数、月台数、
+月台分配模型中兼容的 0-1 变量数、月台忙碌窗口数）预测该阶段求解耗时，再按剩余时间选择求解方式：
+- exact：预测耗时（乘以安全系数）不超过本阶段预算，不设时限求解；
+- limited：预算不足以精确求解但不少于 NP_MIN_MIP_SECONDS，MIP 设时限，取时限内的最好解，未得到可行解时退化为启发式；
+  时限按阶段计算，剩余不足 NP_MIN_MIP_SECONDS 后本阶段其余排队分量不再调用求解器，直接使用启发式；
+- heuristic：预算过短，使用 heuristics.py 中不调用求解器的贪心规划。
+未带截止时间的请求始终使用 exact；准入控制判定规模超限的请求固定使用 heuristic（见 admission.py）。
+
+预测模型为 log(耗时) 对 log(1 + 特征) 的线性回归，用本服务记录的求解历史（SOLVE_HISTORY_FILE，JSON Lines）
+中最近的 exact 记录拟合；历史不足 NP_SOLVE_HISTORY_MIN_SAMPLES 条时使用按 0-1 变量数估计的先验。
+每个阶段完成后追加一条历史并记录预测误差，历史文件变化后下次预测时重新拟合。
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+from common import pulp
+import config
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ('orders', 'docks', 'binaries', 'busy_windows')
+MODES = ('exact', 'limited', 'heuristic')
+PRIOR_SECONDS = 0.05  # 先验：固定开销 + 每个 0-1 变量的耗时
+PRIOR_SECONDS_PER_BINARY = 0.002
+
+
+def phase_features(table, busy_windows):
+    """
+    由 ProblemTable 计算实例特征，无需先构建模型（选定求解方式后才决定是否构建）。
+
+    :param table: 本阶段订单与仓库的 ProblemTable
+    """
+    return {
+        "orders": len(table.orders),
+        "docks": len(table.docks),
+        "binaries": table.assignment_binaries(),
+        "busy_windows": sum(len(windows) for windows in (busy_windows or {}).values()),
+    }
+
+
+def _design_row(features):
+    return [1.0] + [math.log1p(features.get(name, 0)) for name in FEATURES]
+
+
+class SolveTimeModel:
+    """求解耗时预测模型，多个 worker 共用同一历史文件"""
+
+    def __init__(self, path, min_samples=20, window=500):
+        self.path = path
+        self.min_samples = min_samples
+        self.window = window
+        self.coefficients = None
+        self.samples = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _read_history(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        if len(lines) > 2 * self.window:
+            # 只保留最近 window 条，其他 worker 同时追加的记录可能丢失，对拟合无影响
+            lines = lines[-self.window:]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.path)
+        records = []
+        for line in lines[-self.window:]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def refresh(self):
+        """历史文件变化后重新拟合"""
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            version = None
+        with self._lock:
+            if version == self._version:
+                return
+            self._version = version
+            # 只用精确求解的记录拟合，限时求解与启发式的耗时不反映问题难度
+            records = [record for record in self._read_history()
+                       if record.get("mode") == "exact" and record.get("status") == "Optimal"]
+            self.samples = len(records)
+            if self.samples < self.min_samples:
+                self.coefficients = None
+                return
+            import numpy as np
+            x = np.array([_design_row(record) for record in records])
+            y = np.log([max(record["elapsed"], 1e-3) for record in records])
+            self.coefficients = np.linalg.lstsq(x, y, rcond=None)[0]
+
+    def predict(self, features):
+        """预测求解耗时（秒）"""
+        self.refresh()
+        coefficients = self.coefficients
+        if coefficients is None:
+            return PRIOR_SECONDS + PRIOR_SECONDS_PER_BINARY * features.get("binaries", 0)
+        return math.exp(sum(c * v for c, v in zip(coefficients, _design_row(features))))
+
+    def record(self, entry):
+        """追加一条求解历史，写入失败只写日志"""
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError as e:
+            logger.error(f"求解历史写入失败: {e}")
+
+
+class PhasePlan:
+    def __init__(self, mode, time_limit, predicted):
+        self.mode = mode
+        self.time_limit = time_limit  # 本阶段求解时限（秒），仅 limited 有值
+        self.predicted = predicted
+        self.started_at = time.perf_counter()
+
+    def remaining(self):
+        if self.time_limit is None:
+            return None
+        return max(self.time_limit - (time.perf_counter() - self.started_at), 0.0)
+
+    def exhausted(self):
+        """limited 的剩余时限已不足 NP_MIN_MIP_SECONDS，本阶段其余部分不再调用求解器，改用启发式"""
+        return self.mode == 'limited' and self.remaining() < config.MIN_MIP_SECONDS
+
+    def solver(self):
+        """按本阶段剩余时限创建求解器，exact 返回 None（使用默认求解器）；limited 调用前应先检查 exhausted"""
+        if self.mode != 'limited':
+            return None
+        return pulp.PULP_CBC_CMD(msg=False, timeLimit=self.remaining())
+
+
+class SolveBudget:
+    """一次请求的求解预算，按订单数在尚未规划的阶段间分配剩余时间"""
+
+    def __init__(self, deadline_ms, predictor, started_at=None, mode=None):
+        """
+        :param deadline_ms: 截止时间（从 started_at 起的毫秒数），None 表示不限
+        :param started_at: 收到请求的时刻（time.perf_counter），默认为当前时刻
+        :param mode: 固定的求解方式，None 时按预测耗时与剩余时间选择
+        """
+        if started_at is None:
+            started_at = time.perf_counter()
+        self.deadline = None if deadline_ms is None else \
+            started_at + (deadline_ms - config.DEADLINE_RESERVE_MS) / 1000
+        self.predictor = predictor
+        self.mode = mode
+        self.remaining_orders = 0
+        self.modes = {}
+
+    def allocate(self, phases):
+        """登记待规划的阶段 [(阶段名, 订单列表, 仓库列表), ...]，剩余时间按订单数在其间分配"""
+        self.remaining_orders = sum(len(phase_orders) for _, phase_orders, _ in phases)
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.perf_counter()
+
+    def plan(self, phase, features):
+        predicted = self.predictor.predict(features)
+        remaining = self.remaining()
+        if self.mode is not None:
+            mode, time_limit = self.mode, None
+        elif remaining is None:
+            mode, time_limit = 'exact', None
+        else:
+            share = features["orders"] / self.remaining_orders if self.remaining_orders else 1
+            phase_budget = remaining * min(share, 1)
+            if predicted * config.SOLVE_TIME_SAFETY <= phase_budget:
+                mode, time_limit = 'exact', None
+            elif phase_budget >= config.MIN_MIP_SECONDS:
+                mode, time_limit = 'limited', phase_budget
+            else:
+                mode, time_limit = 'heuristic', None
+        self.remaining_orders -= features["orders"]
+        self.modes[phase] = mode
+        logger.info(f"{phase} 预测求解耗时 {predicted:.2f}s，剩余时间 "
+                    f"{'不限' if remaining is None else f'{remaining:.2f}s'}，求解方式 {mode}"
+                    f"{'' if time_limit is None else f'，时限 {time_limit:.2f}s'}")
+        return PhasePlan(mode, time_limit, predicted)
+
+    def reports_modes(self):
+        """带截止时间或固定了求解方式时，响应中返回各阶段实际采用的求解方式"""
+        return self.deadline is not None or self.mode is not None
+
+    def finish(self, phase, plan, features, elapsed, status):
+        """记录本阶段实际耗时与预测误差（没有订单的阶段不记录）"""
+        if not features["orders"]:
+            return
+        logger.info(f"{phase} 求解耗时 {elapsed:.2f}s，预测 {plan.predicted:.2f}s，"
+                    f"误差 {elapsed - plan.predicted:+.2f}s（{plan.mode}）")
+        self.predictor.record(dict(features, time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), phase=phase,
+                                   mode=plan.mode, time_limit=plan.time_limit, status=status,
+                                   elapsed=round(elapsed, 4), predicted=round(plan.predicted, 4)))
@@ -0,0 +1,191 @@
+"""
+慢求解记录与离线复现。
+
+模型依赖求解时刻调度文件中的月台占用和 datetime.now()，事后无法原样重建。solve_model 在求解耗时
+超过 NP_SLOW_SOLVE_SECONDS 时，将模型导出为 MPS，并连同占用快照、参考时间、求解器参数与结果统计
+写入 SOLVE_RECORD_DIR/<时间>_<阶段>_<进程>_<序号>/，目录数超过 NP_SOLVE_RECORD_KEEP 时删除最旧的记录。
+
+离线复现（默认沿用记录中的求解器参数，可替换为任意 PuLP 求解器）：
+
+    python solve_recorder.py list
+    python solve_recorder.py replay <记录目录> [--solver HiGHS_CMD] [--time-limit 60] [--threads 1]
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+from common import pulp
+from portfolio import race
+import config
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = 'model.mps'
+META_FILE = 'meta.json'
+_sequence = itertools.count()
+
+
+def default_solver():
+    return pulp.PULP_CBC_CMD(msg=False)
+
+
+def solver_params(solver):
+    params = {"name": solver.name}
+    for key in ('msg', 'timeLimit', 'gapRel', 'gapAbs', 'threads', 'options'):
+        value = getattr(solver, key, None)
+        if value is None and key in getattr(solver, 'optionsDict', {}):
+            value = solver.optionsDict[key]
+        if value is not None and value != []:
+            params[key] = value
+    return params
+
+
+def model_stats(model, elapsed):
+    variables = model.variables()
+    return {
+        "status": pulp.LpStatus[model.status],
+        "objective": pulp.value(model.objective),
+        "elapsed": elapsed,
+        "solution_time": getattr(model, 'solutionTime', None),
+        "variables": len(variables),
+        "integer_variables": sum(1 for v in variables if v.cat == pulp.LpInteger),
+        "constraints": len(model.constraints),
+    }
+
+
+def _dock_snapshot(busy):
+    """{(仓库ID, 月台ID): 值} 转为可序列化的列表"""
+    if not busy:
+        return []
+    snapshot = []
+    for (warehouse_id, dock_id), value in busy.items():
+        if isinstance(value, (list, tuple)):
+            value = [[float(start), float(end)] for start, end in value]
+        else:
+            value = float(value)
+        snapshot.append({"warehouse_id": warehouse_id, "dock_id": dock_id, "value": value})
+    return snapshot
+
+
+def prune_records(directory, keep):
+    """只保留最近的 keep 条记录（目录名以时间开头，按名称排序即按时间排序）"""
+    records = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    for name in records[:max(len(records) - keep, 0)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def record_solve(model, phase, solver, elapsed, reference_time, busy_windows=None, busy_time=None):
+    """将模型与求解上下文写入记录目录，返回记录路径"""
+    name = f"{reference_time.strftime('%Y%m%d-%H%M%S')}_{phase}_{os.getpid()}_{next(_sequence)}"
+    path = os.path.join(config.SOLVE_RECORD_DIR, name)
+    os.makedirs(path, exist_ok=True)
+    model.writeMPS(os.path.join(path, MODEL_FILE))
+    meta = {
+        "phase": phase,
+        "model_name": model.name,
+        "reference_time": reference_time.strftime('%Y-%m-%d %H:%M:%S.%f'),
+        "busy_windows": _dock_snapshot(busy_windows),
+        "busy_time": _dock_snapshot(busy_time),
+        "solver": solver_params(solver),
+        "result": model_stats(model, elapsed),
+    }
+    with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2, default=str)
+    prune_records(config.SOLVE_RECORD_DIR, config.SOLVE_RECORD_KEEP)
+    return path
+
+
+def solve_model(model, phase, busy_windows=None, busy_time=None, solver=None, heuristic=None):
+    """
+    求解模型，耗时超过阈值时记录该实例。记录失败只写日志，不影响求解结果。
+    配置了 NP_PORTFOLIO 时由多个求解器配置竞速求解（见 portfolio.py）。
+
+    :param phase: 阶段名称，如 loading_lp、unloading_queue
+    :param busy_windows: 排队模型使用的月台占用时间窗 {(仓库ID, 月台ID): [(开始, 结束), ...]}
+    :param busy_time: 月台分配模型使用的月台已占用总时长 {(仓库ID, 月台ID): 分钟}
+    :param heuristic: 组合求解中 heuristic 配置使用的启发式，见 portfolio.lp_heuristic / queue_heuristic
+    :return: 模型求解状态
+    """
+    solver = solver or default_solver()
+    reference_time = datetime.now()
+    started_at = time.perf_counter()
+    if config.PORTFOLIO:
+        race(model, phase, solver, heuristic)
+    else:
+        model.solve(solver=solver)
+    elapsed = time.perf_counter() - started_at
+
+    if 0 <= config.SLOW_SOLVE_SECONDS <= elapsed:
+        try:
+            path = record_solve(model, phase, solver, elapsed, reference_time, busy_windows, busy_time)
+            logger.warning(f"{phase} 求解耗时 {elapsed:.2f}s，已记录到 {path}")
+        except Exception as e:
+            logger.error(f"{phase} 慢求解记录失败: {e}")
+    return model.status
+
+
+# SECTION 离线复现
+def replay(path, solver_name=None, time_limit=None, threads=None):
+    """从记录目录读取 MPS 重新求解，返回 (记录元数据, 复现结果统计)"""
+    with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+    _, model = pulp.LpProblem.fromMPS(os.path.join(path, MODEL_FILE), sense=pulp.LpMinimize)
+
+    recorded = meta["solver"]
+    name = solver_name or recorded["name"]
+    # 通用参数沿用记录；options 为求解器专有参数，仅在使用同一求解器时沿用
+    params = {key: recorded[key] for key in ('timeLimit', 'gapRel', 'gapAbs', 'threads') if key in recorded}
+    if name == recorded["name"] and "options" in recorded:
+        params["options"] = recorded["options"]
+    params["msg"] = False
+    if time_limit is not None:
+        params["timeLimit"] = time_limit
+    if threads is not None:
+        params["threads"] = threads
+
+    started_at = time.perf_counter()
+    model.solve(solver=pulp.getSolver(name, **params))
+    return meta, dict(model_stats(model, time.perf_counter() - started_at), solver=name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="慢求解记录查看与离线复现")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="列出记录")
+    replay_parser = subparsers.add_parser('replay', help="重新求解记录的实例")
+    replay_parser.add_argument('record', help="记录目录，或 SOLVE_RECORD_DIR 下的记录名")
+    replay_parser.add_argument('--solver', help="PuLP 求解器名称，如 PULP_CBC_CMD、HiGHS_CMD，默认沿用记录")
+    replay_parser.add_argument('--time-limit', type=float)
+    replay_parser.add_argument('--threads', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        if not os.path.isdir(config.SOLVE_RECORD_DIR):
+            return 0
+        for name in sorted(os.listdir(config.SOLVE_RECORD_DIR)):
+            try:
+                with open(os.path.join(config.SOLVE_RECORD_DIR, name, META_FILE), encoding='utf-8') as f:
+                    result = json.load(f)["result"]
+            except (OSError, ValueError, KeyError):
+                continue
+            print(f"{name}\t{result['status']}\t{result['objective']}\t{result['elapsed']:.2f}s")
+        return 0
+
+    path = args.record if os.path.isdir(args.record) else os.path.join(config.SOLVE_RECORD_DIR, args.record)
+    meta, result = replay(path, args.solver, args.time_limit, args.threads)
+    recorded = meta["result"]
+    print(f"记录: {meta['phase']} @ {meta['reference_time']}, 求解器 {meta['solver']['name']}")
+    print(f"  原始: {recorded['status']}, 目标值 {recorded['objective']}, 耗时 {recorded['elapsed']:.2f}s")
+    print(f"  复现: {result['status']}, 目标值 {result['objective']}, 耗时 {result['elapsed']:.2f}s "
+          f"({result['solver']})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+站点布局（仓库与月台）登记。
+
+站点把仓库、月台定义上传一次，得到递增的版本号，之后的请求用 {"topology_id": ..., "version": ...} 引用，
+不再每次携带完整的 warehouses。已登记的版本不可修改，文件位于 TOPOLOGY_DIR/default/<布局>/<版本>.json
+（指定站点时为 TOPOLOGY_DIR/sites/<站点>/<布局>/），多个 worker 共用；版本号通过独占创建文件分配。
+
+每个版本首次使用时编译为 Topology 并缓存在进程内：
+- warehouses：按内部订单/甩挂调度的规则设置好月台效率（与 set_dock_efficiency 一致）；
+- phases：外部订单装车、卸车阶段各自的仓库列表（月台为独立副本，效率分别取出库、入库效率）；
+- 以上仓库列表均为 WarehouseList，月台数组、效率数组与车型兼容位图在编译时一并构建，供 ProblemTable 复用。
+编译结果在请求间共享，使用方不应修改其中的仓库与月台。
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from common import Dock, Warehouse
+from decoding import PayloadValidationError, build_warehouse
+from problem_table import WarehouseList
+
+TOPOLOGY_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class InvalidTopologyError(ValueError):
+    pass
+
+
+class TopologyNotFoundError(LookupError):
+    pass
+
+
+class TopologyWarehouses(WarehouseList):
+    """
+    已登记布局的仓库列表，月台效率已按内部订单规则设置，phases 为外部订单各阶段的仓库列表，
+    reference 为实际使用的布局版本 {"topology_id": ..., "version": ...}
+    """
+    precomputed = True
+
+    def __init__(self, warehouses, phases, reference):
+        super().__init__(warehouses)
+        self.phases = phases
+        self.reference = reference
+
+
+def _copy_dock(dock):
+    return Dock(dock.id, dock.outbound_efficiency, dock.inbound_efficiency, dock.weight, dock.dock_type,
+                dock.compatible_carriage)
+
+
+def external_phase_warehouses(warehouses):
+    """
+    外部订单各阶段的仓库列表：装车使用类型 2、3 的月台（效率取出库效率），卸车使用类型 1、3 的月台（效率取入库效率）。
+    月台为副本，两个阶段共用的通用月台各自保留本阶段的效率，原仓库列表不被修改。
+
+    :return: {"loading": WarehouseList, "unloading": WarehouseList}
+    """
+    phases = {}
+    for phase, dock_types, order_type in (("loading", (2, 3), 2), ("unloading", (1, 3), 1)):
+        phase_warehouses = WarehouseList()
+        for warehouse in warehouses:
+            docks = [_copy_dock(dock) for dock in warehouse.docks if dock.dock_type in dock_types]
+            for dock in docks:
+                dock.set_efficiency(order_type)
+            if docks:
+                phase_warehouses.append(Warehouse(warehouse.id, docks))
+        phases[phase] = phase_warehouses
+    return phases
+
+
+class Topology:
+    def __init__(self, topology_id, version, warehouses_data):
+        self.id = topology_id
+        self.version = version
+        self.data = warehouses_data
+        warehouses = [build_warehouse(w) for w in warehouses_data]
+        for warehouse in warehouses:
+            for dock in warehouse.docks:
+                # 与 set_dock_efficiency 一致：类型 2 的月台取入库效率，类型 1、3 取出库效率
+                dock.set_efficiency(1 if dock.dock_type == 2 else 2)
+        self.warehouses = TopologyWarehouses(warehouses, external_phase_warehouses(warehouses), self.reference())
+        self.by_id = {warehouse.id: warehouse for warehouse in warehouses}
+        # 预先构建月台视图，请求中不再重复计算
+        for warehouse_list in (self.warehouses, *self.warehouses.phases.values()):
+            warehouse_list.dock_view
+
+    def reference(self):
+        return {"topology_id": self.id, "version": self.version}
+
+
+def _canonical(warehouses_data):
+    return json.dumps(warehouses_data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+class TopologyRegistry:
+    def __init__(self, directory, cache_size=64):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _topology_dir(self, site_id, topology_id):
+        if not TOPOLOGY_ID_PATTERN.match(topology_id):
+            raise InvalidTopologyError(f"布局 ID 只能包含字母、数字、'-' 和 '_'，长度不超过 64: {topology_id!r}")
+        site_dir = "default" if site_id is None else os.path.join("sites", site_id)
+        return os.path.join(self.directory, site_dir, topology_id)
+
+    def versions(self, site_id, topology_id):
+        """已登记的版本号（升序）"""
+        try:
+            names = os.listdir(self._topology_dir(site_id, topology_id))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-5]) for name in names if name.endswith('.json') and name[:-5].isdigit())
+
+    def _read(self, site_id, topology_id, version):
+        path = os.path.join(self._topology_dir(site_id, topology_id), f"{version}.json")
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)["warehouses"]
+        except FileNotFoundError:
+            raise TopologyNotFoundError(f"布局 {topology_id} 不存在版本 {version}")
+
+    def register(self, site_id, topology_id, warehouses_data):
+        """
+        登记新版本，与最新版本内容相同时不新建版本。
+
+        :param warehouses_data: 已校验的仓库定义（与请求中的 warehouses 相同）
+        :return: (version, created)，ID 非法时抛出 InvalidTopologyError
+        """
+        directory = self._topology_dir(site_id, topology_id)
+        os.makedirs(directory, exist_ok=True)
+        content = _canonical(warehouses_data)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        tmp_path = os.path.join(directory, f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f'{{"sha256":"{digest}","warehouses":{content}}}')
+        try:
+            while True:
+                versions = self.versions(site_id, topology_id)
+                if versions:
+                    with open(os.path.join(directory, f"{versions[-1]}.json"), encoding='utf-8') as f:
+                        if json.load(f).get("sha256") == digest:
+                            return versions[-1], False
+                version = versions[-1] + 1 if versions else 1
+                try:
+                    # 硬链接在目标已存在时失败，并发登记的 worker 不会覆盖彼此的版本
+                    os.link(tmp_path, os.path.join(directory, f"{version}.json"))
+                    return version, True
+                except FileExistsError:
+                    continue
+        finally:
+            os.remove(tmp_path)
+
+    def get(self, site_id, topology_id, version=None):
+        """编译后的布局，version 为空时取最新版本；不存在时抛出 TopologyNotFoundError，ID 非法时抛出 InvalidTopologyError"""
+        if version is None:
+            versions = self.versions(site_id, topology_id)
+            if not versions:
+                raise TopologyNotFoundError(f"布局 {topology_id} 未登记")
+            version = versions[-1]
+        key = (site_id, topology_id, version)
+        with self._lock:
+            topology = self._cache.get(key)
+            if topology is not None:
+                self._cache.move_to_end(key)
+                return topology
+        # 版本不可修改，并发编译同一版本的结果相同，不必加锁等待
+        topology = Topology(topology_id, version, self._read(site_id, topology_id, version))
+        with self._lock:
+            self._cache[key] = topology
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return topology
+
+    def resolver(self, site_id):
+        """请求解码时使用的布局解析函数 resolve(reference, path)，引用不存在时抛出 PayloadValidationError"""
+        def resolve(reference, path):
+            try:
+                return self.get(site_id, reference['topology_id'], reference.get('version'))
+            except (InvalidTopologyError, TopologyNotFoundError) as e:
+                raise PayloadValidationError([{"path": path, "message": str(e)}])
+        return resolve
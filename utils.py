@@ -1,8 +1,11 @@
-from common import Warehouse, Dock, Order, Carriage, WarehouseLoad, generate_schedule
-import pandas as pd
+from common import Warehouse, Dock, Order, Carriage, WarehouseLoad, generate_schedule, pd
 import math
 from datetime import datetime, timedelta
 import copy
+from assignment import linear_sum_assignment
+from decoding import build_warehouse
+
+BATCH_MATCHING_MAX_SIZE = 300  # 批量匹配的最大规模，超过时退回逐个贪心匹配
 
 
 def parse_schedule(schedule):
@@ -106,89 +109,177 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return distance
 
 
-def find_closest_vehicle(carriage_location, vehicles):
-    """根据车辆的位置和工作负载找到最合适的车辆"""
-    # 过滤出状态为空闲的车辆
-    available_vehicles = [v for v in vehicles if v.state == 0]
+def calculate_vehicle_score(vehicle, carriage_location, average_workload):
+    """计算车辆前往车厢位置的得分：距离 + 工作量因子，得分越低越优"""
+    distance = haversine_distance(vehicle.location['latitude'], vehicle.location['longitude'],
+                                  carriage_location['latitude'], carriage_location['longitude'])
+    # 防止除以零的错误
+    if average_workload == 0:
+        workload_factor = 1  # 如果平均工作量为0，设置默认工作量因子为1
+    else:
+        workload_factor = 1 + (vehicle.workload - average_workload) / average_workload
 
-    if not available_vehicles:
-        return None
+    # 额外检查，确保工作量因子是合理的
+    workload_factor = max(workload_factor, 0)
+    return distance + workload_factor
 
-    def calculate_average_workload(vehicles):
-        if not vehicles:
-            return 0  # 如果列表为空，返回 0
 
-        total_workload = sum(vehicle.workload for vehicle in vehicles)
-        return total_workload / len(vehicles)
+def carriage_distance(carriage, location):
+    return haversine_distance(carriage.location['latitude'], carriage.location['longitude'],
+                              location['latitude'], location['longitude'])
 
-    average_workload = calculate_average_workload(vehicles)
 
-    # 计算每辆车的得分
-    def calculate_vehicle_score(vehicle, carriage_location, average_workload):
-        distance = haversine_distance(vehicle.location['latitude'], vehicle.location['longitude'],
-                                      carriage_location['latitude'], carriage_location['longitude'])
-        # 防止除以零的错误
-        if average_workload == 0:
-            workload_factor = 1  # 如果平均工作量为0，设置默认工作量因子为1
-        else:
-            workload_factor = 1 + (vehicle.workload - average_workload) / average_workload
+def find_closest_vehicle(carriage_location, fleet):
+    """根据车辆的位置和工作负载找到最合适的车辆"""
+    # 空闲车辆
+    available_vehicles = fleet.idle_vehicles()
 
-        # 额外检查，确保工作量因子是合理的
-        workload_factor = max(workload_factor, 0)
-        return distance + workload_factor
+    if not available_vehicles:
+        return None
+
+    average_workload = fleet.average_workload()
 
     # 选择工作负载和距离的综合最优车辆
     return min(available_vehicles, key=lambda v: calculate_vehicle_score(v, carriage_location, average_workload))
 
 
-def assign_carriages_to_orders(parsed_internal_result, carriages, warehouses, vehicles, orders):
+def find_closest_carriage(location, required_carriage, fleet):
+    """找到距离目标位置最近、车型符合的空闲车厢"""
+    return min(fleet.idle_carriages(required_carriage), key=lambda c: carriage_distance(c, location), default=None)
+
+
+def match_vehicles_to_locations(carriage_locations, fleet, batch_matching=True):
+    """
+    为一批车厢位置匹配车辆，并将匹配到的车辆在车队池中标记为占用。
+
+    batch_matching 为 True 时，以 calculate_vehicle_score 构建代价矩阵，求解矩形指派问题使总得分最小；
+    规模超过 BATCH_MATCHING_MAX_SIZE 或 batch_matching 为 False 时，按请求顺序逐个贪心匹配。
+
+    :param carriage_locations: 车厢位置列表，每项为包含 latitude/longitude 的字典。
+    :param fleet: FleetPool 车队池。
+    :param batch_matching: 是否使用批量全局最优匹配。
+    :return: 与 carriage_locations 等长的列表，每项为匹配到的车辆或 None。
+    """
+    available_vehicles = fleet.idle_vehicles()
+    too_large = max(len(carriage_locations), len(available_vehicles)) > BATCH_MATCHING_MAX_SIZE
+
+    if not batch_matching or too_large:
+        matched = []
+        for location in carriage_locations:
+            vehicle = find_closest_vehicle(location, fleet)
+            if vehicle:
+                fleet.claim_vehicle(vehicle)
+            matched.append(vehicle)
+        return matched
+
+    matched = [None] * len(carriage_locations)
+    if not carriage_locations or not available_vehicles:
+        return matched
+
+    average_workload = fleet.average_workload()
+    cost = [[calculate_vehicle_score(v, location, average_workload) for v in available_vehicles]
+            for location in carriage_locations]
+    for row, col in zip(*linear_sum_assignment(cost)):
+        vehicle = available_vehicles[col]
+        fleet.claim_vehicle(vehicle)
+        matched[row] = vehicle
+    return matched
+
+
+def match_carriages_to_locations(requests, fleet, batch_matching=True):
+    """
+    为一批 (目标位置, 需求车型) 匹配空闲车厢，并将匹配到的车厢在车队池中标记为占用。
+
+    :param requests: 列表，每项为 (warehouse_location, required_carriage)。
+    :param fleet: FleetPool 车队池。
+    :param batch_matching: 是否使用批量全局最优匹配（总距离最小）。
+    :return: 与 requests 等长的列表，每项为匹配到的车厢或 None。
+    """
+    if not batch_matching or len(requests) > BATCH_MATCHING_MAX_SIZE:
+        matched = []
+        for location, required_carriage in requests:
+            carriage = find_closest_carriage(location, required_carriage, fleet)
+            if carriage:
+                fleet.claim_carriage(carriage)
+            matched.append(carriage)
+        return matched
+
+    matched = [None] * len(requests)
+    # 只有请求中出现的车型参与匹配
+    available_carriages = [c for required_carriage in dict.fromkeys(r for _, r in requests)
+                           for c in fleet.idle_carriages(required_carriage)]
+    if not requests or not available_carriages:
+        return matched
+    if len(available_carriages) > BATCH_MATCHING_MAX_SIZE:
+        return match_carriages_to_locations(requests, fleet, batch_matching=False)
+
+    # 车型不符的组合赋予一个大于任何可行总代价的惩罚值，求解后剔除
+    cost = [[carriage_distance(c, location) if c.type == required_carriage else None
+             for c in available_carriages] for location, required_carriage in requests]
+    finite_total = sum(x for row in cost for x in row if x is not None)
+    forbidden = finite_total + 1
+    cost = [[forbidden if x is None else x for x in row] for row in cost]
+
+    for row, col in zip(*linear_sum_assignment(cost)):
+        if cost[row][col] >= forbidden:
+            continue
+        carriage = available_carriages[col]
+        fleet.claim_carriage(carriage)
+        matched[row] = carriage
+    return matched
+
+
+def assign_carriages_to_orders(parsed_internal_result, fleet, warehouses, orders, batch_matching=True):
+    orders_dict = {order.id: order for order in orders}
+    warehouse_locations = {w.id: w.location for w in warehouses}
+
+    # 第一轮：月台上已有符合条件的车厢时直接分配；其余订单进入批量匹配
+    pending = []
     for order_info in parsed_internal_result:
         order_id = order_info["order_id"]
         assigned_dock_id = order_info["dock_id"]
-        warehouse_id = order_info["warehouse_id"]
-        warehouse_location = next((w.location for w in warehouses if w.id == warehouse_id), None)
-        orders_dict = {order.id: order for order in orders}
+        warehouse_location = warehouse_locations.get(order_info["warehouse_id"])
         order = orders_dict.get(order_id)
         if not order:
             continue  # 如果找不到订单，跳过当前循环
 
         required_carriage = order.required_carriage
         # 判断月台是否已有符合条件的车厢
-        matching_carriage = next((c for c in carriages if c.current_dock_id == assigned_dock_id
-                                  and c.type == required_carriage
-                                  and c.state == 0), None)
+        matching_carriage = fleet.find_idle_carriage_at_dock(assigned_dock_id, required_carriage)
 
         if matching_carriage:
             # 如果找到匹配的车厢，则分配该车厢并无须分配车辆
             order_info["carriage_id"] = matching_carriage.id
             # 更新车厢状态
-            matching_carriage.state = 1
+            fleet.claim_carriage(matching_carriage)
             order_info['vehicle_id'] = None
+        elif warehouse_location:
+            pending.append((order_info, warehouse_location, required_carriage))
+
+    # 第二轮：如果没有找到匹配的车厢，根据距离寻找车厢，再为车厢选择合适的车辆
+    matched_carriages = match_carriages_to_locations([(location, required) for _, location, required in pending],
+                                                     fleet, batch_matching)
+    carriage_orders = []
+    for (order_info, _, _), carriage in zip(pending, matched_carriages):
+        if carriage:
+            order_info["carriage_id"] = carriage.id
+            carriage_orders.append((order_info, carriage))
         else:
-            # 如果没有找到匹配的车厢，根据距离寻找车厢
-            if warehouse_location:
-                closest_carriage = min(
-                    (c for c in carriages if c.type == required_carriage and c.state == 0),
-                    key=lambda c: haversine_distance(c.location['latitude'], c.location['longitude'],
-                                                     warehouse_location['latitude'], warehouse_location['longitude']),
-                    default=None
-                )
-                if closest_carriage:
-                    order_info["carriage_id"] = closest_carriage.id
-                    closest_carriage.state = 1
-
-                    # 为车厢选择合适的车辆
-                    closest_vehicle = find_closest_vehicle(closest_carriage.location, vehicles)
-                    order_info["vehicle_id"] = closest_vehicle.id if closest_vehicle else None
-                    closest_vehicle.state = 1  # 更新车辆状态
-                else:
-                    order_info["carriage_id"] = None
-                    order_info["vehicle_id"] = None
+            order_info["carriage_id"] = None
+            order_info["vehicle_id"] = None
+
+    matched_vehicles = match_vehicles_to_locations([carriage.location for _, carriage in carriage_orders], fleet,
+                                                   batch_matching)
+    for (order_info, _), vehicle in zip(carriage_orders, matched_vehicles):
+        order_info["vehicle_id"] = vehicle.id if vehicle else None
 
     return parsed_internal_result
 
 
-def parse_order_carriage_info(data):
+def parse_order_carriage_info(data, topology=None):
+    """
+    :param topology: 请求引用的已登记布局，订单以 next_warehouse_id 指定仓库时从中取出（共享对象，月台效率已设置）
+    """
     # 解析 JSON 数据
     order_carriage_info = data['order_carriage_info']
 
@@ -218,8 +309,10 @@ def parse_order_carriage_info(data):
         )
 
         # 解析仓库信息
-        docks = [Dock(**dock_info) for dock_info in info['next_warehouse']['docks']]
-        warehouse = Warehouse(info['next_warehouse']['warehouse_id'], docks)
+        if 'next_warehouse_id' in info:
+            warehouse = topology.by_id[info['next_warehouse_id']]
+        else:
+            warehouse = build_warehouse(info['next_warehouse'])
 
         # 添加 perform_vehicle_matching
         perform_vehicle_matching = info.get('perform_vehicle_matching', True)
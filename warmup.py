@@ -0,0 +1,69 @@
+"""
+worker 启动预热。
+
+首个请求需要承担 pandas/PuLP 的导入、CBC 可执行文件查找以及各类首次调用开销。
+预热在后台线程中求解一个极小的 create_lp_model / create_queue_model 实例，并走一遍时间格式转换
+与调度文件读写路径；完成后 /ready 才返回就绪，滚动发布与自动扩容时流量只会进入已预热的 worker。
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from common import Warehouse, Dock, Order, pulp, pd, parse_optimization_result, parse_queue_results, \
+    save_schedule_to_file, load_and_prepare_schedule, generate_schedule, convert_to_readable_format, \
+    convert_to_model_format
+from lp import create_lp_model, create_queue_model, generate_specific_order_route
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+warm_up_state = {"started_at": None, "finished_at": None, "error": None}
+
+
+def warm_up():
+    """求解一个单订单、单月台的实例并预热调度文件读写，失败时记录错误但不阻止服务就绪"""
+    warm_up_state["started_at"] = time.time()
+    workdir = tempfile.mkdtemp(prefix='np_warmup_')
+    try:
+        dock = Dock(0, 1, 1, 1, 3, ['warmup'])
+        dock.set_efficiency(2)
+        warehouses = [Warehouse(0, [dock])]
+        orders = [Order(0, [{'warehouse_id': 0, 'load': 1}], 0, False, 'warmup', 1)]
+
+        lp_model = create_lp_model(orders, warehouses)
+        lp_model.solve(solver=pulp.PULP_CBC_CMD(msg=False))
+        assignments, _ = parse_optimization_result(lp_model, orders, warehouses)
+
+        routes = generate_specific_order_route(orders)
+        queue_model = create_queue_model(orders, warehouses, assignments, routes)
+        queue_model.solve(solver=pulp.PULP_CBC_CMD(msg=False))
+        start_times, end_times = parse_queue_results(queue_model, orders, warehouses)
+
+        # 时间格式转换与调度文件读写
+        convert_to_model_format(convert_to_readable_format(0, "queue"))
+        filename = os.path.join(workdir, 'warmup_schedule.csv')
+        save_schedule_to_file(generate_schedule(start_times, end_times, "queue"), filename)
+        load_and_prepare_schedule(filename, [], "queue")
+        pd.Timestamp.now()
+    except Exception as e:
+        warm_up_state["error"] = str(e)
+        logger.error(f"预热失败: {e}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        warm_up_state["finished_at"] = time.time()
+        _ready.set()
+
+
+def start_warm_up():
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
+def mark_ready():
+    _ready.set()
+
+
+def is_ready():
+    return _ready.is_set()
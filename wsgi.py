@@ -0,0 +1,10 @@
+"""
+WSGI 入口，多进程部署：
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+worker 数量由环境变量 NP_WORKERS 配置（默认 CPU 核数）。
+"""
+from app import app
+
+application = app